@@ -1,7 +1,11 @@
 import logging
 import os
 import tempfile
-from typing import Dict, Any, Optional
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Callable, Tuple
+
+from agents import telemetry
 
 logger = logging.getLogger(__name__)
 
@@ -10,19 +14,31 @@ class AgentManager:
     Orchestrates the workflow by routing data between agents and managing the overall process.
     """
     
-    def __init__(self, computer_vision_agent, llm_agent, motion_capture_agent, feedback_combiner, logger):
+    def __init__(self, computer_vision_agent, llm_agent, motion_capture_agent, feedback_combiner, logger,
+                 max_concurrent_stages: int = 8, video_annotator=None):
         self.computer_vision_agent = computer_vision_agent
         self.llm_agent = llm_agent
         self.motion_capture_agent = motion_capture_agent
         self.feedback_combiner = feedback_combiner
         self.logger = logger
+        
+        # Renders the annotated video after the result has been returned, when available
+        self.video_annotator = video_annotator
+        
+        # Runs independent stages (logging, scoring, visual guidance) alongside the LLM call
+        self.stage_executor = ThreadPoolExecutor(max_workers=max_concurrent_stages,
+                                                 thread_name_prefix="agent-stage")
     
+    @telemetry.traced("analysis.video")
     def process_exercise_video(
         self, 
         video_path: str, 
         exercise_type: str, 
         fitness_level: str,
-        user_id: Optional[str] = None
+        user_id: Optional[str] = None,
+        video_hash: Optional[str] = None,
+        quality: Optional[str] = None,
+        progress_callback: Optional[Callable[[str], None]] = None
     ) -> Dict[str, Any]:
         """
         Process an exercise video through the entire workflow.
@@ -32,6 +48,9 @@ class AgentManager:
             exercise_type: Type of exercise (e.g., 'squat', 'deadlift')
             fitness_level: User's fitness level (e.g., 'beginner', 'intermediate')
             user_id: Optional user ID for tracking
+            video_hash: Content hash of the video, used to reuse cached analysis of identical uploads
+            quality: Pose estimation quality tier ("fast", "balanced" or "accurate")
+            progress_callback: Optional callable notified with the name of each stage as it starts
             
         Returns:
             Dict containing the combined feedback, errors, and visual guidance
@@ -40,83 +59,289 @@ class AgentManager:
             logger.info(f"Starting analysis for {exercise_type} video, fitness level: {fitness_level}")
             
             # 1. Analyze video with Computer Vision Agent
-            errors = self.computer_vision_agent.analyze_video(
+            self._report_progress(progress_callback, "analyzing_video")
+            analysis = self.computer_vision_agent.analyze(
                 video_path=video_path,
-                exercise_type=exercise_type
-            )
-            
-            # Log the detected errors
-            self.logger.store_error_data(
-                user_id=user_id,
                 exercise_type=exercise_type,
-                errors=errors
-            )
-            
-            # 2. Generate feedback with LLM Agent
-            user_metadata = {
-                "fitness_level": fitness_level,
-                "exercise_type": exercise_type
-            }
-            
-            feedback, form_description = self.llm_agent.generate_feedback(
-                errors=errors,
-                user_metadata=user_metadata
+                video_hash=video_hash,
+                quality=quality
             )
             
-            # Log the feedback
-            self.logger.store_feedback_data(
+            # The exercise is recognized from the video when the client sent "unknown"
+            return self._complete_analysis(
+                errors=analysis["errors"],
+                exercise_type=analysis["exercise_type"],
+                fitness_level=fitness_level,
                 user_id=user_id,
-                exercise_type=exercise_type,
-                feedback=feedback,
-                form_description=form_description
-            )
-            
-            # 3. Get visual model/image from Motion Capture Agent
-            visual_guidance = self.motion_capture_agent.get_guidance(
-                form_description=form_description,
-                exercise_type=exercise_type
+                video_path=video_path,
+                details={"exercise_detection": analysis["classification"]},
+                reps=analysis["reps"],
+                load_landmarks=lambda: self.computer_vision_agent.landmarks(video_path, video_hash, quality),
+                progress_callback=progress_callback
             )
             
-            # Log the visual guidance
-            self.logger.store_visual_data(
-                user_id=user_id,
-                exercise_type=exercise_type,
-                visual_data=visual_guidance
-            )
+        except Exception as e:
+            logger.error(f"Error in analysis workflow: {str(e)}")
+            raise
+    
+    @telemetry.traced("analysis.batch")
+    def process_batch(
+        self,
+        clips: List[Dict[str, Any]],
+        fitness_level: str,
+        user_id: Optional[str] = None,
+        quality: Optional[str] = None,
+        progress_callback: Optional[Callable[..., None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Process a session of clips uploaded together.
+        
+        Pose extraction for all clips is scheduled together (see
+        ComputerVisionAgent.analyze_many), and each clip's errors and reps are
+        reported as soon as it is analyzed. Feedback for the whole session then
+        comes from one LLM request, after which every clip is scored and stored
+        like a single upload.
+        
+        Args:
+            clips: Dicts with "video_path", "exercise_type", "filename" and optionally "video_hash"
+            fitness_level: User's fitness level
+            user_id: Optional user ID for tracking
+            quality: Pose estimation quality tier
+            progress_callback: Optional callable notified with (stage, partial); `partial`
+                maps clip indexes (as strings) to the clip's latest state
             
-            # 4. Combine everything with Feedback Combiner
-            combined_output = self.feedback_combiner.combine_feedback(
-                errors=errors,
-                feedback_text=feedback,
-                visual_guidance=visual_guidance,
-                video_path=video_path
-            )
+        Returns:
+            {"session_feedback": summary or None, "clips": [per-clip state]}; each clip has
+            "status" "completed" with its "result", or "failed" with an "error"
+        """
+        logger.info(f"Starting batch analysis of {len(clips)} clips, fitness level: {fitness_level}")
+        
+        states = [{"index": index, "filename": clip.get("filename"), "status": "analyzing"}
+                  for index, clip in enumerate(clips)]
+        
+        def update(stage: str, index: Optional[int] = None, **fields) -> None:
+            partial = None
+            if index is not None:
+                states[index] = {"index": index, "filename": clips[index].get("filename"), **fields}
+                partial = {str(index): states[index]}
+            self._report_progress(progress_callback, stage, partial)
+        
+        # 1. Pose extraction for every clip on the shared pose scheduler
+        update("analyzing_videos")
+        analyses = {}
+        for index, analysis, error in self.computer_vision_agent.analyze_many(clips, quality):
+            if error is not None:
+                update("analyzing_videos", index, status="failed", error=str(error))
+                continue
             
-            # 5. Create and return the final output
-            result = {
-                "exercise_type": exercise_type,
-                "fitness_level": fitness_level,
-                "score": combined_output["score"],
-                "feedback": combined_output["feedback_text"],
-                "errors": combined_output["errors"],
-                "visual_guidance": combined_output["visual_guidance"],
-                "annotated_video_url": combined_output.get("annotated_video_url")
-            }
+            analyses[index] = analysis
+            update("analyzing_videos", index, status="analyzed",
+                   exercise_type=analysis["exercise_type"], errors=analysis["errors"], reps=analysis["reps"])
+        
+        # 2. One coaching request for the whole session
+        update("generating_feedback")
+        analyzed = sorted(analyses)
+        summary, feedback = self.llm_agent.generate_session_feedback(
+            [{"errors": analyses[index]["errors"], "exercise_type": analyses[index]["exercise_type"],
+              "reps": self.feedback_combiner.score_reps(analyses[index]["reps"], analyses[index]["errors"])}
+             for index in analyzed],
+            {"fitness_level": fitness_level, "user_id": user_id or "anonymous"}
+        )
+        
+        # 3. Score, store and annotate each clip like a single upload
+        update("saving_results")
+        for index, clip_feedback in zip(analyzed, feedback):
+            clip = clips[index]
+            analysis = analyses[index]
+            try:
+                result = self._complete_analysis(
+                    errors=analysis["errors"],
+                    exercise_type=analysis["exercise_type"],
+                    fitness_level=fitness_level,
+                    user_id=user_id,
+                    video_path=clip["video_path"],
+                    details={"exercise_detection": analysis["classification"]},
+                    reps=analysis["reps"],
+                    load_landmarks=lambda clip=clip: self.computer_vision_agent.landmarks(
+                        clip["video_path"], clip.get("video_hash"), quality),
+                    feedback=clip_feedback
+                )
+                update("saving_results", index, status="completed", result=result)
+            except Exception as e:
+                logger.error(f"Error completing clip {index} of batch: {str(e)}")
+                update("saving_results", index, status="failed", error=str(e))
+        
+        completed = sum(state["status"] == "completed" for state in states)
+        logger.info(f"Completed batch analysis: {completed} of {len(clips)} clips")
+        return {"session_feedback": summary, "clips": states}
+    
+    @telemetry.traced("analysis.live_session")
+    def complete_live_session(
+        self,
+        exercise_type: str,
+        fitness_level: str,
+        errors: List[Dict[str, Any]],
+        stats: Dict[str, Any],
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate feedback for a closed live session and store it like an uploaded video.
+        
+        Args:
+            exercise_type: Type of exercise the session checked
+            fitness_level: User's fitness level
+            errors: Errors detected over the whole session
+            stats: Frame and latency statistics of the session
+            user_id: Optional user ID for tracking
             
-            # Log the complete analysis
-            exercise_id = self.logger.store_exercise_data(
-                user_id=user_id,
+        Returns:
+            Dict containing the combined feedback, errors, and visual guidance
+        """
+        try:
+            logger.info(f"Completing live {exercise_type} session with {len(errors)} errors")
+            return self._complete_analysis(
+                errors=errors,
                 exercise_type=exercise_type,
                 fitness_level=fitness_level,
-                result=result
+                user_id=user_id,
+                video_path=None,
+                details={"live": stats}
             )
             
-            # Add the ID to the result
-            result["id"] = exercise_id
-            
-            logger.info(f"Completed analysis for {exercise_type}, score: {result['score']}")
-            return result
-            
         except Exception as e:
-            logger.error(f"Error in analysis workflow: {str(e)}")
-            raise
\ No newline at end of file
+            logger.error(f"Error completing live session: {str(e)}")
+            raise
+    
+    def _complete_analysis(
+        self,
+        errors: List[Dict[str, Any]],
+        exercise_type: str,
+        fitness_level: str,
+        user_id: Optional[str],
+        video_path: Optional[str],
+        details: Dict[str, Any],
+        reps: Optional[Dict[str, Any]] = None,
+        load_landmarks: Optional[Callable[[], Any]] = None,
+        progress_callback: Optional[Callable[[str], None]] = None,
+        feedback: Optional[Tuple[str, str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Feedback, visual guidance, scoring and storage for errors already detected.
+        
+        `load_landmarks` returns the video's landmarks; when given, an annotated copy of
+        the video is rendered in the background once the result is stored. `feedback`
+        is (feedback, form cues) already generated for these errors, e.g. by a session
+        request; the LLM is only asked when it is None.
+        """
+        # Per-rep scores feed both the overall score and the feedback prompt
+        reps = self.feedback_combiner.score_reps(reps, errors)
+        
+        # Log the errors and score them while the LLM call is in flight
+        error_logging = self.stage_executor.submit(
+            telemetry.in_context(self.logger.store_error_data),
+            user_id=user_id,
+            exercise_type=exercise_type,
+            errors=errors
+        )
+        scoring = self.stage_executor.submit(telemetry.in_context(self.feedback_combiner.calculate_score), errors, reps)
+        
+        # 2. Generate feedback and form cues with LLM Agent in a single request
+        self._report_progress(progress_callback, "generating_feedback")
+        user_metadata = {
+            "fitness_level": fitness_level,
+            "exercise_type": exercise_type
+        }
+        
+        if feedback is None:
+            feedback = self.llm_agent.generate_feedback(
+                errors=errors,
+                user_metadata=user_metadata,
+                reps=reps
+            )
+        feedback, form_description = feedback
+        
+        # Log the feedback while visual guidance is looked up
+        feedback_logging = self.stage_executor.submit(
+            telemetry.in_context(self.logger.store_feedback_data),
+            user_id=user_id,
+            exercise_type=exercise_type,
+            feedback=feedback,
+            form_description=form_description
+        )
+        
+        # 3. Get visual model/image from Motion Capture Agent as soon as the cues arrive
+        self._report_progress(progress_callback, "visual_guidance")
+        visual_guidance = self.motion_capture_agent.get_guidance(
+            form_description=form_description,
+            exercise_type=exercise_type
+        )
+        
+        visual_logging = self.stage_executor.submit(
+            telemetry.in_context(self.logger.store_visual_data),
+            user_id=user_id,
+            exercise_type=exercise_type,
+            visual_data=visual_guidance
+        )
+        
+        # 4. Combine everything with Feedback Combiner
+        self._report_progress(progress_callback, "combining_feedback")
+        combined_output = self.feedback_combiner.combine_feedback(
+            errors=errors,
+            feedback_text=feedback,
+            visual_guidance=visual_guidance,
+            video_path=video_path,
+            score=scoring.result()
+        )
+        
+        # Surface any failure of the background stages before saving the analysis
+        for stage in (error_logging, feedback_logging, visual_logging):
+            stage.result()
+        
+        # The ID is known up front so the result can link to its annotated video
+        exercise_id = str(uuid.uuid4())
+        annotated = (self.video_annotator is not None and self.video_annotator.available
+                     and load_landmarks is not None and video_path is not None)
+        
+        # 5. Create and return the final output
+        result = {
+            "id": exercise_id,
+            "exercise_type": exercise_type,
+            "fitness_level": fitness_level,
+            **details,
+            "score": combined_output["score"],
+            "reps": reps,
+            "feedback": combined_output["feedback_text"],
+            "errors": combined_output["errors"],
+            "visual_guidance": combined_output["visual_guidance"],
+            "annotated_video_url": f"/api/videos/{exercise_id}" if annotated else None
+        }
+        
+        # Log the complete analysis
+        self._report_progress(progress_callback, "saving_results")
+        self.logger.store_exercise_data(
+            user_id=user_id,
+            exercise_type=exercise_type,
+            fitness_level=fitness_level,
+            result=result
+        )
+        
+        # Render the overlay video off the request path; the client polls its URL
+        if annotated:
+            self.video_annotator.submit(exercise_id, video_path, errors, load_landmarks)
+        
+        logger.info(f"Completed analysis for {exercise_type}, score: {result['score']}")
+        return result
+    
+    def _report_progress(self, progress_callback: Optional[Callable[..., None]], stage: str,
+                         partial: Optional[Dict[str, Any]] = None) -> None:
+        """Notify the caller of a stage change; progress reporting must never break the analysis"""
+        if progress_callback is None:
+            return
+        
+        try:
+            if partial is None:
+                progress_callback(stage)
+            else:
+                progress_callback(stage, partial)
+        except Exception as e:
+            logger.error(f"Error reporting progress for stage {stage}: {str(e)}")
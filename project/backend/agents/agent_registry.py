@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+STATE_NOT_LOADED = "not_loaded"
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+
+class _Entry:
+    def __init__(self, factory: Callable[[], Any]):
+        self.factory = factory
+        self.instance = None
+        self.state = STATE_NOT_LOADED
+        self.error = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+
+
+class AgentRegistry:
+    """
+    Lazily constructed agents.
+
+    Each agent is registered with a factory that does its own heavy imports and
+    model loads, so importing the app costs almost nothing. An agent is built on
+    first use, or ahead of time by `warm_up`, exactly once per process; other
+    threads asking for it meanwhile wait for the same instance. A factory that
+    fails is retried on the next request.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        """
+        Args:
+            name: Agent name
+            factory: Callable returning the agent; may get other agents from this registry
+        """
+        self._entries[name] = _Entry(factory)
+
+    def get(self, name: str) -> Any:
+        """The agent, built on first use"""
+        entry = self._entries[name]
+        if entry.state == STATE_READY:
+            return entry.instance
+
+        with entry.lock:
+            if entry.state != STATE_READY:
+                entry.state = STATE_LOADING
+                started = time.monotonic()
+                try:
+                    entry.instance = entry.factory()
+                except Exception as e:
+                    entry.state = STATE_FAILED
+                    entry.error = str(e)
+                    raise
+                entry.load_seconds = round(time.monotonic() - started, 3)
+                entry.error = None
+                entry.state = STATE_READY
+                logger.info(f"Loaded {name} in {entry.load_seconds}s")
+
+        return entry.instance
+
+    def names(self) -> List[str]:
+        return list(self._entries)
+
+    def is_loaded(self, name: str) -> bool:
+        return self._entries[name].state == STATE_READY
+
+    def is_ready(self, names: Optional[List[str]] = None) -> bool:
+        """True once every named agent (default: all) has been built"""
+        return all(self.is_loaded(name) for name in (names or self._entries))
+
+    def warm_up(self, names: Optional[List[str]] = None) -> None:
+        """Build agents now instead of on first use; failures are logged, not raised"""
+        for name in names or list(self._entries):
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(f"Error loading {name}: {str(e)}")
+
+    def warm_up_async(self, names: Optional[List[str]] = None) -> threading.Thread:
+        """Warm up in a background thread so the process can serve requests meanwhile"""
+        thread = threading.Thread(target=self.warm_up, args=(names,), name="agent-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {"state": entry.state, "load_seconds": entry.load_seconds, "error": entry.error}
+            for name, entry in self._entries.items()
+        }
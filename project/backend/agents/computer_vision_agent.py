@@ -1,43 +1,258 @@
 import logging
 import os
-import cv2
-import numpy as np
-import mediapipe as mp
-import tensorflow as tf
-from typing import Dict, List, Any, Tuple
+import threading
+from typing import Dict, Iterator, List, Any, Tuple, Optional
+
+from agents import telemetry
+from agents.exercise_classifier import ExerciseClassifier, AUTO_DETECT_TYPES
+from agents.form_rules import FormRuleEngine, RULE_VERSION
+from agents.landmarks import LandmarkSequence
+from agents.pose_engine import PoseEngine
+from agents.rep_segmentation import RepSegmenter, REP_VERSION
+from agents.upload_store import UploadStore
 
 logger = logging.getLogger(__name__)
 
+CLASSIFIER_PATH = os.path.join('models', 'exercise_classifier.h5')
+
+# Keras models loaded in this process, by path
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+
+def load_classifier(path: str = CLASSIFIER_PATH):
+    """
+    Load the exercise classifier once per process.
+
+    TensorFlow is imported here rather than at module import. A model loaded in
+    a parent process before it forks (e.g. the gunicorn master) is inherited by
+    the children, whose copies share its weight pages copy-on-write.
+    """
+    with _classifiers_lock:
+        model = _classifiers.get(path)
+        if model is None:
+            import tensorflow as tf
+            model = tf.keras.models.load_model(path)
+            _classifiers[path] = model
+            logger.info(f"Loaded exercise classifier from {path}")
+        return model
+
 class ComputerVisionAgent:
-    def __init__(self):
-        self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(
-            static_image_mode=False,
-            model_complexity=2,
+    def __init__(self, frame_stride: int = 1, target_fps: Optional[float] = None,
+                 max_frame_dimension: Optional[int] = None, prefetch_frames: int = 8,
+                 pose_workers: Optional[int] = None, segment_seconds: float = 10.0,
+                 upload_store: Optional[UploadStore] = None, pose_start_method: Optional[str] = None,
+                 classifier_path: str = CLASSIFIER_PATH, classifier_batch_size: int = 256,
+                 classifier_max_latency: float = 0.02, pose_quality: str = "accurate",
+                 person_roi: bool = True, roi_padding: float = 0.25, roi_dimension: int = 480,
+                 model_complexity: int = 2):
+        # Pose estimation runs on a pool of worker processes, each with its own MediaPipe Pose
+        self.pose_engine = PoseEngine(
+            num_workers=pose_workers,
+            segment_seconds=segment_seconds,
+            model_complexity=model_complexity,
             min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
+            min_tracking_confidence=0.5,
+            frame_stride=frame_stride,
+            target_fps=target_fps,
+            max_frame_dimension=max_frame_dimension,
+            prefetch_frames=prefetch_frames,
+            start_method=pose_start_method,
+            quality=pose_quality,
+            person_roi=person_roi,
+            roi_padding=roi_padding,
+            roi_dimension=roi_dimension
         )
         
-        # Load custom TensorFlow model for exercise classification
-        self.model = tf.keras.models.load_model('models/exercise_classifier.h5')
+        # Start the pose workers (from a forkserver, never a fork of this process) and load their models
+        self.pose_engine.start()
         
-        self.error_detectors = {
-            "squat": self._analyze_squat,
-            "deadlift": self._analyze_deadlift,
-            "pushup": self._analyze_pushup,
-            "plank": self._analyze_plank,
-            "lunge": self._analyze_lunge
-        }
+        # Custom TensorFlow model for exercise classification, loaded on first use.
+        # Windows from concurrent requests are classified together in micro-batches
+        self.classifier_path = classifier_path
+        self.classifier = ExerciseClassifier(
+            lambda: load_classifier(self.classifier_path),
+            max_batch_size=classifier_batch_size,
+            max_latency=classifier_max_latency
+        )
+        
+        # Form checks for every supported exercise, compiled to vectorized expressions
+        self.rule_engine = FormRuleEngine()
+        
+        # Rep boundaries, tempo and range of motion from the landmark time series
+        self.rep_segmenter = RepSegmenter()
+        
+        # Landmarks and errors are cached per video content hash when a store is available
+        self.upload_store = upload_store
         
         logger.info("Computer Vision Agent initialized with MediaPipe and TensorFlow")
     
-    def analyze_video(self, video_path: str, exercise_type: str) -> List[Dict[str, Any]]:
+    @property
+    def model(self):
+        return load_classifier(self.classifier_path)
+    
+    def warm_up(self) -> None:
+        """Load the classifier and run a first batch now rather than on first use"""
+        self.classifier.warm_up()
+    
+    @telemetry.traced("cv.analyze")
+    def analyze(self, video_path: str, exercise_type: str, video_hash: Optional[str] = None,
+                quality: Optional[str] = None,
+                landmarks_sequence: Optional[LandmarkSequence] = None) -> Dict[str, Any]:
+        """
+        Detect form errors, recognizing the exercise first if the client didn't name it.
+        
+        Args:
+            video_path: Path to the video
+            exercise_type: Exercise type, or "unknown" to detect it
+            video_hash: Content hash of the video, used to reuse cached landmarks and errors
+            quality: Pose quality tier ("fast", "balanced" or "accurate"); defaults to the engine's
+            landmarks_sequence: The video's landmarks, when already extracted
+            
+        Returns:
+            {"exercise_type": the given or detected type ("unknown" if it couldn't be detected),
+             "errors": detected errors, "reps": rep segmentation or None,
+             "classification": classifier output or None}
+        """
+        classification = None
+        
         try:
-            frames, fps = self._extract_frames(video_path)
-            landmarks_sequence = self._extract_pose_landmarks(frames)
+            if (exercise_type or "").strip().lower() in AUTO_DETECT_TYPES:
+                if landmarks_sequence is None:
+                    landmarks_sequence = self._extract_pose_landmarks(video_path, video_hash, quality)
+                with telemetry.span("cv.classify"):
+                    classification = self.classifier.classify(landmarks_sequence)
+                exercise_type = classification["exercise_type"] or "unknown"
+                logger.info(
+                    f"Detected exercise: {exercise_type} (confidence {classification['confidence']}, "
+                    f"{classification['windows']} windows)"
+                )
+        except Exception as e:
+            logger.error(f"Error classifying exercise: {str(e)}")
+            exercise_type = "unknown"
+        
+        # Extract once for both stages, unless neither has to compute anything
+        if landmarks_sequence is None and self._needs_landmarks(exercise_type, video_hash, quality):
+            try:
+                landmarks_sequence = self._extract_pose_landmarks(video_path, video_hash, quality)
+            except Exception as e:
+                logger.error(f"Error extracting pose landmarks: {str(e)}")
+                return {"exercise_type": exercise_type, "errors": [], "reps": None,
+                        "classification": classification}
+        
+        return {
+            "exercise_type": exercise_type,
+            "errors": self._detect_errors(video_path, exercise_type, video_hash, quality, landmarks_sequence),
+            "reps": self._segment_reps(video_path, exercise_type, video_hash, quality, landmarks_sequence),
+            "classification": classification
+        }
+    
+    def analyze_many(self, clips: List[Dict[str, Any]],
+                     quality: Optional[str] = None) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[Exception]]]:
+        """
+        Analyze several videos, yielding each analysis as soon as it is done.
+        
+        Clips with cached landmarks are analyzed first; the others have their pose
+        extraction scheduled together on the pose engine (see PoseEngine.extract_many).
+        
+        Args:
+            clips: Dicts with "video_path", "exercise_type" and optionally "video_hash"
+            quality: Pose quality tier; defaults to the engine's
+            
+        Yields:
+            (index into clips, analysis as returned by analyze, None), or
+            (index, None, exception) for a clip that couldn't be analyzed
+        """
+        pipeline = self.pose_engine.signature(quality)
+        pending = []
+        
+        for index, clip in enumerate(clips):
+            video_hash = clip.get("video_hash")
+            landmarks_sequence = None
+            if video_hash and self.upload_store:
+                landmarks_sequence = self.upload_store.load_landmarks(video_hash, pipeline)
+            
+            if landmarks_sequence is None:
+                pending.append(index)
+                continue
+            
+            logger.info(f"Reusing cached landmarks for video {video_hash[:12]}")
+            yield self._analyze_clip(index, clip, quality, landmarks_sequence)
+        
+        extracted = self.pose_engine.extract_many([clips[index]["video_path"] for index in pending], quality)
+        for position, landmarks_sequence, error in extracted:
+            index = pending[position]
+            if error is not None:
+                logger.error(f"Error extracting landmarks of clip {index}: {str(error)}")
+                yield index, None, error
+                continue
+            
+            video_hash = clips[index].get("video_hash")
+            if video_hash and self.upload_store:
+                self.upload_store.store_landmarks(video_hash, pipeline, landmarks_sequence)
+            yield self._analyze_clip(index, clips[index], quality, landmarks_sequence)
+    
+    def analyze_video(self, video_path: str, exercise_type: str, video_hash: Optional[str] = None,
+                      quality: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self.analyze(video_path, exercise_type, video_hash, quality)["errors"]
+    
+    def landmarks(self, video_path: str, video_hash: Optional[str] = None,
+                  quality: Optional[str] = None) -> LandmarkSequence:
+        """Pose landmarks of a video, from the upload store's cache when available"""
+        return self._extract_pose_landmarks(video_path, video_hash, quality)
+    
+    def _analyze_clip(self, index: int, clip: Dict[str, Any], quality: Optional[str],
+                      landmarks_sequence: LandmarkSequence) -> Tuple[int, Optional[Dict[str, Any]], Optional[Exception]]:
+        try:
+            analysis = self.analyze(clip["video_path"], clip["exercise_type"], clip.get("video_hash"),
+                                    quality, landmarks_sequence)
+            return index, analysis, None
+        except Exception as e:
+            logger.error(f"Error analyzing clip {index}: {str(e)}")
+            return index, None, e
+    
+    def _needs_landmarks(self, exercise_type: str, video_hash: Optional[str] = None,
+                         quality: Optional[str] = None) -> bool:
+        """Whether error detection or rep segmentation would miss the cache for this video"""
+        pipeline = self.pose_engine.signature(quality)
+        cached = video_hash and self.upload_store
+        
+        if self.rule_engine.supports(exercise_type):
+            if not (cached and self.upload_store.load_errors(
+                    video_hash, f"{exercise_type}-{RULE_VERSION}-{pipeline}") is not None):
+                return True
+        
+        if self.rep_segmenter.supports(exercise_type):
+            if not (cached and self.upload_store.load_reps(
+                    video_hash, f"{exercise_type}-{REP_VERSION}-{pipeline}") is not None):
+                return True
+        
+        return False
+    
+    def _detect_errors(self, video_path: str, exercise_type: str, video_hash: Optional[str] = None,
+                       quality: Optional[str] = None,
+                       landmarks_sequence: Optional[LandmarkSequence] = None) -> List[Dict[str, Any]]:
+        try:
+            if not self.rule_engine.supports(exercise_type):
+                logger.warning(f"No form rules for exercise type: {exercise_type}")
+                return []
+            
+            errors_key = f"{exercise_type}-{RULE_VERSION}-{self.pose_engine.signature(quality)}"
+            if video_hash and self.upload_store:
+                errors = self.upload_store.load_errors(video_hash, errors_key)
+                if errors is not None:
+                    logger.info(f"Reusing cached {exercise_type} analysis for video {video_hash[:12]}")
+                    return errors
+            
+            if landmarks_sequence is None:
+                landmarks_sequence = self._extract_pose_landmarks(video_path, video_hash, quality)
             
             # Analyze pose sequence for errors
-            errors = self.error_detectors[exercise_type](landmarks_sequence, fps)
+            with telemetry.span("cv.detect_errors", exercise_type=exercise_type):
+                errors = self.rule_engine.evaluate(landmarks_sequence, exercise_type)
+            
+            if video_hash and self.upload_store:
+                self.upload_store.store_errors(video_hash, errors_key, errors)
             
             return errors
             
@@ -45,73 +260,47 @@ class ComputerVisionAgent:
             logger.error(f"Error analyzing video: {str(e)}")
             return []
     
-    def _extract_pose_landmarks(self, frames: List[np.ndarray]) -> List[Dict]:
-        landmarks_sequence = []
-        
-        for frame in frames:
-            # Convert BGR to RGB
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = self.pose.process(frame_rgb)
-            
-            if results.pose_landmarks:
-                # Convert landmarks to normalized coordinates
-                landmarks = {
-                    'nose': (results.pose_landmarks.landmark[0].x, results.pose_landmarks.landmark[0].y),
-                    'shoulders': [
-                        (results.pose_landmarks.landmark[11].x, results.pose_landmarks.landmark[11].y),
-                        (results.pose_landmarks.landmark[12].x, results.pose_landmarks.landmark[12].y)
-                    ],
-                    'hips': [
-                        (results.pose_landmarks.landmark[23].x, results.pose_landmarks.landmark[23].y),
-                        (results.pose_landmarks.landmark[24].x, results.pose_landmarks.landmark[24].y)
-                    ],
-                    'knees': [
-                        (results.pose_landmarks.landmark[25].x, results.pose_landmarks.landmark[25].y),
-                        (results.pose_landmarks.landmark[26].x, results.pose_landmarks.landmark[26].y)
-                    ],
-                    'ankles': [
-                        (results.pose_landmarks.landmark[27].x, results.pose_landmarks.landmark[27].y),
-                        (results.pose_landmarks.landmark[28].x, results.pose_landmarks.landmark[28].y)
-                    ]
-                }
-                landmarks_sequence.append(landmarks)
+    def _segment_reps(self, video_path: str, exercise_type: str, video_hash: Optional[str] = None,
+                      quality: Optional[str] = None,
+                      landmarks_sequence: Optional[LandmarkSequence] = None) -> Optional[Dict[str, Any]]:
+        try:
+            if not self.rep_segmenter.supports(exercise_type):
+                return None
+            
+            reps_key = f"{exercise_type}-{REP_VERSION}-{self.pose_engine.signature(quality)}"
+            if video_hash and self.upload_store:
+                reps = self.upload_store.load_reps(video_hash, reps_key)
+                if reps is not None:
+                    return reps
+            
+            if landmarks_sequence is None:
+                landmarks_sequence = self._extract_pose_landmarks(video_path, video_hash, quality)
+            
+            with telemetry.span("cv.segment_reps", exercise_type=exercise_type):
+                reps = self.rep_segmenter.segment(landmarks_sequence, exercise_type)
+            logger.info(f"Found {reps['count']} {exercise_type} reps")
+            
+            if video_hash and self.upload_store:
+                self.upload_store.store_reps(video_hash, reps_key, reps)
+            
+            return reps
+            
+        except Exception as e:
+            logger.error(f"Error segmenting reps: {str(e)}")
+            return None
+    
+    def _extract_pose_landmarks(self, video_path: str, video_hash: Optional[str] = None,
+                                quality: Optional[str] = None) -> LandmarkSequence:
+        if not (video_hash and self.upload_store):
+            return self.pose_engine.extract(video_path, quality)
+        
+        pipeline = self.pose_engine.signature(quality)
+        landmarks_sequence = self.upload_store.load_landmarks(video_hash, pipeline)
+        
+        if landmarks_sequence is None:
+            landmarks_sequence = self.pose_engine.extract(video_path, quality)
+            self.upload_store.store_landmarks(video_hash, pipeline, landmarks_sequence)
+        else:
+            logger.info(f"Reusing cached landmarks for video {video_hash[:12]}")
         
         return landmarks_sequence
-    
-    def _analyze_squat(self, landmarks_sequence: List[Dict], fps: float) -> List[Dict[str, Any]]:
-        errors = []
-        
-        for i, landmarks in enumerate(landmarks_sequence):
-            # Check knee alignment
-            knee_x = (landmarks['knees'][0][0] + landmarks['knees'][1][0]) / 2
-            ankle_x = (landmarks['ankles'][0][0] + landmarks['ankles'][1][0]) / 2
-            
-            if abs(knee_x - ankle_x) > 0.1:
-                errors.append({
-                    "timestamp": self._format_timestamp(i, fps),
-                    "severity": "high",
-                    "description": "Knees not aligned with ankles",
-                    "confidence": 0.92
-                })
-            
-            # Check back angle
-            hip_y = (landmarks['hips'][0][1] + landmarks['hips'][1][1]) / 2
-            shoulder_y = (landmarks['shoulders'][0][1] + landmarks['shoulders'][1][1]) / 2
-            
-            if abs(hip_y - shoulder_y) > 0.3:
-                errors.append({
-                    "timestamp": self._format_timestamp(i, fps),
-                    "severity": "medium",
-                    "description": "Back not straight",
-                    "confidence": 0.85
-                })
-        
-        return errors
-
-    # Similar implementations for other exercises...
-    
-    def _format_timestamp(self, frame_idx: int, fps: float) -> str:
-        total_seconds = frame_idx / fps
-        minutes = int(total_seconds // 60)
-        seconds = int(total_seconds % 60)
-        return f"{minutes:02d}:{seconds:02d}"
\ No newline at end of file
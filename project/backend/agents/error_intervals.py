@@ -0,0 +1,89 @@
+from typing import Dict, List, Any
+
+import numpy as np
+
+
+def _runs(mask: np.ndarray):
+    """Start and end (exclusive) rows of each run of True values"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def merge_violations(excess: np.ndarray, confidence: np.ndarray, frame_indices: np.ndarray, fps: float,
+                     release: float = 0.0, max_gap: int = 0, min_duration: float = 0.0) -> List[Dict[str, Any]]:
+    """
+    Run-length merge per-frame rule violations into time intervals.
+
+    An interval opens on a frame that violates the rule (excess > 0) and only
+    closes once the value has moved `release` units back inside the limit, so
+    values hovering around the threshold don't produce a flurry of short
+    intervals. Intervals separated by at most `max_gap` rows (including rows with
+    no detection) are joined, and intervals shorter than `min_duration` seconds
+    are dropped.
+
+    Args:
+        excess: How far each frame exceeds the rule's limit, NaN without a detection
+        confidence: Confidence of the check on each frame
+        frame_indices: Source frame number of each row
+        fps: Frame rate of the source video
+        release: Hysteresis margin in rule units
+        max_gap: Largest number of rows between two intervals that still get joined
+        min_duration: Shortest interval kept, in seconds
+
+    Returns:
+        List of intervals with start/end frames, duration and peak/mean confidence
+    """
+    with np.errstate(invalid="ignore"):
+        violating = excess > 0
+        holding = excess > -release
+
+    if not violating.any():
+        return []
+
+    starts, ends = _runs(holding)
+
+    # Keep only runs that actually cross the threshold, not just the release band
+    count_before = np.concatenate(([0], np.cumsum(violating)))
+    crossed = count_before[ends] - count_before[starts] > 0
+    starts, ends = starts[crossed], ends[crossed]
+
+    # Join intervals separated by short gaps
+    if max_gap > 0 and len(starts) > 1:
+        keep = np.concatenate(([True], starts[1:] - ends[:-1] > max_gap))
+        starts = starts[keep]
+        ends = ends[np.concatenate((keep[1:], [True]))]
+
+    start_frames = frame_indices[starts]
+    end_frames = frame_indices[ends - 1]
+    durations = (end_frames - start_frames + 1) / fps
+
+    long_enough = durations >= min_duration
+    starts, ends = starts[long_enough], ends[long_enough]
+    start_frames, end_frames, durations = start_frames[long_enough], end_frames[long_enough], durations[long_enough]
+
+    if not len(starts):
+        return []
+
+    # Confidence statistics over the violating frames of each interval
+    violating_confidence = np.where(violating, confidence, 0.0)
+    total_before = np.concatenate(([0.0], np.cumsum(violating_confidence)))
+    frame_counts = count_before[ends] - count_before[starts]
+    totals = total_before[ends] - total_before[starts]
+
+    # Reduce over [start, end) and the gaps in between, then keep every other result;
+    # the padding element lets the last interval end at the final row
+    boundaries = np.column_stack((starts, ends)).ravel()
+    peak = np.maximum.reduceat(np.append(violating_confidence, 0.0), boundaries)[::2]
+
+    return [
+        {
+            "start_frame": int(start_frame),
+            "end_frame": int(end_frame),
+            "duration": round(float(duration), 2),
+            "frames": int(count),
+            "peak_confidence": round(float(peak_value), 2),
+            "mean_confidence": round(float(total / count), 2)
+        }
+        for start_frame, end_frame, duration, count, peak_value, total
+        in zip(start_frames, end_frames, durations, frame_counts, peak, totals)
+    ]
@@ -0,0 +1,280 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+from agents import telemetry
+from agents.landmarks import LandmarkSequence, LANDMARK_INDEX, NUM_LANDMARKS, NUM_CHANNELS, X, Y, Z
+
+logger = logging.getLogger(__name__)
+
+# Output order of models/exercise_classifier.h5
+EXERCISE_CLASSES = ("squat", "deadlift", "pushup", "plank", "lunge")
+
+# Exercise types sent by clients that want the exercise detected for them
+AUTO_DETECT_TYPES = ("", "unknown", "auto")
+
+NUM_FEATURES = NUM_LANDMARKS * NUM_CHANNELS
+
+
+class MicroBatcher:
+    """
+    Runs model inference for many concurrent callers in shared batches.
+
+    Callers submit arrays of inputs and get a Future for their rows of the
+    output. A scheduler thread collects submissions until `max_batch_size` rows
+    are waiting or the oldest one has waited `max_latency` seconds, runs one
+    predict call on all of them and hands each caller its slice, so the model
+    sees a few large batches instead of many small ones while no request waits
+    longer than the latency cap for company.
+    """
+
+    def __init__(self, predict: Callable[[np.ndarray], np.ndarray],
+                 max_batch_size: int = 256, max_latency: float = 0.02):
+        """
+        Args:
+            predict: Function mapping a (batch, ...) array to a (batch, ...) array of outputs
+            max_batch_size: Rows per predict call
+            max_latency: Longest time in seconds a submission waits for others to join its batch
+        """
+        self.predict = predict
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_latency = max_latency
+
+        self._requests = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+        self.batches = 0
+        self.rows = 0
+
+    def submit(self, inputs: np.ndarray) -> Future:
+        """Queue inputs for the next batch; the Future resolves to their outputs"""
+        if self._closed:
+            raise RuntimeError("Micro-batcher is closed")
+
+        self._ensure_started()
+        future = Future()
+
+        if len(inputs) == 0:
+            future.set_result(np.empty((0,)))
+        else:
+            self._requests.put((inputs, future, time.monotonic()))
+        return future
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": round(self.rows / self.batches, 1) if self.batches else 0.0
+        }
+
+    def pending(self) -> int:
+        """Submissions waiting for a batch"""
+        return self._requests.qsize()
+
+    def close(self) -> None:
+        self._closed = True
+        if self._thread is not None:
+            self._requests.put(None)
+            self._thread.join(timeout=5)
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            first = self._requests.get()
+            if first is None:
+                return
+
+            batch = [first]
+            size = len(first[0])
+            deadline = first[2] + self.max_latency
+            stop = False
+
+            while size < self.max_batch_size:
+                try:
+                    request = self._requests.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+                size += len(request[0])
+
+            self._predict_batch(batch)
+
+            if stop:
+                return
+
+    def _predict_batch(self, batch: List[Tuple[np.ndarray, Future, float]]) -> None:
+        try:
+            inputs = np.concatenate([request[0] for request in batch])
+
+            # A single large submission can exceed the batch size on its own
+            with telemetry.span("classifier.batch", rows=len(inputs), requests=len(batch)):
+                outputs = np.concatenate([
+                    np.asarray(self.predict(inputs[start:start + self.max_batch_size]))
+                    for start in range(0, len(inputs), self.max_batch_size)
+                ])
+
+            self.batches += 1
+            self.rows += len(inputs)
+
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for request_inputs, future, _ in batch:
+            future.set_result(outputs[offset:offset + len(request_inputs)])
+            offset += len(request_inputs)
+
+
+class ExerciseClassifier:
+    """
+    Recognizes the exercise in a landmark sequence with the Keras classifier.
+
+    The sequence is resampled to a fixed frame rate, normalized per frame
+    (centered on the hips, scaled by torso length) and cut into overlapping
+    windows, which are classified together through a shared MicroBatcher. The
+    class probabilities are averaged over the windows.
+    """
+
+    def __init__(self, load_model: Callable[[], Any], classes: Tuple[str, ...] = EXERCISE_CLASSES,
+                 fps: float = 15.0, window_frames: int = 30, stride_frames: int = 8,
+                 min_detected: float = 0.5, min_confidence: float = 0.5,
+                 max_batch_size: int = 256, max_latency: float = 0.02):
+        """
+        Args:
+            load_model: Returns the Keras model; called on first use
+            classes: Exercise type of each model output
+            fps: Frame rate windows are sampled at
+            window_frames: Frames per window, unless the model declares its own input length
+            stride_frames: Frames between the starts of consecutive windows
+            min_detected: Fraction of frames in a window that must have a pose
+            min_confidence: Mean probability below which the exercise is reported as unknown
+            max_batch_size: Windows per predict call
+            max_latency: Longest time in seconds a request waits to share a batch
+        """
+        self.load_model = load_model
+        self.classes = tuple(classes)
+        self.fps = fps
+        self.window_frames = window_frames
+        self.stride_frames = max(1, stride_frames)
+        self.min_detected = min_detected
+        self.min_confidence = min_confidence
+
+        self.batcher = MicroBatcher(self._predict, max_batch_size=max_batch_size, max_latency=max_latency)
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    def warm_up(self) -> None:
+        """Load the model and run one batch so the first request doesn't pay for tracing"""
+        self._get_model()
+        self.batcher.submit(np.zeros((1, self.window_frames, NUM_FEATURES), dtype=np.float32)).result()
+
+    def classify(self, sequence: LandmarkSequence) -> Dict[str, Any]:
+        """
+        Returns:
+            {"exercise_type": detected type or None below min_confidence,
+             "confidence": its mean probability, "windows": windows classified,
+             "probabilities": mean probability per exercise type}
+        """
+        self._get_model()
+        windows = self.windows(sequence)
+
+        if len(windows) == 0:
+            return {"exercise_type": None, "confidence": 0.0, "windows": 0, "probabilities": {}}
+
+        probabilities = self.batcher.submit(windows).result().mean(axis=0)
+        best = int(np.argmax(probabilities))
+        confidence = float(probabilities[best])
+
+        return {
+            "exercise_type": self.classes[best] if confidence >= self.min_confidence else None,
+            "confidence": round(confidence, 3),
+            "windows": len(windows),
+            "probabilities": {name: round(float(p), 3) for name, p in zip(self.classes, probabilities)}
+        }
+
+    def windows(self, sequence: LandmarkSequence) -> np.ndarray:
+        """Normalized windows of shape (windows, window_frames, 132)"""
+        if len(sequence) == 0:
+            return np.empty((0, self.window_frames, NUM_FEATURES), dtype=np.float32)
+
+        rows = self._resample(sequence)
+        features = self._normalize(sequence.data[rows])
+        detected = sequence.detected[rows]
+
+        # Clips shorter than one window are padded by repeating their last frame
+        if len(rows) < self.window_frames:
+            pad = self.window_frames - len(rows)
+            features = np.pad(features, ((0, pad), (0, 0)), mode="edge")
+            detected = np.pad(detected, (0, pad), mode="edge")
+
+        windows = np.lib.stride_tricks.sliding_window_view(features, self.window_frames, axis=0)
+        windows = windows[::self.stride_frames].transpose(0, 2, 1)
+
+        coverage = np.lib.stride_tricks.sliding_window_view(detected, self.window_frames)[::self.stride_frames].mean(axis=1)
+        return np.ascontiguousarray(windows[coverage >= self.min_detected])
+
+    def _resample(self, sequence: LandmarkSequence) -> np.ndarray:
+        """Row of the nearest frame for every tick of the classifier frame rate"""
+        timestamps = sequence.timestamps
+        if len(timestamps) == 1:
+            return np.zeros(1, dtype=np.int64)
+
+        ticks = np.arange(timestamps[0], timestamps[-1] + 1e-9, 1.0 / self.fps)
+        right = np.clip(np.searchsorted(timestamps, ticks), 1, len(timestamps) - 1)
+        left = right - 1
+        return np.where(ticks - timestamps[left] <= timestamps[right] - ticks, left, right)
+
+    @staticmethod
+    def _normalize(data: np.ndarray) -> np.ndarray:
+        """(frames, 33, 4) landmarks to (frames, 132) position- and scale-invariant features"""
+        hips = data[:, [LANDMARK_INDEX["left_hip"], LANDMARK_INDEX["right_hip"]], X:Z + 1].mean(axis=1)
+        shoulders = data[:, [LANDMARK_INDEX["left_shoulder"], LANDMARK_INDEX["right_shoulder"]], X:Z + 1].mean(axis=1)
+        torso = np.linalg.norm((shoulders - hips)[:, X:Y + 1], axis=1)
+        torso = np.where(torso > 1e-6, torso, 1.0)
+
+        normalized = data.copy()
+        normalized[:, :, X:Z + 1] = (data[:, :, X:Z + 1] - hips[:, None, :]) / torso[:, None, None]
+
+        # Frames without a pose become zeros; coverage filtering drops windows made of them
+        return np.nan_to_num(normalized.reshape(len(data), -1), nan=0.0).astype(np.float32)
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                model = self.load_model()
+
+                # Follow the window length the model was trained with
+                input_shape = getattr(model, "input_shape", None)
+                if input_shape and len(input_shape) == 3 and input_shape[1]:
+                    self.window_frames = int(input_shape[1])
+
+                output_shape = getattr(model, "output_shape", None)
+                if output_shape and output_shape[-1] != len(self.classes):
+                    raise ValueError(
+                        f"Classifier has {output_shape[-1]} outputs for {len(self.classes)} exercise types"
+                    )
+
+                self._model = model
+            return self._model
+
+    def _predict(self, windows: np.ndarray) -> np.ndarray:
+        return self._model.predict_on_batch(windows)
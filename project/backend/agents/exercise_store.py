@@ -0,0 +1,354 @@
+import base64
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+from agents import telemetry
+from agents.progress_aggregates import ProgressAggregates
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exercises (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    exercise_type TEXT NOT NULL,
+    fitness_level TEXT,
+    timestamp TEXT NOT NULL,
+    date TEXT,
+    score INTEGER,
+    record TEXT NOT NULL
+);
+DROP INDEX IF EXISTS idx_exercises_user_time;
+DROP INDEX IF EXISTS idx_exercises_user_type_time;
+DROP INDEX IF EXISTS idx_exercises_type_time;
+DROP INDEX IF EXISTS idx_exercises_time;
+CREATE INDEX IF NOT EXISTS idx_exercises_user_time_id
+    ON exercises (user_id, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_exercises_user_type_time_id
+    ON exercises (user_id, exercise_type, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_exercises_type_time_id
+    ON exercises (exercise_type, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_exercises_time_id
+    ON exercises (timestamp, id);
+CREATE TABLE IF NOT EXISTS history_versions (
+    scope TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+# history_versions scope covering every user's exercises
+ALL_USERS = "*"
+
+# Projection names accepted by query(fields=...) and the columns they read
+FIELDS = {
+    "id": "id",
+    "user_id": "user_id",
+    "type": "exercise_type",
+    "exercise_type": "exercise_type",
+    "fitness_level": "fitness_level",
+    "timestamp": "timestamp",
+    "date": "date",
+    "score": "score"
+}
+
+
+def encode_cursor(timestamp: str, exercise_id: str) -> str:
+    """Opaque cursor pointing just past an exercise in newest-first order"""
+    return base64.urlsafe_b64encode(json.dumps([timestamp, exercise_id]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, exercise_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return str(timestamp), str(exercise_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class ExerciseStore:
+    """
+    Embedded SQLite store for complete exercise analyses.
+
+    Records are kept as JSON next to the columns they are queried by. Secondary
+    indexes on (user_id, timestamp, id) and (user_id, exercise_type, timestamp, id)
+    make a per-user history query an index range scan, O(log N + k), and fetching
+    one analysis is a primary-key lookup; nothing is held in memory. Listings are
+    paged by keyset on (timestamp, id), so a page costs the same however deep it is.
+
+    Every write also bumps the history version of the users it touches (and of
+    ALL_USERS) in the same transaction, so readers can tell whether a listing
+    may have changed with one primary-key lookup, from any process.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: Path of the SQLite database file
+        """
+        self.db_path = db_path
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # SQLite connections can't be shared between threads, so each thread gets its own
+        self._local = threading.local()
+
+        self.aggregates = ProgressAggregates()
+
+        connection = self._connection()
+        self._add_score_column(connection)
+        connection.executescript(SCHEMA)
+        self.aggregates.create_schema(connection)
+        connection.commit()
+
+        if self.aggregates.is_empty(connection) and self.count():
+            logger.warning("Progress aggregates are empty; run `flask rebuild-progress` to backfill them")
+
+        logger.info(f"Exercise store initialized at {db_path}")
+
+    def put(self, record: Dict[str, Any]) -> None:
+        """Insert or replace an exercise record"""
+        self.put_many([record])
+
+    @telemetry.traced("exercise_store.write")
+    def put_many(self, records: List[Dict[str, Any]], replace: bool = True) -> None:
+        """
+        Write several exercise records in one transaction, updating the progress aggregates.
+
+        Args:
+            records: Exercise records
+            replace: Overwrite records that already exist; otherwise they are kept
+        """
+        connection = self._connection()
+        with connection:
+            rebuild_users = set()
+            changed_users = set()
+
+            for record in records:
+                previous = connection.execute(
+                    "SELECT user_id FROM exercises WHERE id = ?", (record["id"],)
+                ).fetchone()
+
+                if previous is not None:
+                    if not replace:
+                        continue
+                    # Totals can't subtract a replaced record, so recompute its users instead
+                    rebuild_users.update((previous[0], record["user_id"]))
+
+                connection.execute(
+                    "INSERT OR REPLACE INTO exercises "
+                    "(id, user_id, exercise_type, fitness_level, timestamp, date, score, record) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        record["id"],
+                        record["user_id"],
+                        record["exercise_type"],
+                        record.get("fitness_level"),
+                        record["timestamp"],
+                        record.get("date"),
+                        (record.get("result") or {}).get("score"),
+                        json.dumps(record, separators=(",", ":"))
+                    )
+                )
+
+                if previous is None and record["user_id"] not in rebuild_users:
+                    self.aggregates.apply(connection, record)
+                changed_users.add(record["user_id"])
+
+            for user_id in rebuild_users:
+                self._rebuild_progress(connection, user_id)
+
+            if changed_users:
+                self._bump_versions(connection, changed_users | rebuild_users | {ALL_USERS})
+
+    def get(self, exercise_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT record FROM exercises WHERE id = ?", (exercise_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def record_version(self, exercise_id: str) -> Optional[str]:
+        """Write timestamp of an exercise, or None if it isn't stored; it changes only if the record is replaced"""
+        row = self._connection().execute(
+            "SELECT timestamp FROM exercises WHERE id = ?", (exercise_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def history_version(self, user_id: str = ALL_USERS) -> int:
+        """Version of a user's exercise history (ALL_USERS for everyone's); 0 if nothing was stored"""
+        row = self._connection().execute(
+            "SELECT version FROM history_versions WHERE scope = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def query(self, user_id: Optional[str] = None, exercise_type: Optional[str] = None,
+              since: Optional[str] = None, until: Optional[str] = None,
+              cursor: Optional[str] = None, limit: Optional[int] = None,
+              fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Exercises matching the filters, newest first.
+
+        Args:
+            user_id: Only exercises of this user
+            exercise_type: Only exercises of this type
+            since: Only exercises with a timestamp at or after this ISO time
+            until: Only exercises with a timestamp at or before this ISO time
+            cursor: Continue after the exercise this cursor points to
+            limit: Largest number of exercises returned
+            fields: Return only these fields (see FIELDS) instead of full records
+
+        Raises:
+            ValueError: For an unknown field or a malformed cursor
+        """
+        rows = self._select(user_id, exercise_type, since, until, cursor, limit, fields)
+        return [item for item, _, _ in rows]
+
+    def page(self, limit: int, user_id: Optional[str] = None, exercise_type: Optional[str] = None,
+             since: Optional[str] = None, until: Optional[str] = None,
+             cursor: Optional[str] = None, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        One page of query() results.
+
+        Returns:
+            {"exercises": [...], "next_cursor": cursor of the next page, or None on the last page}
+        """
+        rows = self._select(user_id, exercise_type, since, until, cursor, limit + 1, fields)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            _, timestamp, exercise_id = rows[-1]
+            next_cursor = encode_cursor(timestamp, exercise_id)
+
+        return {"exercises": [item for item, _, _ in rows], "next_cursor": next_cursor}
+
+    def _select(self, user_id, exercise_type, since, until, cursor, limit, fields) -> List[Tuple[Dict[str, Any], str, str]]:
+        """Matching exercises as (record or projection, timestamp, id), newest first"""
+        conditions = []
+        parameters = []
+
+        if user_id:
+            conditions.append("user_id = ?")
+            parameters.append(user_id)
+        if exercise_type:
+            conditions.append("exercise_type = ?")
+            parameters.append(exercise_type)
+        if since:
+            conditions.append("timestamp >= ?")
+            parameters.append(since)
+        if until:
+            conditions.append("timestamp <= ?")
+            parameters.append(until)
+        if cursor:
+            conditions.append("(timestamp, id) < (?, ?)")
+            parameters.extend(decode_cursor(cursor))
+
+        if fields:
+            unknown = [field for field in fields if field not in FIELDS]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+            columns = ", ".join(FIELDS[field] for field in fields)
+        else:
+            columns = "record"
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = f"SELECT timestamp, id, {columns} FROM exercises {where} ORDER BY timestamp DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+
+        rows = self._connection().execute(sql, parameters).fetchall()
+
+        if fields:
+            return [(dict(zip(fields, row[2:])), row[0], row[1]) for row in rows]
+        return [(json.loads(row[2]), row[0], row[1]) for row in rows]
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM exercises").fetchone()[0]
+
+    def progress(self, user_id: str, exercise_type: Optional[str] = None, days: int = 30) -> Optional[Dict[str, Any]]:
+        """Progress aggregates of a user, see ProgressAggregates.summary"""
+        return self.aggregates.summary(self._connection(), user_id, exercise_type, days)
+
+    def exercise_types(self, user_id: str) -> List[str]:
+        """Exercise types a user has progress for"""
+        return self.aggregates.exercise_types(self._connection(), user_id)
+
+    def rebuild_progress(self, user_id: Optional[str] = None) -> int:
+        """
+        Recompute progress aggregates from the stored exercises.
+
+        Args:
+            user_id: Only rebuild this user's aggregates
+
+        Returns:
+            Number of exercises folded in
+        """
+        connection = self._connection()
+        with connection:
+            return self._rebuild_progress(connection, user_id)
+
+    def _rebuild_progress(self, connection: sqlite3.Connection, user_id: Optional[str] = None,
+                          chunk_size: int = 1000) -> int:
+        self.aggregates.clear(connection, user_id)
+
+        where = "WHERE user_id = ?" if user_id is not None else ""
+        parameters = [user_id] if user_id is not None else []
+        position = ("", "")
+        folded = 0
+
+        # Oldest first, so streaks extend forward instead of being recomputed
+        while True:
+            condition = f"{where} {'AND' if where else 'WHERE'} (timestamp, id) > (?, ?)"
+            rows = connection.execute(
+                f"SELECT timestamp, id, record FROM exercises {condition} "
+                "ORDER BY timestamp, id LIMIT ?",
+                [*parameters, *position, chunk_size]
+            ).fetchall()
+
+            for _, _, record in rows:
+                self.aggregates.apply(connection, json.loads(record))
+            folded += len(rows)
+
+            if len(rows) < chunk_size:
+                return folded
+            position = rows[-1][:2]
+
+    @staticmethod
+    def _bump_versions(connection: sqlite3.Connection, scopes) -> None:
+        # Versions start from the clock rather than 1, so they never repeat one
+        # handed out before the database was recreated
+        now = time.time_ns() // 1000
+        connection.executemany(
+            "INSERT INTO history_versions (scope, version) VALUES (?, ?) "
+            "ON CONFLICT(scope) DO UPDATE SET version = MAX(version + 1, excluded.version)",
+            [(scope, now) for scope in scopes]
+        )
+
+    def _add_score_column(self, connection: sqlite3.Connection) -> None:
+        """Add and backfill the score column in databases created before it existed"""
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(exercises)")]
+        if columns and "score" not in columns:
+            with connection:
+                connection.execute("ALTER TABLE exercises ADD COLUMN score INTEGER")
+                connection.execute("UPDATE exercises SET score = json_extract(record, '$.result.score')")
+            logger.info("Added score column to exercise store")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            # WAL lets readers proceed while another thread or process writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+
+        return connection
@@ -0,0 +1,291 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class FeedbackCache:
+    """
+    Bounded LRU cache with TTL for LLM feedback.
+
+    Entries are keyed by a normalized error profile rather than the raw errors,
+    so two uploads with the same exercise, fitness level and kinds of mistakes
+    share one answer even if their timestamps differ.
+
+    The cache can optionally be persisted to a JSON Lines file so it survives
+    restarts. Puts are appended to the file by a background thread, holding a
+    lock file, so server processes sharing the file never overwrite each
+    other's entries; a miss first reads whatever other processes appended since
+    the last read. Once the file holds `compact_factor` times `max_entries`
+    lines it is rewritten with only the live entries.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 24 * 3600,
+                 persist_path: Optional[str] = None, compact_factor: int = 4):
+        """
+        Args:
+            max_entries: Maximum number of cached responses
+            ttl_seconds: How long a response stays valid
+            persist_path: Optional JSON Lines file to load from and append to
+            compact_factor: File length, in multiples of max_entries, that triggers a compaction
+        """
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.compact_factor = max(2, compact_factor)
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Position in the file read so far, and the file it refers to (compaction replaces it)
+        self._file_lock = threading.Lock()
+        self._offset = 0
+        self._inode = None
+        self._file_lines = 0
+
+        self._pending = queue.Queue()
+        self._writer = None
+        if persist_path:
+            directory = os.path.dirname(persist_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._read_appended()
+            self._writer = threading.Thread(target=self._write_behind, name="feedback-cache-writer", daemon=True)
+            self._writer.start()
+
+        logger.info(f"Feedback cache initialized with {len(self._entries)} entries")
+
+    @staticmethod
+    def make_key(errors: List[Dict[str, Any]], user_metadata: Dict[str, str],
+                 reps: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Signature of an error profile: exercise type, fitness level and the set of
+        (error type, severity) pairs, ignoring timestamps, counts and confidence.
+
+        Feedback written from a rep summary refers to reps by number, so when the
+        clip has reps the profile also holds each rep's error types and partial
+        flag, and the mean rep duration to the nearest half second.
+        """
+        profile = {
+            "exercise_type": str(user_metadata.get("exercise_type", "unknown")).strip().lower(),
+            "fitness_level": str(user_metadata.get("fitness_level", "beginner")).strip().lower(),
+            "errors": sorted({
+                (str(error.get("type") or error.get("description", "")).strip().lower(),
+                 str(error.get("severity", "medium")).strip().lower())
+                for error in errors
+            })
+        }
+        if reps and reps.get("reps"):
+            profile["reps"] = [(sorted(rep.get("errors") or []), bool(rep.get("partial"))) for rep in reps["reps"]]
+            profile["rep_duration"] = round(reps["tempo"]["duration"] * 2) / 2
+        return hashlib.sha256(json.dumps(profile, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, str]]:
+        value = self._lookup(key)
+        if value is None and self.persist_path:
+            # Another process may have cached it
+            self._read_appended()
+            value = self._lookup(key)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: Tuple[str, str]) -> None:
+        with self._lock:
+            self._entries[key] = {"value": list(value), "expires_at": time.time() + self.ttl_seconds}
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+            entry = self._entries[key]
+
+        if self.persist_path:
+            self._pending.put((key, entry))
+
+    def pending(self) -> int:
+        """Entries put but not yet appended to the file"""
+        return self._pending.qsize()
+
+    def flush(self) -> None:
+        """Block until every entry put so far is in the file"""
+        if self._writer is not None and self._writer.is_alive():
+            self._pending.join()
+
+    def close(self) -> None:
+        """Write the remaining entries and stop the writer"""
+        if self._writer is not None and self._writer.is_alive():
+            self._pending.put(None)
+            self._writer.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry["expires_at"] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return tuple(entry["value"])
+
+    @contextmanager
+    def _locked_file(self, operation: int):
+        """Hold the lock file shared by every process using the cache file"""
+        with self._file_lock, open(f"{self.persist_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_appended(self) -> None:
+        """Merge the entries appended to the file since the last read"""
+        try:
+            with self._locked_file(fcntl.LOCK_SH):
+                try:
+                    status = os.stat(self.persist_path)
+                except FileNotFoundError:
+                    return
+
+                if status.st_ino != self._inode or status.st_size < self._offset:
+                    # First read, or the file was compacted since
+                    self._inode, self._offset, self._file_lines = status.st_ino, 0, 0
+                if status.st_size == self._offset:
+                    return
+
+                with open(self.persist_path, "rb") as f:
+                    f.seek(self._offset)
+                    data = f.read()
+                self._offset += len(data)
+
+                entries = list(self._parse(data))
+                self._file_lines += len(entries)
+
+        except OSError as e:
+            logger.error(f"Error reading feedback cache: {str(e)}")
+            return
+
+        self._merge(entries)
+
+    def _merge(self, entries: List[Tuple[str, Dict[str, Any]]]) -> None:
+        now = time.time()
+        with self._lock:
+            for key, entry in entries:
+                if entry["expires_at"] > now:
+                    self._entries[key] = entry
+                    self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _parse(data: bytes):
+        for line in data.splitlines():
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+
+            # Older versions saved the whole cache as one JSON array of pairs
+            pairs = item if item and isinstance(item[0], list) else [item]
+            for key, entry in pairs:
+                yield key, entry
+
+    def _write_behind(self) -> None:
+        while True:
+            batch = [self._pending.get()]
+            while True:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            entries = [item for item in batch if item is not None]
+            if entries:
+                self._append(entries)
+            for _ in batch:
+                self._pending.task_done()
+
+            if len(entries) < len(batch):
+                return
+
+    def _append(self, entries: List[Tuple[str, Dict[str, Any]]]) -> None:
+        data = "".join(json.dumps([key, entry]) + "\n" for key, entry in entries).encode()
+
+        try:
+            with self._locked_file(fcntl.LOCK_EX):
+                with open(self.persist_path, "ab") as f:
+                    status = os.fstat(f.fileno())
+                    f.write(data)
+
+                if self._inode is None and status.st_size == 0:
+                    # The file didn't exist when this process started and was created just now
+                    self._inode = status.st_ino
+
+                # Nothing else was appended since the last read, so these lines needn't be read back
+                if status.st_ino == self._inode and status.st_size == self._offset:
+                    self._offset += len(data)
+                    self._file_lines += len(entries)
+
+                if self._file_lines > self.compact_factor * self.max_entries:
+                    self._compact()
+
+        except OSError as e:
+            logger.error(f"Error saving feedback cache: {str(e)}")
+
+    def _compact(self) -> None:
+        """Rewrite the file with its live entries only; the caller holds the exclusive lock"""
+        with open(self.persist_path, "rb") as f:
+            data = f.read()
+
+        now = time.time()
+        entries = OrderedDict()
+        for key, entry in self._parse(data):
+            if entry["expires_at"] > now:
+                entries[key] = entry
+                entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+        compacted = "".join(json.dumps([key, entry]) + "\n" for key, entry in entries.items()).encode()
+        tmp_path = f"{self.persist_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(compacted)
+        os.replace(tmp_path, self.persist_path)
+
+        self._inode, self._offset, self._file_lines = os.stat(self.persist_path).st_ino, len(compacted), len(entries)
+        # Pick up what other processes appended since this one last read the file
+        unread = [(key, entry) for key, entry in entries.items() if key not in self._entries]
+        self._merge(unread)
+        logger.info(f"Compacted feedback cache file to {len(entries)} entries")
@@ -1,25 +1,27 @@
 import logging
-import os
-import cv2
-import tempfile
-import uuid
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+
+from agents import telemetry
 
 logger = logging.getLogger(__name__)
 
+# Extra points a rep loses for falling well short of the set's range of motion
+PARTIAL_REP_DEDUCTION = 10
+
 class FeedbackCombiner:
     """
     Integrates the error list, feedback text, and visual guidance into a cohesive output.
     
-    In a production system, this would also handle video annotation to highlight errors.
-    For this demo, we'll implement a simplified version.
+    The annotated video is rendered separately, in the background, by VideoAnnotator.
     """
     
     def __init__(self):
         logger.info("Feedback Combiner initialized")
     
+    @telemetry.traced("feedback.combine")
     def combine_feedback(self, errors: List[Dict[str, Any]], feedback_text: str, 
-                         visual_guidance: Dict[str, Any], video_path: str) -> Dict[str, Any]:
+                         visual_guidance: Dict[str, Any], video_path: str,
+                         score: Optional[int] = None) -> Dict[str, Any]:
         """
         Combine all analysis components into a cohesive output.
         
@@ -28,6 +30,7 @@ class FeedbackCombiner:
             feedback_text: Feedback text from LLM Agent
             visual_guidance: Visual guidance from Motion Capture Agent
             video_path: Path to the original video
+            score: Score already computed with calculate_score, computed here when omitted
             
         Returns:
             Dict containing combined feedback
@@ -36,19 +39,15 @@ class FeedbackCombiner:
             logger.info("Combining feedback components")
             
             # Calculate an overall score based on errors
-            score = self._calculate_score(errors)
-            
-            # In a real implementation, we would annotate the video to highlight errors
-            # annotated_video_path = self._annotate_video(video_path, errors)
-            # For demo purposes, we'll skip actual annotation
+            if score is None:
+                score = self._calculate_score(errors)
             
             # Combine everything into a single output
             combined_output = {
                 "score": score,
                 "feedback_text": feedback_text,
                 "errors": errors,
-                "visual_guidance": visual_guidance,
-                # "annotated_video_url": f"/api/videos/{os.path.basename(annotated_video_path)}"
+                "visual_guidance": visual_guidance
             }
             
             logger.info(f"Combined feedback with score: {score}")
@@ -64,61 +63,98 @@ class FeedbackCombiner:
                 "visual_guidance": visual_guidance
             }
     
-    def _calculate_score(self, errors: List[Dict[str, Any]]) -> int:
+    @telemetry.traced("feedback.score")
+    def calculate_score(self, errors: List[Dict[str, Any]], reps: Optional[Dict[str, Any]] = None) -> int:
+        """Score the detected errors ahead of combining, e.g. while feedback is being generated"""
+        return self._calculate_score(errors, reps)
+    
+    @telemetry.traced("feedback.score_reps")
+    def score_reps(self, reps: Optional[Dict[str, Any]], errors: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Score every rep by the errors that overlap it.
+        
+        Each overlapping error interval costs the rep the same points it costs the
+        clip, and a partial rep costs PARTIAL_REP_DEDUCTION more.
+        
+        Args:
+            reps: Rep segmentation of the clip, or None
+            errors: List of detected error intervals
+            
+        Returns:
+            The segmentation with "score" and "errors" (error types) added to each rep
+        """
+        if not reps:
+            return reps
+        
+        scored = []
+        for rep in reps["reps"]:
+            rep_errors = [error for error in errors if self._overlaps(error, rep)]
+            score = 100 - sum(self._deduction(error) for error in rep_errors)
+            if rep.get("partial"):
+                score -= PARTIAL_REP_DEDUCTION
+            
+            scored.append({
+                **rep,
+                "score": max(0, min(100, score)),
+                "errors": sorted({error.get("type", error.get("description")) for error in rep_errors})
+            })
+        
+        return {**reps, "reps": scored}
+    
+    def _calculate_score(self, errors: List[Dict[str, Any]], reps: Optional[Dict[str, Any]] = None) -> int:
         """
         Calculate an overall score based on detected errors.
         
+        Each error interval costs points once, however many frames it spans. When
+        the clip was split into scored reps, the score is the reps' average, less
+        the errors that fall outside every rep.
+        
         Args:
-            errors: List of detected errors
+            errors: List of detected error intervals
+            reps: Rep segmentation with per-rep scores from score_reps, or None
             
         Returns:
             Integer score from 0-100
         """
-        # Start with a perfect score
-        score = 100
+        scored_reps = [rep for rep in (reps or {}).get("reps", []) if "score" in rep]
+        
+        if scored_reps:
+            score = round(sum(rep["score"] for rep in scored_reps) / len(scored_reps))
+            errors = [error for error in errors
+                      if not any(self._overlaps(error, rep) for rep in scored_reps)]
+        else:
+            # Start with a perfect score
+            score = 100
         
         # Deduct points based on error severity and confidence
         for error in errors:
-            severity = error.get("severity", "medium")
-            confidence = error.get("confidence", 0.5)
-            
-            # Deduct more points for higher severity errors
-            if severity == "high":
-                deduction = 15
-            elif severity == "medium":
-                deduction = 10
-            else:  # low
-                deduction = 5
-                
-            # Scale deduction by confidence
-            deduction = int(deduction * confidence)
-            
-            # Apply deduction
-            score -= deduction
+            score -= self._deduction(error)
         
         # Ensure score is between 0 and 100
         score = max(0, min(100, score))
         
         return score
     
-    def _annotate_video(self, video_path: str, errors: List[Dict[str, Any]]) -> str:
-        """
-        Annotate the video to highlight detected errors.
+    @staticmethod
+    def _deduction(error: Dict[str, Any]) -> int:
+        severity = error.get("severity", "medium")
+        confidence = error.get("confidence", 0.5)
         
-        In a real implementation, this would add visual indicators at error timestamps.
-        For this demo, we'll return the original video path.
-        
-        Args:
-            video_path: Path to the original video
-            errors: List of detected errors
+        # Deduct more points for higher severity errors
+        if severity == "high":
+            deduction = 15
+        elif severity == "medium":
+            deduction = 10
+        else:  # low
+            deduction = 5
             
-        Returns:
-            Path to the annotated video
-        """
-        # In a real implementation, we would:
-        # 1. Load the video
-        # 2. For each error, add visual indicators at the corresponding frames
-        # 3. Save the annotated video to a new file
-        
-        # For this demo, we'll just return the original video path
-        return video_path
\ No newline at end of file
+        # Scale deduction by confidence
+        return int(deduction * confidence)
+    
+    @staticmethod
+    def _overlaps(error: Dict[str, Any], rep: Dict[str, Any]) -> bool:
+        start = error.get("start_time")
+        end = error.get("end_time", start)
+        if start is None:
+            return False
+        return start <= rep["end_time"] and end >= rep["start_time"]
@@ -0,0 +1,403 @@
+import functools
+import logging
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+import numpy as np
+
+from agents import telemetry
+from agents.error_intervals import merge_violations
+from agents.landmarks import LandmarkSequence, LANDMARK_INDEX, JOINT_PAIRS, X, Y, VISIBILITY
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever FORM_RULES or the way they are evaluated changes
+RULE_VERSION = "3"
+
+# Form checks per exercise, declared as data.
+#
+# Points are either a left/right pair from JOINT_PAIRS ("knees"), checked on each
+# side separately unless "side" is "mid", or a single landmark ("nose"). Checks:
+#   angle   - angle in degrees at the middle of three points
+#   offset  - absolute distance between two points along one axis
+#   line    - signed distance along y of a point from the line through two others
+#             (positive means below the line in image coordinates)
+#   tempo   - speed of a point along one axis, in normalized units per second; with
+#             "direction" ("down" or "up" in image coordinates) only movement that
+#             way counts, so a fast ascent doesn't trip a descent check
+# Each rule flags frames whose value falls outside [min, max]. Flagged frames are
+# merged into intervals; "hysteresis" (in rule units, default 10% of the limit)
+# sets how far back inside the limit a value must move to close an interval.
+FORM_RULES = {
+    "squat": [
+        {
+            "id": "knees_over_ankles",
+            "check": "offset",
+            "points": ["knees", "ankles"],
+            "axis": "x",
+            "side": "mid",
+            "max": 0.1,
+            "severity": "high",
+            "description": "Knees not aligned with ankles",
+            "confidence": 0.92
+        },
+        {
+            "id": "back_straight",
+            "check": "offset",
+            "points": ["hips", "shoulders"],
+            "axis": "y",
+            "side": "mid",
+            "max": 0.3,
+            "severity": "medium",
+            "description": "Back not straight",
+            "confidence": 0.85
+        },
+        {
+            "id": "descent_speed",
+            "check": "tempo",
+            "points": ["hips"],
+            "axis": "y",
+            "direction": "down",
+            "side": "mid",
+            "max": 1.2,
+            "severity": "low",
+            "description": "Moving too fast, control the descent",
+            "confidence": 0.7
+        }
+    ],
+    "deadlift": [
+        {
+            "id": "hips_too_low",
+            "check": "angle",
+            "points": ["hips", "knees", "ankles"],
+            "min": 100,
+            "severity": "medium",
+            "description": "Hips too low, hinge at the hips instead of squatting",
+            "confidence": 0.8
+        },
+        {
+            "id": "knees_caving",
+            "check": "offset",
+            "points": ["knees", "ankles"],
+            "axis": "x",
+            "max": 0.08,
+            "severity": "high",
+            "description": "Knees caving in",
+            "confidence": 0.85
+        },
+        {
+            "id": "jerking_the_bar",
+            "check": "tempo",
+            "points": ["wrists"],
+            "axis": "y",
+            "direction": "up",
+            "side": "mid",
+            "max": 1.5,
+            "severity": "medium",
+            "description": "Jerking the weight off the floor",
+            "confidence": 0.75
+        }
+    ],
+    "pushup": [
+        {
+            "id": "hips_sagging",
+            "check": "line",
+            "points": ["shoulders", "hips", "ankles"],
+            "side": "mid",
+            "max": 0.05,
+            "severity": "high",
+            "description": "Hips sagging, keep your body in a straight line",
+            "confidence": 0.88
+        },
+        {
+            "id": "hips_piking",
+            "check": "line",
+            "points": ["shoulders", "hips", "ankles"],
+            "side": "mid",
+            "min": -0.08,
+            "severity": "medium",
+            "description": "Hips too high",
+            "confidence": 0.82
+        },
+        {
+            "id": "dropping_too_fast",
+            "check": "tempo",
+            "points": ["shoulders"],
+            "axis": "y",
+            "direction": "down",
+            "side": "mid",
+            "max": 1.0,
+            "severity": "low",
+            "description": "Lowering too fast, control the movement",
+            "confidence": 0.7
+        }
+    ],
+    "plank": [
+        {
+            "id": "hips_sagging",
+            "check": "line",
+            "points": ["shoulders", "hips", "ankles"],
+            "side": "mid",
+            "max": 0.04,
+            "severity": "high",
+            "description": "Hips sagging, brace your core",
+            "confidence": 0.9
+        },
+        {
+            "id": "hips_piking",
+            "check": "line",
+            "points": ["shoulders", "hips", "ankles"],
+            "side": "mid",
+            "min": -0.06,
+            "severity": "medium",
+            "description": "Hips too high",
+            "confidence": 0.85
+        },
+        {
+            "id": "head_dropping",
+            "check": "offset",
+            "points": ["nose", "shoulders"],
+            "axis": "y",
+            "side": "mid",
+            "max": 0.12,
+            "severity": "low",
+            "description": "Head dropping, keep a neutral neck",
+            "confidence": 0.7
+        }
+    ],
+    "lunge": [
+        {
+            "id": "knee_past_toes",
+            "check": "offset",
+            "points": ["knees", "feet"],
+            "axis": "x",
+            "max": 0.12,
+            "severity": "medium",
+            "description": "Front knee travelling past the toes",
+            "confidence": 0.8
+        },
+        {
+            "id": "torso_leaning",
+            "check": "offset",
+            "points": ["shoulders", "hips"],
+            "axis": "x",
+            "side": "mid",
+            "max": 0.1,
+            "severity": "medium",
+            "description": "Torso leaning forward, stay upright",
+            "confidence": 0.82
+        },
+        {
+            "id": "knee_collapse",
+            "check": "angle",
+            "points": ["hips", "knees", "ankles"],
+            "min": 60,
+            "severity": "high",
+            "description": "Knee bending too far under load",
+            "confidence": 0.78
+        }
+    ]
+}
+
+AXES = {"x": X, "y": Y}
+# Sign of movement along an axis in image coordinates, where y grows downward
+DIRECTIONS = {"down": 1, "up": -1}
+
+
+def format_timestamp(frame_idx: int, fps: float) -> str:
+    total_seconds = frame_idx / fps
+    minutes = int(total_seconds // 60)
+    seconds = int(total_seconds % 60)
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def format_error(rule: Dict[str, Any], interval: Dict[str, Any], fps: float) -> Dict[str, Any]:
+    """Error record for one violation interval of a rule"""
+    start = format_timestamp(interval["start_frame"], fps)
+    return {
+        "type": rule["id"],
+        "timestamp": start,
+        "start": start,
+        "end": format_timestamp(interval["end_frame"], fps),
+        "start_time": round(interval["start_frame"] / fps, 2),
+        "end_time": round(interval["end_frame"] / fps, 2),
+        "severity": rule["severity"],
+        "description": rule["description"],
+        "confidence": interval["peak_confidence"],
+        **interval
+    }
+
+
+def release_margin(rule: Dict[str, Any]) -> float:
+    """How far back inside the limit a value must move to close an interval"""
+    if "hysteresis" in rule:
+        return rule["hysteresis"]
+
+    limit = rule.get("max", rule.get("min", 0.0))
+    return abs(limit) * 0.1
+
+
+def _points(sequence: LandmarkSequence, name: str, side: str) -> np.ndarray:
+    """Coordinates of a named point as a (frames, sides, 4) array"""
+    if name in JOINT_PAIRS:
+        if side == "mid":
+            return sequence.midpoint(name)[:, np.newaxis]
+        return sequence.pair(name)
+
+    index = LANDMARK_INDEX[name]
+    return sequence.data[:, index:index + 1]
+
+
+def _angle(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    ba = a[..., :2] - b[..., :2]
+    bc = c[..., :2] - b[..., :2]
+    cosine = (ba * bc).sum(axis=-1) / (np.linalg.norm(ba, axis=-1) * np.linalg.norm(bc, axis=-1))
+    return np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+
+
+def _line_offset(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    # Interpolate the a-c line at b's x position
+    span = c[..., X] - a[..., X]
+    t = np.where(np.abs(span) > 1e-6, (b[..., X] - a[..., X]) / np.where(span == 0, 1, span), 0.5)
+    return b[..., Y] - (a[..., Y] + t * (c[..., Y] - a[..., Y]))
+
+
+def _speed(sequence: LandmarkSequence, point: np.ndarray, axis: int, direction: Optional[int] = None) -> np.ndarray:
+    # Use real frame numbers so strided or gappy sequences still give per-second speeds
+    elapsed = np.diff(sequence.frame_indices)[:, np.newaxis] / sequence.fps
+    change = np.diff(point[..., axis], axis=0)
+    speed = np.full(point.shape[:2], np.nan, dtype=np.float32)
+    # Signed along the direction, so movement the other way is never too fast
+    speed[1:] = (change * direction if direction else np.abs(change)) / elapsed
+    return speed
+
+
+def compile_rule(rule: Dict[str, Any]) -> Callable[[LandmarkSequence], Tuple[np.ndarray, np.ndarray]]:
+    """
+    Compile a declarative rule into a function evaluated over a whole sequence.
+
+    The compiled function returns two per-frame arrays: how far the checked value
+    lies outside the rule's allowed range (positive values are violations, frames
+    without a detection are NaN), and the lowest landmark visibility among the
+    points involved, used to weight the rule's confidence.
+    """
+    check = rule["check"]
+    names = rule["points"]
+    side = rule.get("side", "each")
+    axis = AXES.get(rule.get("axis", "x"))
+    lower = rule.get("min", -np.inf)
+    upper = rule.get("max", np.inf)
+    direction = DIRECTIONS[rule["direction"]] if "direction" in rule else None
+
+    if check == "angle":
+        def measure(points):
+            return _angle(*points)
+    elif check == "offset":
+        def measure(points):
+            a, b = points
+            return np.abs(a[..., axis] - b[..., axis])
+    elif check == "line":
+        def measure(points):
+            return _line_offset(*points)
+    elif check == "tempo":
+        measure = None
+    else:
+        raise ValueError(f"Unknown check '{check}' in rule {rule.get('id')}")
+
+    def evaluate(sequence: LandmarkSequence) -> Tuple[np.ndarray, np.ndarray]:
+        points = [_points(sequence, name, side) for name in names]
+        value = _speed(sequence, points[0], axis, direction) if measure is None else measure(points)
+        excess = np.maximum(value - upper, lower - value)
+        visibility = functools.reduce(np.minimum, [point[..., VISIBILITY] for point in points])
+
+        # Worst side per frame; all-NaN rows stay NaN
+        worst = np.fmax.reduce(excess, axis=1)
+        return worst, np.fmax.reduce(visibility, axis=1)
+
+    return evaluate
+
+
+class FormRuleEngine:
+    """
+    Evaluates the declared form rules of an exercise over a whole landmark sequence.
+
+    Rules are compiled once into NumPy expressions, so checking an exercise is a
+    handful of array operations regardless of clip length. Supporting a new
+    exercise only needs a new entry in FORM_RULES.
+    """
+
+    def __init__(self, rules: Dict[str, List[Dict[str, Any]]] = None,
+                 min_duration: float = 0.2, max_gap: float = 0.25):
+        """
+        Args:
+            rules: Rules per exercise type, defaults to FORM_RULES
+            min_duration: Shortest error interval reported, in seconds (rules may override)
+            max_gap: Longest break in seconds between violations still reported as one interval
+        """
+        self.rules = rules if rules is not None else FORM_RULES
+        self.min_duration = min_duration
+        self.max_gap = max_gap
+        self._compiled = {
+            exercise_type: [(rule, compile_rule(rule)) for rule in exercise_rules]
+            for exercise_type, exercise_rules in self.rules.items()
+        }
+
+        logger.info(f"Form rule engine compiled rules for {len(self._compiled)} exercises")
+
+    def supports(self, exercise_type: str) -> bool:
+        return exercise_type in self._compiled
+
+    def compiled_rules(self, exercise_type: str) -> List[Tuple[Dict[str, Any], Callable]]:
+        """(rule, compiled evaluator) pairs of an exercise"""
+        return self._compiled[exercise_type]
+
+    def violations(self, sequence: LandmarkSequence, exercise_type: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluate every rule of an exercise in one pass.
+
+        Returns:
+            Tuple of (excess, visibility) arrays of shape (rules, frames): how far each
+            frame exceeds each rule's limits, and the visibility of the checked points
+        """
+        compiled = self._compiled[exercise_type]
+        excess = np.full((len(compiled), len(sequence)), np.nan, dtype=np.float32)
+        visibility = np.zeros((len(compiled), len(sequence)), dtype=np.float32)
+
+        for row, (rule, evaluate) in enumerate(compiled):
+            with telemetry.span(f"form_rule.{rule['id']}"):
+                excess[row], visibility[row] = evaluate(sequence)
+
+        return excess, visibility
+
+    def evaluate(self, sequence: LandmarkSequence, exercise_type: str) -> List[Dict[str, Any]]:
+        """
+        Detect form errors of an exercise as time intervals.
+
+        Args:
+            sequence: Landmarks of the analyzed video
+            exercise_type: Type of exercise (e.g., 'squat', 'deadlift')
+
+        Returns:
+            List of error intervals sorted by start time
+        """
+        excess, visibility = self.violations(sequence, exercise_type)
+
+        # Gap tolerance in rows of the (possibly strided) sequence
+        frame_step = np.median(np.diff(sequence.frame_indices)) if len(sequence) > 1 else 1
+        max_gap_rows = int(self.max_gap * sequence.fps / max(frame_step, 1))
+
+        errors = []
+        for row, (rule, _) in enumerate(self._compiled[exercise_type]):
+            intervals = merge_violations(
+                excess[row],
+                rule["confidence"] * np.nan_to_num(visibility[row]),
+                sequence.frame_indices,
+                sequence.fps,
+                release=release_margin(rule),
+                max_gap=max_gap_rows,
+                min_duration=rule.get("min_duration", self.min_duration)
+            )
+
+            errors.extend(format_error(rule, interval, sequence.fps) for interval in intervals)
+
+        errors.sort(key=lambda error: (error["start_frame"], error["end_frame"]))
+        return errors
@@ -0,0 +1,409 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable
+
+from agents import telemetry
+
+logger = logging.getLogger(__name__)
+
+JOB_WAIT_SECONDS = telemetry.metrics.histogram(
+    "formfit_job_wait_seconds",
+    "Time jobs spent queued before a worker started them"
+)
+
+# Job lifecycle states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+PENDING_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its depth limit."""
+
+
+class JobQueue:
+    """
+    Runs exercise analyses on a bounded pool of background worker threads.
+
+    Every job is journaled to its own JSON file in `jobs_dir` whenever its state
+    changes, so queued and interrupted jobs are picked up again after a worker
+    thread or the whole process dies. Status lookups fall back to the journal,
+    which lets any server process answer polls for a job another process owns.
+    """
+
+    def __init__(self, handler: Callable[[Dict[str, Any], Callable[..., None]], Dict[str, Any]],
+                 jobs_dir: str = "jobs", num_workers: int = 2, max_queue_depth: int = 16,
+                 max_attempts: int = 2, retention_seconds: int = 24 * 3600):
+        """
+        Args:
+            handler: Callable run for each job with (payload, report_progress); returns the job result.
+                report_progress(stage, partial=None) records the current stage and merges
+                `partial` into the job's partial results
+            jobs_dir: Directory for the job journal
+            num_workers: Number of worker threads processing jobs
+            max_queue_depth: Maximum number of queued (not yet running) jobs
+            max_attempts: Times a job is started before an interrupted job is marked failed
+            retention_seconds: How long finished jobs are kept in the journal
+        """
+        self.handler = handler
+        self.jobs_dir = jobs_dir
+        self.num_workers = max(1, num_workers)
+        self.max_queue_depth = max(1, max_queue_depth)
+        self.max_attempts = max(1, max_attempts)
+        self.retention_seconds = retention_seconds
+
+        os.makedirs(jobs_dir, exist_ok=True)
+
+        self._jobs = {}
+        self._pending = deque()
+        self._active = {}
+        self._workers = {}
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._stopping = threading.Event()
+
+        self._recover()
+
+        for index in range(self.num_workers):
+            self._start_worker(f"job-worker-{index}")
+
+        self._supervisor = threading.Thread(target=self._supervise, name="job-supervisor", daemon=True)
+        self._supervisor.start()
+
+        logger.info(f"Job queue initialized with {self.num_workers} workers, "
+                    f"queue depth limit {self.max_queue_depth}")
+
+    def submit(self, payload: Dict[str, Any], partial: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Queue a new job.
+
+        Args:
+            payload: Keyword arguments passed to the handler
+            partial: Initial partial results, shown until the handler updates them
+
+        Returns:
+            The public status record of the new job
+
+        Raises:
+            QueueFullError: If the queue depth limit has been reached
+        """
+        with self._lock:
+            if len(self._pending) >= self.max_queue_depth:
+                raise QueueFullError(f"Job queue is full ({self.max_queue_depth} jobs waiting)")
+
+            now = datetime.now().isoformat()
+            job = {
+                "id": str(uuid.uuid4()),
+                "status": JOB_QUEUED,
+                "stage": JOB_QUEUED,
+                "stages_completed": [],
+                "created_at": now,
+                "updated_at": now,
+                "attempts": 0,
+                "owner_pid": os.getpid(),
+                # Spans of the job are traced under the request that submitted it
+                "request_id": telemetry.current_request_id(),
+                "payload": payload,
+                "partial": partial or {},
+                "result": None,
+                "error": None
+            }
+            self._jobs[job["id"]] = job
+            self._journal(job)
+            self._pending.append(job["id"])
+            self._not_empty.notify()
+
+            logger.info(f"Queued job {job['id']} ({len(self._pending)} waiting)")
+            return self._public_view(job)
+
+    def is_full(self) -> bool:
+        """Whether a new submission would currently be rejected"""
+        with self._lock:
+            return len(self._pending) >= self.max_queue_depth
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get the status record of a job, without its result"""
+        job = self._lookup(job_id)
+        return self._public_view(job) if job else None
+
+    def get_result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get the full job record including its result or error"""
+        job = self._lookup(job_id)
+        if not job:
+            return None
+
+        record = self._public_view(job)
+        record["partial"] = job.get("partial") or {}
+        record["result"] = job.get("result")
+        record["error"] = job.get("error")
+        return record
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and worker utilisation"""
+        with self._lock:
+            return {
+                "queued": len(self._pending),
+                "running": len(self._active),
+                "workers": self.num_workers,
+                "max_queue_depth": self.max_queue_depth
+            }
+
+    def retry_after_seconds(self) -> int:
+        """Rough estimate of when queue capacity frees up, for Retry-After headers"""
+        with self._lock:
+            return max(1, int(len(self._pending) / self.num_workers) * 10)
+
+    def shutdown(self, wait: bool = True, timeout: float = 30.0) -> None:
+        """Stop accepting work; queued jobs stay in the journal for the next start"""
+        self._stopping.set()
+        with self._lock:
+            self._not_empty.notify_all()
+
+        if wait:
+            deadline = time.monotonic() + timeout
+            for worker in list(self._workers.values()):
+                worker.join(max(0.0, deadline - time.monotonic()))
+
+    def _start_worker(self, name: str) -> None:
+        worker = threading.Thread(target=self._work, name=name, daemon=True)
+        self._workers[name] = worker
+        worker.start()
+
+    def _work(self) -> None:
+        name = threading.current_thread().name
+
+        while True:
+            with self._lock:
+                while not self._pending and not self._stopping.is_set():
+                    self._not_empty.wait()
+                if self._stopping.is_set():
+                    return
+
+                job = self._jobs[self._pending.popleft()]
+                job["status"] = JOB_RUNNING
+                job["stage"] = "started"
+                job["stages_completed"] = []
+                job["attempts"] += 1
+                started_at = datetime.now()
+                job["started_at"] = started_at.isoformat()
+                self._active[name] = job["id"]
+                self._touch(job)
+
+            logger.info(f"{name} starting job {job['id']} (attempt {job['attempts']})")
+            JOB_WAIT_SECONDS.observe((started_at - datetime.fromisoformat(job["created_at"])).total_seconds())
+
+            try:
+                with telemetry.request_context(job.get("request_id") or job["id"]), \
+                        telemetry.span("job", job_id=job["id"], attempt=job["attempts"]):
+                    result = self.handler(job["payload"],
+                                          lambda stage, partial=None: self._report_progress(job, stage, partial))
+
+                self._report_progress(job, JOB_COMPLETED)
+
+                with self._lock:
+                    job["status"] = JOB_COMPLETED
+                    job["result"] = result
+                    self._touch(job)
+
+                logger.info(f"Job {job['id']} completed")
+
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {str(e)}")
+
+                with self._lock:
+                    job["status"] = JOB_FAILED
+                    job["stage"] = JOB_FAILED
+                    job["error"] = str(e)
+                    self._touch(job)
+
+            # Not in a finally block: if the thread dies mid-job the entry stays
+            # behind so the supervisor knows which job to requeue
+            with self._lock:
+                self._active.pop(name, None)
+
+    def _report_progress(self, job: Dict[str, Any], stage: str, partial: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            if stage != job["stage"]:
+                if job["stage"] not in (JOB_QUEUED, "started"):
+                    job["stages_completed"].append(job["stage"])
+                job["stage"] = stage
+            if partial:
+                job.setdefault("partial", {}).update(partial)
+            self._touch(job)
+
+    def _supervise(self) -> None:
+        """Replace worker threads that died and requeue the job they were running"""
+        last_prune = 0.0
+
+        while not self._stopping.wait(1.0):
+            with self._lock:
+                for name, worker in list(self._workers.items()):
+                    if worker.is_alive():
+                        continue
+
+                    job_id = self._active.pop(name, None)
+                    logger.error(f"Worker {name} died, restarting it")
+
+                    if job_id:
+                        self._requeue(self._jobs[job_id], "worker crashed")
+
+                    self._start_worker(name)
+
+            if time.monotonic() - last_prune > 600:
+                self._prune()
+                last_prune = time.monotonic()
+
+    def _requeue(self, job: Dict[str, Any], reason: str) -> None:
+        """Put an interrupted job back at the head of the queue, or fail it after too many attempts"""
+        if job["attempts"] >= self.max_attempts:
+            job["status"] = JOB_FAILED
+            job["stage"] = JOB_FAILED
+            job["error"] = f"Job interrupted ({reason}) after {job['attempts']} attempts"
+            self._touch(job)
+            return
+
+        job["status"] = JOB_QUEUED
+        job["stage"] = JOB_QUEUED
+        job["owner_pid"] = os.getpid()
+        self._touch(job)
+        self._pending.appendleft(job["id"])
+        self._not_empty.notify()
+
+    def _recover(self) -> None:
+        """
+        Adopt unfinished jobs from the journal whose owning process is gone.
+
+        The directory lock keeps two server processes starting at the same time
+        from adopting the same job.
+        """
+        recovered = 0
+
+        with open(os.path.join(self.jobs_dir, ".recover.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # _requeue notifies the workers' condition, which needs the lock held
+                with self._lock:
+                    for job in self._iter_journal():
+                        if job.get("status") not in PENDING_STATES:
+                            continue
+                        if self._process_alive(job.get("owner_pid")):
+                            continue
+
+                        self._jobs[job["id"]] = job
+                        if job["status"] == JOB_RUNNING:
+                            self._requeue(job, "server restarted")
+                        else:
+                            job["owner_pid"] = os.getpid()
+                            self._touch(job)
+                            self._pending.append(job["id"])
+                        recovered += 1
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        if recovered:
+            logger.info(f"Recovered {recovered} unfinished jobs from {self.jobs_dir}")
+
+    def _prune(self) -> None:
+        """Drop finished jobs past their retention period"""
+        cutoff = time.time() - self.retention_seconds
+
+        for filename in os.listdir(self.jobs_dir):
+            if not filename.endswith(".json"):
+                continue
+
+            path = os.path.join(self.jobs_dir, filename)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+
+                job_id = filename[:-len(".json")]
+                with self._lock:
+                    job = self._jobs.get(job_id)
+                    if job and job["status"] in PENDING_STATES:
+                        continue
+                    self._jobs.pop(job_id, None)
+                os.remove(path)
+
+            except OSError as e:
+                logger.error(f"Error pruning job {filename}: {str(e)}")
+
+    def _lookup(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job else self._load_job(job_id)
+
+    def _touch(self, job: Dict[str, Any]) -> None:
+        job["updated_at"] = datetime.now().isoformat()
+        self._journal(job)
+
+    def _journal(self, job: Dict[str, Any]) -> None:
+        """Atomically write the job record to the journal"""
+        path = self._job_path(job["id"])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+
+        try:
+            with telemetry.span("job_queue.journal"):
+                with open(tmp_path, 'w') as f:
+                    json.dump(job, f)
+                os.replace(tmp_path, path)
+
+        except Exception as e:
+            logger.error(f"Error journaling job {job['id']}: {str(e)}")
+
+    def _load_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        # Job IDs come from URLs, so never let them escape the journal directory
+        if os.path.basename(job_id) != job_id:
+            return None
+
+        try:
+            with open(self._job_path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _iter_journal(self):
+        for filename in sorted(os.listdir(self.jobs_dir)):
+            if filename.endswith(".json"):
+                job = self._load_job(filename[:-len(".json")])
+                if job:
+                    yield job
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    @staticmethod
+    def _process_alive(pid: Optional[int]) -> bool:
+        # Our own PID can only show up in the journal if a previous incarnation of
+        # this server reused it (common for PID 1 in containers)
+        if not pid or pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    @staticmethod
+    def _public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": job["id"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "stages_completed": list(job.get("stages_completed", [])),
+            "created_at": job.get("created_at"),
+            "started_at": job.get("started_at"),
+            "updated_at": job.get("updated_at"),
+            "attempts": job.get("attempts", 0)
+        }
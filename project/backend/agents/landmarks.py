@@ -0,0 +1,133 @@
+from typing import List, Tuple, Optional
+
+import numpy as np
+
+# MediaPipe Pose landmark order
+LANDMARK_NAMES = [
+    "nose",
+    "left_eye_inner", "left_eye", "left_eye_outer",
+    "right_eye_inner", "right_eye", "right_eye_outer",
+    "left_ear", "right_ear",
+    "mouth_left", "mouth_right",
+    "left_shoulder", "right_shoulder",
+    "left_elbow", "right_elbow",
+    "left_wrist", "right_wrist",
+    "left_pinky", "right_pinky",
+    "left_index", "right_index",
+    "left_thumb", "right_thumb",
+    "left_hip", "right_hip",
+    "left_knee", "right_knee",
+    "left_ankle", "right_ankle",
+    "left_heel", "right_heel",
+    "left_foot_index", "right_foot_index"
+]
+LANDMARK_INDEX = {name: index for index, name in enumerate(LANDMARK_NAMES)}
+NUM_LANDMARKS = len(LANDMARK_NAMES)
+
+# Left/right joints sit next to each other in MediaPipe's order, so each pair is a
+# slice and indexing with it returns a view instead of a copy
+JOINT_PAIRS = {
+    "shoulders": slice(11, 13),
+    "elbows": slice(13, 15),
+    "wrists": slice(15, 17),
+    "hips": slice(23, 25),
+    "knees": slice(25, 27),
+    "ankles": slice(27, 29),
+    "heels": slice(29, 31),
+    "feet": slice(31, 33)
+}
+
+# Channels of the last axis
+X, Y, Z, VISIBILITY = 0, 1, 2, 3
+NUM_CHANNELS = 4
+
+
+class LandmarkSequence:
+    """
+    Pose landmarks for every analyzed frame of a video, stored as whole arrays.
+
+    `data` has shape (frames, 33, 4) holding x, y, z and visibility per landmark,
+    `frame_indices` the source-video frame number of each row and `detected`
+    whether a pose was found in that frame. Rows without a detection are NaN, so
+    comparisons on them are False and they never trigger a detector.
+    """
+
+    __slots__ = ("data", "frame_indices", "detected", "fps")
+
+    def __init__(self, data: np.ndarray, frame_indices: np.ndarray, detected: np.ndarray, fps: float):
+        """
+        Args:
+            data: float32 array of shape (frames, 33, 4)
+            frame_indices: int array of source frame numbers, shape (frames,)
+            detected: bool array, shape (frames,)
+            fps: Frame rate of the source video
+        """
+        self.data = data
+        self.frame_indices = frame_indices
+        self.detected = detected
+        self.fps = fps
+
+    @classmethod
+    def from_frames(cls, frames: List[Tuple[int, Optional[np.ndarray]]], fps: float) -> "LandmarkSequence":
+        """Build a sequence from (frame_index, (33, 4) array or None) pairs"""
+        data = np.full((len(frames), NUM_LANDMARKS, NUM_CHANNELS), np.nan, dtype=np.float32)
+        frame_indices = np.empty(len(frames), dtype=np.int64)
+        detected = np.zeros(len(frames), dtype=bool)
+
+        for row, (frame_index, landmarks) in enumerate(frames):
+            frame_indices[row] = frame_index
+            if landmarks is not None:
+                data[row] = landmarks
+                detected[row] = True
+
+        return cls(data, frame_indices, detected, fps)
+
+    @classmethod
+    def concatenate(cls, sequences: List["LandmarkSequence"], fps: float) -> "LandmarkSequence":
+        """Join sequences covering consecutive parts of the same video"""
+        if not sequences:
+            return cls.from_frames([], fps)
+
+        return cls(
+            np.concatenate([sequence.data for sequence in sequences]),
+            np.concatenate([sequence.frame_indices for sequence in sequences]),
+            np.concatenate([sequence.detected for sequence in sequences]),
+            fps
+        )
+
+    def __len__(self) -> int:
+        return len(self.frame_indices)
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """Time of each row in seconds from the start of the video"""
+        return self.frame_indices / self.fps
+
+    def joint(self, name: str) -> np.ndarray:
+        """View of one landmark over time, shape (frames, 4)"""
+        return self.data[:, LANDMARK_INDEX[name]]
+
+    def pair(self, name: str) -> np.ndarray:
+        """View of a left/right joint pair over time, shape (frames, 2, 4)"""
+        return self.data[:, JOINT_PAIRS[name]]
+
+    def midpoint(self, name: str) -> np.ndarray:
+        """Mean of a left/right joint pair over time, shape (frames, 4)"""
+        return self.pair(name).mean(axis=1)
+
+    def detected_only(self) -> "LandmarkSequence":
+        """Sequence restricted to frames with a detection"""
+        return LandmarkSequence(self.data[self.detected], self.frame_indices[self.detected],
+                                self.detected[self.detected], self.fps)
+
+    def save(self, path: str) -> None:
+        """Write the sequence to an .npz file"""
+        with open(path, "wb") as f:
+            np.savez(f, data=self.data, frame_indices=self.frame_indices,
+                     detected=self.detected, fps=np.float64(self.fps))
+
+    @classmethod
+    def load(cls, path: str) -> "LandmarkSequence":
+        """Read a sequence written by save()"""
+        with np.load(path) as arrays:
+            return cls(arrays["data"], arrays["frame_indices"], arrays["detected"], float(arrays["fps"]))
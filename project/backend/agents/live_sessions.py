@@ -0,0 +1,286 @@
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from agents.form_rules import FormRuleEngine
+from agents.online_rules import OnlineRuleEvaluator
+from agents.video_stream import VideoFrameStream
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLimitError(Exception):
+    """Raised when a live session is opened while the maximum number are running."""
+
+
+def decode_image(data: bytes) -> np.ndarray:
+    """Decode an encoded image (JPEG, PNG, ...) to a BGR frame"""
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Could not decode frame image")
+    return frame
+
+
+def decode_chunk(video_path: str, start: float) -> List[Tuple[float, np.ndarray]]:
+    """(timestamp, frame) pairs of a short video chunk whose first frame is at `start` seconds"""
+    stream = VideoFrameStream(video_path)
+    return [(start + frame_index / stream.fps, frame) for frame_index, frame in stream]
+
+
+class LiveSession:
+    """
+    One live analysis session: a pose estimator with tracking state and an
+    online rule evaluator, fed with frames as the client sends them.
+
+    Frame timestamps are seconds since the start of the session, either sent by
+    the client or taken from the arrival time. Each batch of frames is worked
+    through within the per-frame latency budget: when the batch can't be
+    analyzed in full before the budget runs out, frames are dropped evenly
+    across it, always keeping the newest, so a client that sends faster than
+    frames can be analyzed gets timely results instead of a growing backlog.
+    """
+
+    def __init__(self, session_id: str, exercise_type: str, fitness_level: str, user_id: str,
+                 estimator, evaluator: OnlineRuleEvaluator, frame_budget: float):
+        self.id = session_id
+        self.exercise_type = exercise_type
+        self.fitness_level = fitness_level
+        self.user_id = user_id
+        self.estimator = estimator
+        self.evaluator = evaluator
+        self.frame_budget = frame_budget
+
+        self.started = time.monotonic()
+        self.last_active = self.started
+        self.lock = threading.Lock()
+        self.closed = False
+
+        self.frames_received = 0
+        self.frames_analyzed = 0
+        self.frames_dropped = 0
+        self.frames_late = 0
+        self.errors_reported = 0
+        self._last_frame_index = -1
+        self._inference_seconds = None
+        self._latencies = deque(maxlen=512)
+
+    def add_frames(self, frames: List[Tuple[Optional[float], np.ndarray]], received_at: float) -> Dict[str, Any]:
+        """
+        Analyze a batch of frames.
+
+        Args:
+            frames: (timestamp in seconds or None, BGR frame) pairs in order
+            received_at: time.monotonic() when the batch arrived
+
+        Returns:
+            Errors that became reportable, rules currently violated, and frame and latency counts
+        """
+        with self.lock:
+            if self.closed:
+                raise ValueError("Live session is closed")
+
+            self.last_active = time.monotonic()
+            reported = []
+            analyzed = dropped = 0
+            credit = 1.0
+
+            for position, (timestamp, frame) in enumerate(frames):
+                self.frames_received += 1
+
+                # Spread the frames that still fit in the budget evenly over the rest of the batch
+                if position < len(frames) - 1 and self._inference_seconds:
+                    remaining_time = self.frame_budget - (time.monotonic() - received_at)
+                    capacity = max(0.0, remaining_time) / self._inference_seconds
+                    credit += min(1.0, capacity / (len(frames) - position))
+                    if credit < 1.0:
+                        dropped += 1
+                        continue
+                    credit -= 1.0
+
+                if timestamp is None:
+                    timestamp = received_at - self.started
+                # Frame numbers must keep increasing even if timestamps repeat
+                frame_index = max(int(round(timestamp * self.evaluator.fps)), self._last_frame_index + 1)
+                self._last_frame_index = frame_index
+
+                inference_started = time.monotonic()
+                landmarks = self.estimator.process(frame)
+                reported.extend(self.evaluator.push(frame_index, landmarks))
+                finished = time.monotonic()
+
+                seconds = finished - inference_started
+                self._inference_seconds = seconds if self._inference_seconds is None else \
+                    0.8 * self._inference_seconds + 0.2 * seconds
+
+                latency = finished - received_at
+                self._latencies.append(latency)
+                if latency > self.frame_budget:
+                    self.frames_late += 1
+                analyzed += 1
+
+            self.frames_analyzed += analyzed
+            self.frames_dropped += dropped
+            self.errors_reported += len(reported)
+
+            return {
+                "frames_analyzed": analyzed,
+                "frames_dropped": dropped,
+                "errors": reported,
+                "active_errors": self.evaluator.active(),
+                "latency_ms": self._latency_stats()
+            }
+
+    def close(self) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Stop the session and return its errors and frame statistics"""
+        with self.lock:
+            self.closed = True
+            try:
+                errors = self.evaluator.finish()
+            finally:
+                self.estimator.close()
+            return errors, self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "duration": round(time.monotonic() - self.started, 2),
+            "frames_received": self.frames_received,
+            "frames_analyzed": self.frames_analyzed,
+            "frames_dropped": self.frames_dropped,
+            "frames_late": self.frames_late,
+            "errors_reported": self.errors_reported,
+            "budget_ms": round(self.frame_budget * 1000, 1),
+            "latency_ms": self._latency_stats()
+        }
+
+    def _latency_stats(self) -> Dict[str, Any]:
+        if not self._latencies:
+            return {"last": None, "p50": None, "p95": None}
+        latencies = np.array(self._latencies) * 1000
+        return {
+            "last": round(float(latencies[-1]), 1),
+            "p50": round(float(np.percentile(latencies, 50)), 1),
+            "p95": round(float(np.percentile(latencies, 95)), 1)
+        }
+
+
+class LiveSessionManager:
+    """
+    Live analysis sessions of this process.
+
+    Each session holds its own MediaPipe Pose instance, so their number is
+    capped; sessions nobody has sent frames to for `idle_timeout` seconds are
+    closed and discarded.
+
+    Sessions live only in this process's memory. Their IDs start with the
+    process's instance ID ("<instance>.<uuid>"), so a request that reaches
+    another process can be told apart from an unknown session, and a proxy can
+    route every request of a session to the instance that opened it.
+    """
+
+    def __init__(self, create_estimator: Callable[[], Any], rule_engine: FormRuleEngine,
+                 frame_budget: float = 0.15, max_sessions: int = 4, idle_timeout: float = 60.0,
+                 fps: float = 30.0, instance_id: Optional[str] = None):
+        """
+        Args:
+            create_estimator: Returns a new pose estimator with process(frame) and close()
+            rule_engine: Engine whose rules are evaluated online
+            frame_budget: Longest time in seconds from receiving a frame to reporting its errors
+            max_sessions: Most sessions open at once
+            idle_timeout: Seconds without frames after which a session is discarded
+            fps: Rate frame timestamps are quantized to
+            instance_id: Prefix of this process's session IDs; defaults to the process ID
+        """
+        self.create_estimator = create_estimator
+        self.rule_engine = rule_engine
+        self.frame_budget = frame_budget
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.fps = fps
+        self.instance_id = instance_id or f"{os.getpid():x}"
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", self.instance_id):
+            raise ValueError(f"Invalid live session instance ID: {self.instance_id}")
+
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, exercise_type: str, fitness_level: str, user_id: str) -> LiveSession:
+        if not self.rule_engine.supports(exercise_type):
+            raise ValueError(f"Unsupported exercise type for live analysis: {exercise_type}")
+
+        self._discard_idle()
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                raise SessionLimitError(f"{self.max_sessions} live sessions already running")
+            session_id = f"{self.instance_id}.{uuid.uuid4()}"
+            # Reserve the slot while the estimator loads
+            self._sessions[session_id] = None
+
+        try:
+            session = LiveSession(
+                session_id, exercise_type, fitness_level, user_id,
+                estimator=self.create_estimator(),
+                evaluator=OnlineRuleEvaluator(self.rule_engine, exercise_type, self.fps),
+                frame_budget=self.frame_budget
+            )
+        except Exception:
+            with self._lock:
+                self._sessions.pop(session_id, None)
+            raise
+
+        with self._lock:
+            self._sessions[session_id] = session
+
+        logger.info(f"Opened live {exercise_type} session {session_id}")
+        return session
+
+    def get(self, session_id: str) -> Optional[LiveSession]:
+        self._discard_idle()
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def owns(self, session_id: str) -> bool:
+        """Whether a session ID was issued by this process"""
+        return session_id.startswith(f"{self.instance_id}.")
+
+    def close(self, session_id: str) -> Optional[Tuple[LiveSession, List[Dict[str, Any]], Dict[str, Any]]]:
+        """Remove a session; returns it with its errors and statistics, or None if unknown"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            del self._sessions[session_id]
+
+        errors, stats = session.close()
+        logger.info(f"Closed live session {session_id}: {stats['frames_analyzed']} frames, {len(errors)} errors")
+        return session, errors, stats
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            sessions = [session for session in self._sessions.values() if session is not None]
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def _discard_idle(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            idle = [session for session in self._sessions.values()
+                    if session is not None and now - session.last_active > self.idle_timeout]
+            for session in idle:
+                del self._sessions[session.id]
+
+        for session in idle:
+            logger.info(f"Discarding idle live session {session.id}")
+            session.close()
@@ -1,50 +1,144 @@
 import logging
 import json
 import os
-from typing import Dict, List, Any, Tuple
+import threading
+from typing import Dict, List, Any, Tuple, Optional
 from openai import OpenAI
 
+from agents import telemetry
+from agents.feedback_cache import FeedbackCache
+
 logger = logging.getLogger(__name__)
 
+LLM_TOKENS = telemetry.metrics.counter(
+    "formfit_llm_tokens_total",
+    "Tokens used by LLM requests, by kind (prompt or completion)",
+    ("kind",)
+)
+
+DEFAULT_FORM_DESCRIPTION = "Maintain proper form throughout the exercise."
+
+# Structured output schema: the feedback and its form cues come back from one request
+FEEDBACK_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "submit_feedback",
+        "description": "Submit form feedback for the athlete together with the key form cues.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "feedback": {
+                    "type": "string",
+                    "description": "Detailed feedback for the athlete"
+                },
+                "form_cues": {
+                    "type": "string",
+                    "description": "The key form cues from the feedback in a concise format"
+                }
+            },
+            "required": ["feedback", "form_cues"]
+        }
+    }
+}
+
+# One request covering a whole session of clips: a summary plus feedback per clip
+SESSION_FEEDBACK_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "submit_session_feedback",
+        "description": "Submit coaching feedback for a training session of several clips.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "summary": {
+                    "type": "string",
+                    "description": "Overall coaching notes for the session: patterns across clips and priorities"
+                },
+                "clips": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "clip": {
+                                "type": "integer",
+                                "description": "Number of the clip, as given in the prompt"
+                            },
+                            "feedback": {
+                                "type": "string",
+                                "description": "Detailed feedback for this clip"
+                            },
+                            "form_cues": {
+                                "type": "string",
+                                "description": "The key form cues for this clip in a concise format"
+                            }
+                        },
+                        "required": ["clip", "feedback", "form_cues"]
+                    }
+                }
+            },
+            "required": ["summary", "clips"]
+        }
+    }
+}
+
 class LLMAgent:
-    def __init__(self):
+    def __init__(self, feedback_cache: Optional[FeedbackCache] = None, model: str = "gpt-4"):
         self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self.model = model
         self.conversation_history = {}
+        self._history_lock = threading.Lock()
+        # Responses for common error profiles are served from here instead of calling GPT-4
+        self.feedback_cache = feedback_cache
         logger.info("LLM Agent initialized with OpenAI")
     
-    def generate_feedback(self, errors: List[Dict[str, Any]], user_metadata: Dict[str, str]) -> Tuple[str, str]:
+    @telemetry.traced("llm.feedback")
+    def generate_feedback(self, errors: List[Dict[str, Any]], user_metadata: Dict[str, str],
+                          reps: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
         try:
+            cache_key = None
+            if self.feedback_cache is not None:
+                cache_key = self.feedback_cache.make_key(errors, user_metadata, reps)
+                cached = self.feedback_cache.get(cache_key)
+                if cached is not None:
+                    logger.info("Serving feedback from cache")
+                    return cached
+            
             user_id = user_metadata.get('user_id', 'anonymous')
+            prompt = self._format_prompt(errors, user_metadata, reps)
             
             # Get conversation history for this user
-            history = self.conversation_history.get(user_id, [])
+            with self._history_lock:
+                history = list(self.conversation_history.get(user_id, []))
             
             # Prepare the message for OpenAI
             messages = [
                 {"role": "system", "content": "You are an expert fitness coach providing form feedback."},
                 *history,
-                {"role": "user", "content": self._format_prompt(errors, user_metadata)}
+                {"role": "user", "content": prompt}
             ]
             
-            # Generate feedback using OpenAI
-            response = self.client.chat.completions.create(
-                model="gpt-4",
+            # Generate feedback and form cues in a single structured request
+            response = self._request(
                 messages=messages,
+                tools=[FEEDBACK_TOOL],
+                tool_choice={"type": "function", "function": {"name": "submit_feedback"}},
                 temperature=0.7,
-                max_tokens=500
+                max_tokens=600
             )
             
-            feedback = response.choices[0].message.content
+            feedback, form_description = self._parse_response(response.choices[0].message)
             
             # Update conversation history
-            history.extend([
-                {"role": "user", "content": self._format_prompt(errors, user_metadata)},
-                {"role": "assistant", "content": feedback}
-            ])
-            self.conversation_history[user_id] = history[-10:]  # Keep last 10 messages
+            with self._history_lock:
+                history = self.conversation_history.get(user_id, [])
+                history.extend([
+                    {"role": "user", "content": prompt},
+                    {"role": "assistant", "content": feedback}
+                ])
+                self.conversation_history[user_id] = history[-10:]  # Keep last 10 messages
             
-            # Extract form description from feedback
-            form_description = self._extract_form_description(feedback)
+            if cache_key is not None:
+                self.feedback_cache.put(cache_key, (feedback, form_description))
             
             return feedback, form_description
             
@@ -52,18 +146,149 @@ class LLMAgent:
             logger.error(f"Error generating feedback: {str(e)}")
             return (
                 "We analyzed your exercise form and noticed some areas for improvement. Focus on maintaining proper alignment and controlled movements.",
-                "Maintain proper form throughout the exercise."
+                DEFAULT_FORM_DESCRIPTION
             )
     
-    def _format_prompt(self, errors: List[Dict[str, Any]], user_metadata: Dict[str, str]) -> str:
+    @telemetry.traced("llm.session_feedback")
+    def generate_session_feedback(self, clips: List[Dict[str, Any]],
+                                  user_metadata: Dict[str, str]) -> Tuple[Optional[str], List[Tuple[str, str]]]:
+        """
+        Feedback for several clips of one session from a single request.
+        
+        Clips whose error profile is in the feedback cache are served from it.
+        The others are described together in one prompt, which asks for a
+        session summary and feedback for each of them. Clips the response
+        leaves out, or all of them if the request fails, fall back to
+        generate_feedback one by one.
+        
+        Args:
+            clips: Dicts with "errors", "exercise_type" and optionally "reps"
+            user_metadata: Fitness level and user ID shared by the clips
+            
+        Returns:
+            The session summary (None when every clip was cached), and
+            (feedback, form cues) for each clip in order
+        """
+        def clip_metadata(clip):
+            return {**user_metadata, "exercise_type": clip["exercise_type"]}
+        
+        results = [None] * len(clips)
+        keys = [None] * len(clips)
+        if self.feedback_cache is not None:
+            for index, clip in enumerate(clips):
+                keys[index] = self.feedback_cache.make_key(clip["errors"], clip_metadata(clip), clip.get("reps"))
+                results[index] = self.feedback_cache.get(keys[index])
+        
+        uncached = [index for index, result in enumerate(results) if result is None]
+        summary = None
+        
+        if uncached:
+            try:
+                prompt = self._format_session_prompt([clips[index] for index in uncached], user_metadata)
+                response = self._request(
+                    messages=[
+                        {"role": "system", "content": "You are an expert fitness coach providing form feedback."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    tools=[SESSION_FEEDBACK_TOOL],
+                    tool_choice={"type": "function", "function": {"name": "submit_session_feedback"}},
+                    temperature=0.7,
+                    max_tokens=min(4000, 300 + 450 * len(uncached))
+                )
+                
+                summary, feedback = self._parse_session_response(response.choices[0].message)
+                for number, index in enumerate(uncached, start=1):
+                    if number in feedback:
+                        results[index] = feedback[number]
+                        if keys[index] is not None:
+                            self.feedback_cache.put(keys[index], feedback[number])
+                
+                user_id = user_metadata.get('user_id', 'anonymous')
+                with self._history_lock:
+                    history = self.conversation_history.get(user_id, [])
+                    history.extend([
+                        {"role": "user", "content": prompt},
+                        {"role": "assistant", "content": summary}
+                    ])
+                    self.conversation_history[user_id] = history[-10:]
+                
+            except Exception as e:
+                logger.error(f"Error generating session feedback: {str(e)}")
+        
+        for index, clip in enumerate(clips):
+            if results[index] is None:
+                results[index] = self.generate_feedback(clip["errors"], clip_metadata(clip), clip.get("reps"))
+        
+        return summary, results
+    
+    def _request(self, **kwargs):
+        """One chat completion request, traced, with its token usage counted"""
+        tool = kwargs["tool_choice"]["function"]["name"]
+        with telemetry.span("llm.request", model=self.model, tool=tool) as span:
+            response = self.client.chat.completions.create(model=self.model, **kwargs)
+            
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                LLM_TOKENS.inc(usage.prompt_tokens or 0, kind="prompt")
+                LLM_TOKENS.inc(usage.completion_tokens or 0, kind="completion")
+                span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+            return response
+    
+    def _format_session_prompt(self, clips: List[Dict[str, Any]], user_metadata: Dict[str, str]) -> str:
+        fitness_level = user_metadata.get('fitness_level', 'beginner')
+        
+        sections = []
+        for number, clip in enumerate(clips, start=1):
+            reps = clip.get("reps")
+            if reps and reps.get("reps"):
+                details = self._summarize_reps(reps, clip["errors"])
+            else:
+                details = "Detected errors (time range, severity, confidence):\n        " + \
+                          self._summarize_errors(clip["errors"])
+            sections.append(f"Clip {number}: {clip['exercise_type']}\n        {details}")
+        
+        clip_details = "\n\n        ".join(sections)
+        return f"""
+        Please provide feedback for a {fitness_level} level training session of {len(clips)} clips.
+        
+        {clip_details}
+        
+        For the session summary, please include:
+        1. Overall assessment of the session
+        2. Patterns that repeat across clips
+        3. The most important thing to work on next
+        
+        For each clip, please include:
+        1. Specific corrections, referring to reps by number where given
+        2. Tips for improvement
+        3. Positive reinforcement
+        """
+    
+    def _format_prompt(self, errors: List[Dict[str, Any]], user_metadata: Dict[str, str],
+                       reps: Optional[Dict[str, Any]] = None) -> str:
         exercise_type = user_metadata.get('exercise_type', 'unknown')
         fitness_level = user_metadata.get('fitness_level', 'beginner')
         
-        prompt = f"""
+        if reps and reps.get("reps"):
+            # Rep-level summary instead of one line per error interval
+            prompt = f"""
+        Please provide detailed feedback for a {fitness_level} level {exercise_type} set.
+        
+        {self._summarize_reps(reps, errors)}
+        
+        Please include:
+        1. Overall assessment of the set
+        2. Specific corrections, referring to reps by number
+        3. Comments on tempo and range of motion
+        4. Tips for improvement
+        5. Positive reinforcement
+        """
+        else:
+            prompt = f"""
         Please provide detailed feedback for a {fitness_level} level {exercise_type} exercise.
         
-        Detected errors:
-        {json.dumps(errors, indent=2)}
+        Detected errors (time range, severity, confidence):
+        {self._summarize_errors(errors)}
         
         Please include:
         1. Overall assessment
@@ -74,20 +299,72 @@ class LLMAgent:
         
         return prompt
     
-    def _extract_form_description(self, feedback: str) -> str:
-        # Extract the key form cues from the feedback
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "Extract the key form cues from this feedback in a concise format."},
-                    {"role": "user", "content": feedback}
-                ],
-                temperature=0.3,
-                max_tokens=100
+    def _summarize_reps(self, reps: Dict[str, Any], errors: List[Dict[str, Any]]) -> str:
+        """Set totals, one line per rep with its tempo, range of motion, score and errors, and errors between reps"""
+        tempo = reps["tempo"]
+        phases = [name for name in tempo if name != "duration"]
+        
+        lines = [
+            f"{reps['count']} reps, {tempo['duration']}s per rep on average "
+            f"({', '.join(f'{name} {tempo[name]}s' for name in phases)}), "
+            f"range of motion {reps['range_of_motion']} ({reps['unit']}).",
+            "Reps (time range, tempo, range of motion, score, errors):"
+        ]
+        for rep in reps["reps"]:
+            flags = ", partial" if rep.get("partial") else ""
+            lines.append(
+                f"- Rep {rep['index']} {rep['start']}-{rep['end']}: "
+                f"{' / '.join(str(rep[name]) + 's' for name in phases)}, "
+                f"{rep['range_of_motion']}{flags}, score {rep.get('score')}: "
+                f"{', '.join(rep.get('errors') or []) or 'clean'}"
             )
-            
-            return response.choices[0].message.content
-        except Exception as e:
-            logger.error(f"Error extracting form description: {str(e)}")
-            return "Maintain proper form throughout the exercise."
\ No newline at end of file
+        
+        between = [
+            error for error in errors
+            if not any(error.get("start_time", -1) <= rep["end_time"] and error.get("end_time", -1) >= rep["start_time"]
+                       for rep in reps["reps"])
+        ]
+        if between:
+            lines.append("Errors outside the reps (time range, severity, confidence):")
+            lines.append(self._summarize_errors(between))
+        
+        return "\n        ".join(lines)
+    
+    def _summarize_errors(self, errors: List[Dict[str, Any]]) -> str:
+        """One compact line per error interval, to keep the prompt small"""
+        if not errors:
+            return "None"
+        
+        return "\n        ".join(
+            f"- {error.get('start', error.get('timestamp'))}-{error.get('end', error.get('timestamp'))} "
+            f"({error.get('severity')}, {error.get('confidence')}): {error.get('description')}"
+            for error in errors
+        )
+    
+    def _parse_session_response(self, message) -> Tuple[str, Dict[int, Tuple[str, str]]]:
+        """Read the session summary and per-clip feedback, by clip number, from the structured tool call"""
+        if not message.tool_calls:
+            raise ValueError("LLM response was not structured")
+        
+        arguments = json.loads(message.tool_calls[0].function.arguments)
+        feedback = {}
+        for clip in arguments.get("clips") or []:
+            if isinstance(clip, dict) and clip.get("feedback") and isinstance(clip.get("clip"), int):
+                feedback[clip["clip"]] = (clip["feedback"], clip.get("form_cues") or DEFAULT_FORM_DESCRIPTION)
+        
+        return arguments.get("summary") or "", feedback
+    
+    def _parse_response(self, message) -> Tuple[str, str]:
+        """Read the feedback and form cues from the structured tool call"""
+        if message.tool_calls:
+            arguments = json.loads(message.tool_calls[0].function.arguments)
+            feedback = arguments.get("feedback")
+            if feedback:
+                return feedback, arguments.get("form_cues") or DEFAULT_FORM_DESCRIPTION
+        
+        # The model answered in plain text instead of calling the tool
+        if message.content:
+            logger.warning("LLM response was not structured, using it as feedback text")
+            return message.content, DEFAULT_FORM_DESCRIPTION
+        
+        raise ValueError("Empty response from LLM")
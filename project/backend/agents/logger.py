@@ -1,10 +1,14 @@
 import logging
-import json
 import os
 import uuid
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 
+from agents import telemetry
+from agents.exercise_store import ExerciseStore, ALL_USERS
+from agents.record_index import RecordIndex
+from agents.segment_log import SegmentLog
+
 logger = logging.getLogger(__name__)
 
 class Logger:
@@ -12,23 +16,53 @@ class Logger:
     Stores analysis results, feedback, and model/image data for progress tracking.
     
     In a production system, this would use a proper database.
-    For this demo, we'll use in-memory storage with file backup.
+    For this demo, records go to append-only segment files and an in-memory index
+    of where each one is, which is restored from a snapshot after a restart.
     """
     
-    def __init__(self, data_dir: str = "data"):
+    def __init__(self, data_dir: str = "data", write_mode: str = "write_behind",
+                 flush_interval: float = 1.0, batch_size: int = 256, durability: str = "buffered",
+                 snapshot_interval: float = 300.0):
+        """
+        Args:
+            data_dir: Directory for persisted records
+            write_mode: "write_behind" to persist records in batches from a background
+                thread, or "sync" to write each record before returning
+            flush_interval: Longest time in seconds a record waits in memory (write-behind only)
+            batch_size: Largest number of records written in one batch
+            durability: "none", "buffered" or "fsync" after each batch
+            snapshot_interval: Seconds between snapshots of the record index
+        """
         self.data_dir = data_dir
         
         # Create data directory if it doesn't exist
         os.makedirs(data_dir, exist_ok=True)
         
-        # Initialize storage
-        self.error_data = {}
-        self.feedback_data = {}
-        self.visual_data = {}
-        self.exercise_data = {}
+        # Complete analyses live in an indexed on-disk store instead of memory
+        self.exercise_store = ExerciseStore(os.path.join(data_dir, "exercises.db"))
+        
+        self.segment_log = SegmentLog(
+            os.path.join(data_dir, "segments"),
+            write_mode=write_mode,
+            flush_interval=flush_interval,
+            batch_size=batch_size,
+            durability=durability,
+            on_written=self._on_written
+        )
+        
+        # Where each error, feedback and visual record sits in the segment log;
+        # rebuilt in the background from the latest snapshot plus the log after it
+        self.record_index = RecordIndex(
+            data_dir,
+            self.segment_log,
+            self.exercise_store,
+            snapshot_interval=snapshot_interval
+        )
+        self.record_index.start()
         
         logger.info(f"Logger initialized with data directory: {data_dir}")
     
+    @telemetry.traced("logger.store_errors")
     def store_error_data(self, user_id: Optional[str], exercise_type: str, errors: List[Dict[str, Any]]) -> None:
         """Store error data from Computer Vision Agent"""
         record_id = str(uuid.uuid4())
@@ -42,11 +76,11 @@ class Logger:
             "errors": errors
         }
         
-        self.error_data[record_id] = record
         self._save_to_file("error_data", record)
         
         logger.info(f"Stored error data with ID: {record_id}")
     
+    @telemetry.traced("logger.store_feedback")
     def store_feedback_data(self, user_id: Optional[str], exercise_type: str, 
                            feedback: str, form_description: str) -> None:
         """Store feedback data from LLM Agent"""
@@ -62,11 +96,11 @@ class Logger:
             "form_description": form_description
         }
         
-        self.feedback_data[record_id] = record
         self._save_to_file("feedback_data", record)
         
         logger.info(f"Stored feedback data with ID: {record_id}")
     
+    @telemetry.traced("logger.store_visual")
     def store_visual_data(self, user_id: Optional[str], exercise_type: str, 
                          visual_data: Dict[str, Any]) -> None:
         """Store visual data from Motion Capture Agent"""
@@ -81,11 +115,11 @@ class Logger:
             "visual_data": visual_data
         }
         
-        self.visual_data[record_id] = record
         self._save_to_file("visual_data", record)
         
         logger.info(f"Stored visual data with ID: {record_id}")
     
+    @telemetry.traced("logger.store_exercise")
     def store_exercise_data(self, user_id: Optional[str], exercise_type: str, 
                            fitness_level: str, result: Dict[str, Any]) -> str:
         """
@@ -107,7 +141,7 @@ class Logger:
             "date": datetime.now().strftime("%Y-%m-%d")
         }
         
-        self.exercise_data[record_id] = record
+        self.exercise_store.put(record)
         self._save_to_file("exercise_data", record)
         
         logger.info(f"Stored exercise data with ID: {record_id}")
@@ -115,7 +149,38 @@ class Logger:
     
     def get_exercise_data(self, exercise_id: str) -> Optional[Dict[str, Any]]:
         """Get exercise data by ID"""
-        return self.exercise_data.get(exercise_id)
+        record = self.exercise_store.get(exercise_id)
+        
+        # Legacy records may not have been imported yet while the index is restoring
+        if record is None and not self.record_index.ready:
+            record = self.record_index.get("exercise_data", exercise_id)
+        
+        return record
+    
+    def exercise_version(self, exercise_id: str) -> Optional[str]:
+        """
+        Version tag of a stored exercise, looked up without loading the record.
+        
+        Returns:
+            A tag that changes only if the record is replaced, or None if it isn't
+            in the exercise store (yet)
+        """
+        timestamp = self.exercise_store.record_version(exercise_id)
+        return f"{exercise_id}@{timestamp}" if timestamp else None
+    
+    def history_version(self, user_id: Optional[str] = None) -> str:
+        """
+        Version tag of a user's exercise history, or of every user's when user_id
+        is None or empty (the exercise store lists everyone's then too). It changes
+        whenever an exercise of theirs is stored, so listings and progress derived
+        from the history are unchanged while it is.
+        """
+        scope = user_id or ALL_USERS
+        return f"{scope}@{self.exercise_store.history_version(scope)}"
+    
+    def get_record(self, data_type: str, record_id: str) -> Optional[Dict[str, Any]]:
+        """Get an error, feedback or visual record by ID"""
+        return self.record_index.get(data_type, record_id)
     
     def get_exercises(self, user_id: Optional[str] = None, 
                      exercise_type: Optional[str] = None) -> List[Dict[str, Any]]:
@@ -123,30 +188,90 @@ class Logger:
         Get a list of exercises, optionally filtered by user ID and/or exercise type.
         
         Returns:
-            List of exercise data
+            List of exercise data, newest first
         """
-        exercises = list(self.exercise_data.values())
+        return self.exercise_store.query(user_id=user_id, exercise_type=exercise_type)
+    
+    def get_exercise_page(self, limit: int, user_id: Optional[str] = None,
+                          exercise_type: Optional[str] = None, since: Optional[str] = None,
+                          until: Optional[str] = None, cursor: Optional[str] = None,
+                          fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Get one page of exercises, newest first.
         
-        # Filter by user ID if provided
-        if user_id:
-            exercises = [ex for ex in exercises if ex["user_id"] == user_id]
+        Args:
+            limit: Page size
+            user_id: Only exercises of this user
+            exercise_type: Only exercises of this type
+            since: Only exercises at or after this ISO time
+            until: Only exercises at or before this ISO time
+            cursor: The next_cursor of the previous page
+            fields: Return only these fields instead of full records
+            
+        Returns:
+            {"exercises": [...], "next_cursor": ...}; next_cursor is None on the last page
+        """
+        return self.exercise_store.page(
+            limit,
+            user_id=user_id,
+            exercise_type=exercise_type,
+            since=since,
+            until=until,
+            cursor=cursor,
+            fields=fields
+        )
+    
+    def get_progress(self, user_id: Optional[str] = None, exercise_type: Optional[str] = None,
+                     days: int = 30) -> Optional[Dict[str, Any]]:
+        """
+        Get the progress aggregates of a user.
         
-        # Filter by exercise type if provided
-        if exercise_type:
-            exercises = [ex for ex in exercises if ex["exercise_type"] == exercise_type]
+        Args:
+            user_id: User ID, "anonymous" when omitted
+            exercise_type: One exercise type, or None for all of them
+            days: Number of most recent days of daily buckets
+            
+        Returns:
+            Progress summary, or None if the user has no matching exercises
+        """
+        user_id = user_id or "anonymous"
+        summary = self.exercise_store.progress(user_id, exercise_type, days)
         
-        # Sort by timestamp, newest first
-        exercises.sort(key=lambda x: x["timestamp"], reverse=True)
+        if summary is not None and exercise_type is None:
+            summary["exercise_types"] = self.exercise_store.exercise_types(user_id)
         
-        return exercises
+        return summary
+    
+    def rebuild_progress(self, user_id: Optional[str] = None) -> int:
+        """Recompute progress aggregates from the stored exercises; returns the number folded in"""
+        return self.exercise_store.rebuild_progress(user_id)
+    
+    def restore_status(self) -> Dict[str, Any]:
+        """Progress of rebuilding the record index after a restart"""
+        return self.record_index.status()
+    
+    def pending_writes(self) -> int:
+        """Records waiting to be written by the write-behind thread"""
+        return self.segment_log.pending()
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every stored record has been written to disk"""
+        return self.segment_log.flush(timeout)
+    
+    def close(self) -> None:
+        """Flush pending records and release the segment files; call on shutdown"""
+        self.segment_log.close()
+        self.record_index.close()
+        logger.info("Logger closed, all records flushed")
+    
+    def _on_written(self, data_type: str, path: str, locations) -> None:
+        self.record_index.record_written(data_type, path, locations)
     
     def _save_to_file(self, data_type: str, record: Dict[str, Any]) -> None:
-        """Save record to a JSON file"""
+        """Append record to the segment log"""
         try:
-            filename = os.path.join(self.data_dir, f"{data_type}_{record['id']}.json")
-            
-            with open(filename, 'w') as f:
-                json.dump(record, f, indent=2)
+            self.record_index.add_pending(data_type, record)
+            self.segment_log.append(data_type, record)
                 
         except Exception as e:
-            logger.error(f"Error saving {data_type} to file: {str(e)}")
\ No newline at end of file
+            logger.error(f"Error saving {data_type} to file: {str(e)}")
@@ -1,6 +1,8 @@
 import logging
 from typing import Dict, Any
 
+from agents import telemetry
+
 logger = logging.getLogger(__name__)
 
 class MotionCaptureAgent:
@@ -27,6 +29,7 @@ class MotionCaptureAgent:
         
         logger.info("Motion Capture Agent initialized")
     
+    @telemetry.traced("motion_capture.guidance")
     def get_guidance(self, form_description: str, exercise_type: str) -> Dict[str, Any]:
         """
         Generate or retrieve visual guidance for correct exercise form.
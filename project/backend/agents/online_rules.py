@@ -0,0 +1,206 @@
+import logging
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+from agents.form_rules import FormRuleEngine, format_error, release_margin
+from agents.landmarks import LandmarkSequence
+
+logger = logging.getLogger(__name__)
+
+
+class _Run:
+    """Frames of one violation interval as it grows"""
+
+    __slots__ = ("start_row", "end_row", "start_frame", "end_frame", "crossed",
+                 "frames", "total_confidence", "peak_confidence", "reported")
+
+    def __init__(self, row: int, frame_index: int):
+        self.start_row = self.end_row = row
+        self.start_frame = self.end_frame = frame_index
+        self.crossed = False
+        self.frames = 0
+        self.total_confidence = 0.0
+        self.peak_confidence = 0.0
+        self.reported = False
+
+    def add(self, row: int, frame_index: int, violating: bool, confidence: float) -> None:
+        self.end_row = row
+        self.end_frame = frame_index
+        if violating:
+            self.crossed = True
+            self.frames += 1
+            self.total_confidence += confidence
+            self.peak_confidence = max(self.peak_confidence, confidence)
+
+    def join(self, other: "_Run") -> None:
+        self.end_row = other.end_row
+        self.end_frame = other.end_frame
+        self.frames += other.frames
+        self.total_confidence += other.total_confidence
+        self.peak_confidence = max(self.peak_confidence, other.peak_confidence)
+        self.reported = self.reported or other.reported
+
+    def duration(self, fps: float) -> float:
+        return (self.end_frame - self.start_frame + 1) / fps
+
+    def interval(self, fps: float) -> Dict[str, Any]:
+        """Interval in the format of merge_violations"""
+        return {
+            "start_frame": int(self.start_frame),
+            "end_frame": int(self.end_frame),
+            "duration": round(float(self.duration(fps)), 2),
+            "frames": self.frames,
+            "peak_confidence": round(float(self.peak_confidence), 2),
+            "mean_confidence": round(float(self.total_confidence / max(self.frames, 1)), 2)
+        }
+
+
+class _RuleState:
+    def __init__(self, rule: Dict[str, Any], evaluate, min_duration: float):
+        self.rule = rule
+        self.evaluate = evaluate
+        self.release = release_margin(rule)
+        self.min_duration = rule.get("min_duration", min_duration)
+
+        # Holding run in progress, and the last interval it may still be joined to
+        self.run = None
+        self.interval = None
+
+
+class OnlineRuleEvaluator:
+    """
+    Evaluates the form rules of an exercise one frame at a time.
+
+    Uses the same compiled rules as FormRuleEngine, but instead of the whole
+    landmark sequence it keeps only the previous frame (for tempo checks) and,
+    per rule, the interval being built, so its state stays the same size
+    however long a live session runs. Intervals are opened, held, joined
+    across short gaps and filtered by duration as in merge_violations, and each
+    one is reported as soon as it has lasted long enough to survive the
+    filter. `finish` returns the complete error list in the format of
+    FormRuleEngine.evaluate.
+    """
+
+    def __init__(self, engine: FormRuleEngine, exercise_type: str, fps: float):
+        """
+        Args:
+            engine: Engine whose compiled rules, duration and gap settings are used
+            exercise_type: Exercise to check
+            fps: Rate of the frame numbers passed to `push`
+        """
+        self.exercise_type = exercise_type
+        self.fps = fps
+        self.max_gap_rows = int(engine.max_gap * fps)
+        self.states = [_RuleState(rule, evaluate, engine.min_duration)
+                       for rule, evaluate in engine.compiled_rules(exercise_type)]
+
+        self.rows = 0
+        self._previous = None
+        self._errors = []
+
+    def push(self, frame_index: int, landmarks: Optional[np.ndarray]) -> List[Dict[str, Any]]:
+        """
+        Evaluate one frame.
+
+        Args:
+            frame_index: Frame number at `fps`; must increase from call to call
+            landmarks: (33, 4) landmarks, or None when no pose was found
+
+        Returns:
+            Errors that became reportable with this frame
+        """
+        frames = [self._previous, (frame_index, landmarks)] if self._previous else [(frame_index, landmarks)]
+        sequence = LandmarkSequence.from_frames(frames, self.fps)
+        self._previous = (frame_index, landmarks)
+
+        row = self.rows
+        self.rows += 1
+
+        reported = []
+        for state in self.states:
+            excess, visibility = state.evaluate(sequence)
+            excess, visibility = excess[-1], visibility[-1]
+            confidence = state.rule["confidence"] * float(np.nan_to_num(visibility))
+
+            with np.errstate(invalid="ignore"):
+                violating = bool(excess > 0)
+                holding = bool(excess > -state.release)
+
+            if holding:
+                if state.run is None:
+                    state.run = _Run(row, frame_index)
+                state.run.add(row, frame_index, violating, confidence)
+            else:
+                self._end_run(state)
+
+            self._expire_interval(state, row)
+
+            error = self._report(state)
+            if error is not None:
+                reported.append(error)
+
+        return reported
+
+    def active(self) -> List[str]:
+        """Rules whose violation is ongoing at the latest frame"""
+        return [state.rule["id"] for state in self.states
+                if state.run is not None and state.run.crossed and state.run.end_row == self.rows - 1]
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Close every open interval and return all errors of the session, sorted by start"""
+        for state in self.states:
+            self._end_run(state)
+            self._close_interval(state)
+
+        errors = sorted(self._errors, key=lambda error: (error["start_frame"], error["end_frame"]))
+        self._errors = []
+        return errors
+
+    def _joinable(self, state: _RuleState, run: _Run) -> bool:
+        return state.interval is not None and run.start_row - state.interval.end_row - 1 <= self.max_gap_rows
+
+    def _end_run(self, state: _RuleState) -> None:
+        run, state.run = state.run, None
+        if run is None or not run.crossed:
+            return
+
+        if self._joinable(state, run):
+            state.interval.join(run)
+        else:
+            self._close_interval(state)
+            state.interval = run
+
+    def _expire_interval(self, state: _RuleState, row: int) -> None:
+        """Close the interval once no run can be joined to it any more"""
+        if state.interval is None or row - state.interval.end_row - 1 <= self.max_gap_rows:
+            return
+        if state.run is not None and self._joinable(state, state.run):
+            return
+        self._close_interval(state)
+
+    def _close_interval(self, state: _RuleState) -> None:
+        interval, state.interval = state.interval, None
+        if interval is not None and interval.duration(self.fps) >= state.min_duration:
+            self._errors.append(format_error(state.rule, interval.interval(self.fps), self.fps))
+
+    def _report(self, state: _RuleState) -> Optional[Dict[str, Any]]:
+        """The error being built, the first time it has lasted long enough to be kept"""
+        run = state.run if state.run is not None and state.run.crossed else None
+
+        if run is not None and self._joinable(state, run):
+            current = _Run(state.interval.start_row, state.interval.start_frame)
+            current.join(state.interval)
+            current.join(run)
+        else:
+            current = run or state.interval
+
+        if current is None or current.reported or current.duration(self.fps) < state.min_duration:
+            return None
+
+        # Mark the pieces the error is built from, so it is reported once however they merge
+        for piece in (run, state.interval if run is None or self._joinable(state, run) else None):
+            if piece is not None:
+                piece.reported = True
+
+        return format_error(state.rule, current.interval(self.fps), self.fps)
@@ -0,0 +1,124 @@
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from agents.landmarks import X, Y, Z, VISIBILITY
+
+# Crop box in source pixels: left, top, width, height
+Box = Tuple[int, int, int, int]
+
+
+class PersonROITracker:
+    """
+    Crops frames to the athlete before pose inference.
+
+    The box is taken from the previous frame's landmarks, padded on every side,
+    and kept until the body approaches its edge or fills much less of it, so
+    MediaPipe's own tracking sees a stable image. The crop is downscaled to at
+    most `dimension` pixels before it is color-converted and passed to the
+    model, and the landmarks are mapped back to normalized coordinates of the
+    full frame. Frames without a previous detection use the whole frame,
+    downscaled the same way.
+    """
+
+    def __init__(self, padding: float = 0.25, dimension: int = 480,
+                 min_visibility: float = 0.5, min_box_fraction: float = 0.2,
+                 shrink_ratio: float = 0.5):
+        """
+        Args:
+            padding: Margin added on each side of the body, as a fraction of its longest side
+            dimension: Longest side in pixels of the image handed to the model
+            min_visibility: Visibility a landmark needs to count toward the body's extent
+            min_box_fraction: Smallest box side, as a fraction of the frame's shorter side
+            shrink_ratio: Re-crop when a fresh box would be smaller than this fraction of the current one
+        """
+        self.padding = padding
+        self.dimension = dimension
+        self.min_visibility = min_visibility
+        self.min_box_fraction = min_box_fraction
+        self.shrink_ratio = shrink_ratio
+        self.box = None
+
+    def reset(self) -> None:
+        self.box = None
+
+    def crop(self, frame: np.ndarray) -> Tuple[np.ndarray, Box]:
+        """The region of the frame to run pose estimation on, and its box in the frame"""
+        height, width = frame.shape[:2]
+        left, top, box_width, box_height = self.box or (0, 0, width, height)
+        region = frame[top:top + box_height, left:left + box_width]
+
+        scale = self.dimension / max(box_width, box_height)
+        if scale < 1:
+            region = cv2.resize(region, (max(1, round(box_width * scale)), max(1, round(box_height * scale))),
+                                interpolation=cv2.INTER_AREA)
+
+        return region, (left, top, box_width, box_height)
+
+    def update(self, landmarks: Optional[np.ndarray], box: Box, frame_shape: Tuple[int, ...]) -> Optional[np.ndarray]:
+        """
+        Map landmarks found in a crop back to the full frame and move the box for the next frame.
+
+        Args:
+            landmarks: (33, 4) landmarks normalized to the crop, or None when no pose was found
+            box: Box the crop was taken from
+            frame_shape: Shape of the full frame
+
+        Returns:
+            The landmarks normalized to the full frame, or None
+        """
+        if landmarks is None:
+            # Search the whole frame again rather than a region the athlete has left
+            self.box = None
+            return None
+
+        height, width = frame_shape[:2]
+        left, top, box_width, box_height = box
+
+        mapped = landmarks.copy()
+        mapped[:, X] = (left + landmarks[:, X] * box_width) / width
+        mapped[:, Y] = (top + landmarks[:, Y] * box_height) / height
+        # MediaPipe scales depth like x
+        mapped[:, Z] = landmarks[:, Z] * box_width / width
+
+        self._follow(mapped, width, height)
+        return mapped
+
+    def _follow(self, landmarks: np.ndarray, width: int, height: int) -> None:
+        visible = landmarks[landmarks[:, VISIBILITY] >= self.min_visibility]
+        if len(visible) < 4:
+            visible = landmarks
+
+        xs = np.clip(visible[:, X] * width, 0, width)
+        ys = np.clip(visible[:, Y] * height, 0, height)
+        body = (xs.min(), ys.min(), xs.max(), ys.max())
+
+        margin = self.padding * max(body[2] - body[0], body[3] - body[1])
+        min_side = self.min_box_fraction * min(width, height)
+
+        center_x, center_y = (body[0] + body[2]) / 2, (body[1] + body[3]) / 2
+        half_width = max(body[2] - body[0] + 2 * margin, min_side) / 2
+        half_height = max(body[3] - body[1] + 2 * margin, min_side) / 2
+
+        left = int(max(0, center_x - half_width))
+        top = int(max(0, center_y - half_height))
+        right = int(min(width, np.ceil(center_x + half_width)))
+        bottom = int(min(height, np.ceil(center_y + half_height)))
+        if right <= left or bottom <= top:
+            self.box = None
+            return
+
+        # Keep the current box while the body stays inside it and it isn't much too large
+        if self.box is not None and self._contains(self.box, body, margin / 2):
+            if (right - left) * (bottom - top) >= self.shrink_ratio * self.box[2] * self.box[3]:
+                return
+
+        self.box = (left, top, right - left, bottom - top)
+
+    @staticmethod
+    def _contains(box: Box, body: Tuple[float, float, float, float], inset: float) -> bool:
+        """Whether the body stays at least `inset` pixels clear of the box's edges"""
+        left, top, box_width, box_height = box
+        return (body[0] - inset >= left and body[1] - inset >= top and
+                body[2] + inset <= left + box_width and body[3] + inset <= top + box_height)
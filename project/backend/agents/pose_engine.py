@@ -0,0 +1,604 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from agents import telemetry
+from agents.landmarks import LandmarkSequence, X, Y
+from agents.person_roi import PersonROITracker
+from agents.pose_quality import QUALITY_TIERS, MOTION_THUMBNAIL
+from agents.video_stream import VideoFrameStream
+
+logger = logging.getLogger(__name__)
+
+# Timed in the worker processes and recorded here when their segments come back
+POSE_FRAME_SECONDS = telemetry.metrics.histogram(
+    "formfit_pose_frame_seconds",
+    "Per-frame pose extraction time: waiting for the decoded frame, and model inference",
+    ("step",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.035, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0)
+)
+
+# Pose instances owned by the current worker process, created by the pool initializer
+_worker_poses = None
+
+
+def _create_pose(pose_options: Dict[str, Any]):
+    # Imported here so only processes that run pose estimation pay for MediaPipe
+    import mediapipe as mp
+    return mp.solutions.pose.Pose(static_image_mode=False, **pose_options)
+
+
+class _PoseSet:
+    """MediaPipe Pose instances of one process, one per model complexity, created on first use"""
+
+    def __init__(self, pose_options: Dict[str, Any]):
+        self.pose_options = pose_options
+        self._poses = {}
+
+    def get(self, model_complexity: int):
+        pose = self._poses.get(model_complexity)
+        if pose is None:
+            pose = _create_pose({**self.pose_options, "model_complexity": model_complexity})
+            self._poses[model_complexity] = pose
+        return pose
+
+    def reset(self) -> None:
+        for pose in self._poses.values():
+            pose.reset()
+
+    def close(self) -> None:
+        for pose in self._poses.values():
+            pose.close()
+        self._poses.clear()
+
+
+def default_start_method() -> str:
+    """Start method for worker pools. Never fork: the child would inherit locks held by other threads"""
+    return "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _init_worker(pose_options: Dict[str, Any]) -> None:
+    global _worker_poses
+    _worker_poses = _PoseSet(pose_options)
+    _worker_poses.get(pose_options["model_complexity"])
+
+
+def _run_segment_in_worker(task: Dict[str, Any]) -> Tuple[LandmarkSequence, Dict[str, int], Dict[str, Any]]:
+    return _process_segment(_worker_poses, task)
+
+
+def _timed(frames: VideoFrameStream, durations: List[float]) -> Iterator[Tuple[int, np.ndarray]]:
+    """Iterate over the frames, recording how long each one was waited for"""
+    iterator = iter(frames)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        durations.append(time.perf_counter() - started)
+        yield item
+
+
+def _process_segment(poses: _PoseSet, task: Dict[str, Any]
+                     ) -> Tuple[LandmarkSequence, Dict[str, int], Dict[str, Any]]:
+    """
+    Run pose estimation over one time segment of a video.
+
+    Tracking state, including the person crop, is reset first and then primed on the warm-up frames just
+    before the segment, whose output is discarded, so every segment starts from
+    the same state no matter which worker runs it or what it ran before.
+    Keyframes are chosen by analysis frame number and by motion within the
+    segment, so they are the same for any number of workers too.
+
+    Returns:
+        The segment's landmarks, how many frames ran the full model, ran the
+        light model or were interpolated, and per-frame decode and inference
+        timings for the parent process to record
+    """
+    started_at = time.time()
+    started = time.perf_counter()
+    poses.reset()
+    tier = QUALITY_TIERS[task["quality"]]
+    full_pose = poses.get(task["model_complexity"])
+    light_pose = poses.get(task["light_complexity"]) if tier["between"] == "light" else None
+    roi = PersonROITracker(**task["roi"]) if task["roi"] else None
+
+    frames = VideoFrameStream(
+        task["video_path"],
+        frame_stride=task["frame_stride"],
+        max_dimension=task["max_dimension"],
+        prefetch=task["prefetch"],
+        start_frame=task["warmup_start"],
+        end_frame=task["end_frame"]
+    )
+
+    counts = {"full": 0, "light": 0, "interpolated": 0}
+    timings = {"decode": [], "inference": []}
+    landmark_frames = []
+    keyframe = None
+    pending = []
+    last_pending_frame = None
+    previous_thumbnail = None
+
+    def emit(frame_index, landmarks):
+        if frame_index >= task["start_frame"]:
+            landmark_frames.append((frame_index, landmarks))
+
+    def infer(pose, frame):
+        inference_started = time.perf_counter()
+        landmarks = _infer(pose, roi, frame)
+        timings["inference"].append(time.perf_counter() - inference_started)
+        return landmarks
+
+    def run_keyframe(frame_index, frame):
+        nonlocal keyframe
+        landmarks = infer(full_pose, frame)
+        counts["full"] += 1
+
+        # Frames skipped since the previous keyframe are filled in between the two
+        for pending_index in pending:
+            emit(pending_index, _interpolate(keyframe, (frame_index, landmarks), pending_index))
+            counts["interpolated"] += 1
+        pending.clear()
+
+        keyframe = (frame_index, landmarks)
+        emit(frame_index, landmarks)
+
+    for frame_index, frame in _timed(frames, timings["decode"]):
+        is_keyframe = keyframe is None or (frame_index // task["frame_stride"]) % tier["keyframe_interval"] == 0
+
+        if tier["motion_threshold"] is not None:
+            thumbnail = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY),
+                                   (MOTION_THUMBNAIL, MOTION_THUMBNAIL), interpolation=cv2.INTER_AREA)
+            if previous_thumbnail is not None and cv2.absdiff(thumbnail, previous_thumbnail).mean() > tier["motion_threshold"]:
+                is_keyframe = True
+            previous_thumbnail = thumbnail
+
+        if is_keyframe:
+            run_keyframe(frame_index, frame)
+        elif light_pose is not None:
+            emit(frame_index, infer(light_pose, frame))
+            counts["light"] += 1
+        else:
+            pending.append(frame_index)
+            last_pending_frame = frame
+
+    # The segment's last frame closes the final interpolation gap
+    if pending:
+        last_index = pending.pop()
+        run_keyframe(last_index, last_pending_frame)
+
+    timings.update(started_at=started_at, seconds=time.perf_counter() - started, pid=os.getpid(),
+                   start_frame=task["start_frame"])
+    return LandmarkSequence.from_frames(landmark_frames, frames.fps), counts, timings
+
+
+def _infer(pose, roi: Optional[PersonROITracker], frame: np.ndarray) -> Optional[np.ndarray]:
+    """Landmarks of one BGR frame, normalized to the full frame"""
+    if roi is None:
+        return _to_array(pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+
+    # Only the athlete's region is color-converted and handed to the model
+    region, box = roi.crop(frame)
+    landmarks = _to_array(pose.process(cv2.cvtColor(region, cv2.COLOR_BGR2RGB)))
+    return roi.update(landmarks, box, frame.shape)
+
+
+def _interpolate(start, end, frame_index: int) -> Optional[np.ndarray]:
+    """Landmarks linearly interpolated between two keyframes, or None unless both have a pose"""
+    (start_index, start_landmarks), (end_index, end_landmarks) = start, end
+    if start_landmarks is None or end_landmarks is None:
+        return None
+
+    weight = (frame_index - start_index) / (end_index - start_index)
+    return start_landmarks + (end_landmarks - start_landmarks) * np.float32(weight)
+
+
+def _to_array(results) -> Optional[np.ndarray]:
+    """Convert MediaPipe results to a (33, 4) array of normalized x, y, z and visibility"""
+    if not results.pose_landmarks:
+        return None
+
+    return np.array(
+        [(point.x, point.y, point.z, point.visibility) for point in results.pose_landmarks.landmark],
+        dtype=np.float32
+    )
+
+
+class LivePoseEstimator:
+    """
+    Pose estimation on frames as they arrive, for one live session.
+
+    Owns a MediaPipe Pose instance in the calling process, so tracking carries
+    over from frame to frame; it is not thread-safe and must be closed.
+    """
+
+    def __init__(self, pose_options: Dict[str, Any], roi_options: Optional[Dict[str, Any]] = None):
+        self.pose = _create_pose(pose_options)
+        self.roi = PersonROITracker(**roi_options) if roi_options else None
+
+    def process(self, frame: np.ndarray) -> Optional[np.ndarray]:
+        """(33, 4) landmarks of a BGR frame, or None when no pose was found"""
+        started = time.perf_counter()
+        landmarks = _infer(self.pose, self.roi, frame)
+        POSE_FRAME_SECONDS.observe(time.perf_counter() - started, step="live_inference")
+        return landmarks
+
+    def close(self) -> None:
+        self.pose.close()
+
+
+class PoseEngine:
+    """
+    Extracts pose landmarks from a video on a pool of worker processes.
+
+    The video is split into fixed-length time segments, each processed by a
+    worker process with its own MediaPipe Pose instance. Segment boundaries depend
+    only on the video and `segment_seconds`, never on the number of workers, so
+    the merged landmark sequence is identical for any pool size, including the
+    in-process path used when `num_workers` is 0.
+
+    The quality tier (see QUALITY_TIERS) trades accuracy for speed by running
+    the full model only on keyframes; `compare` measures the speedup and the
+    landmark error of a tier against "accurate" on a given video. With
+    `person_roi`, inference runs on a crop around the athlete (see
+    PersonROITracker) instead of the whole frame.
+    """
+
+    def __init__(self, num_workers: Optional[int] = None, segment_seconds: float = 10.0,
+                 warmup_frames: int = 15, model_complexity: int = 2,
+                 min_detection_confidence: float = 0.5, min_tracking_confidence: float = 0.5,
+                 frame_stride: int = 1, target_fps: Optional[float] = None,
+                 max_frame_dimension: Optional[int] = None, prefetch_frames: int = 8,
+                 start_method: Optional[str] = None, quality: str = "accurate",
+                 light_complexity: int = 0, person_roi: bool = True,
+                 roi_padding: float = 0.25, roi_dimension: int = 480):
+        """
+        Args:
+            num_workers: Worker processes; defaults to the CPU count, 0 runs in-process
+            segment_seconds: Length of the video segment handed to one worker
+            warmup_frames: Analysis frames before each segment used to prime tracking
+            model_complexity: MediaPipe Pose model complexity (0-2)
+            min_detection_confidence: MediaPipe detection threshold
+            min_tracking_confidence: MediaPipe tracking threshold
+            frame_stride: Analyze every n-th frame
+            target_fps: Analysis frame rate; overrides frame_stride when set
+            max_frame_dimension: Downscale frames so their longest side is at most this many pixels
+            prefetch_frames: Decoded frames buffered ahead of inference
+            start_method: multiprocessing start method for the pool; defaults to forkserver
+                (spawn where that's unavailable), since the server has threads running
+                by the time the pool starts and forking would copy their held locks
+            quality: Default quality tier, "fast", "balanced" or "accurate"
+            light_complexity: Model complexity used between keyframes in the "balanced" tier
+            person_roi: Crop frames to the athlete tracked from the previous frame before inference
+            roi_padding: Margin around the athlete, as a fraction of the body's longest side
+            roi_dimension: Longest side in pixels of the crop handed to the model
+        """
+        if quality not in QUALITY_TIERS:
+            raise ValueError(f"Unknown quality tier: {quality}")
+
+        self.num_workers = (os.cpu_count() or 1) if num_workers is None else num_workers
+        self.segment_seconds = segment_seconds
+        self.warmup_frames = warmup_frames
+        self.frame_stride = frame_stride
+        self.target_fps = target_fps
+        self.max_frame_dimension = max_frame_dimension
+        self.prefetch_frames = prefetch_frames
+        self.start_method = start_method or default_start_method()
+        self.quality = quality
+        self.light_complexity = light_complexity
+        self.roi_options = {"padding": roi_padding, "dimension": roi_dimension} if person_roi else None
+
+        self.pose_options = {
+            "model_complexity": model_complexity,
+            "min_detection_confidence": min_detection_confidence,
+            "min_tracking_confidence": min_tracking_confidence
+        }
+
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+        logger.info(f"Pose engine initialized with {self.num_workers} workers, "
+                    f"{segment_seconds}s segments")
+
+    def extract(self, video_path: str, quality: Optional[str] = None) -> LandmarkSequence:
+        """
+        Extract landmarks for every analysis frame of a video.
+
+        Args:
+            video_path: Path to the video file
+            quality: Quality tier; defaults to the engine's
+
+        Returns:
+            LandmarkSequence in frame order, including frames without a detection
+        """
+        return self.extract_with_stats(video_path, quality)[0]
+
+    def extract_with_stats(self, video_path: str,
+                           quality: Optional[str] = None) -> Tuple[LandmarkSequence, Dict[str, int]]:
+        """extract(), also returning how many frames ran the full or light model or were interpolated"""
+        quality = quality or self.quality
+        if quality not in QUALITY_TIERS:
+            raise ValueError(f"Unknown quality tier: {quality}")
+
+        with telemetry.span("pose.extract", quality=quality, workers=self.num_workers) as span:
+            stream = VideoFrameStream(video_path, frame_stride=self.frame_stride, target_fps=self.target_fps)
+            tasks = self._plan_segments(video_path, stream, quality)
+            span.set(segments=len(tasks))
+
+            if self.num_workers > 0:
+                submitted = [(task, *self._submit(task)) for task in tasks]
+                segments = [self._segment_result(task, pool, future) for task, pool, future in submitted]
+            else:
+                # Each call gets its own Pose instances, so concurrent requests never share tracking state
+                poses = _PoseSet(self.pose_options)
+                try:
+                    segments = [_process_segment(poses, task) for task in tasks]
+                finally:
+                    poses.close()
+
+            return self._merge_segments(segments, stream.fps, quality)
+
+    def extract_many(self, video_paths: List[str], quality: Optional[str] = None
+                     ) -> Iterator[Tuple[int, Optional[LandmarkSequence], Optional[Exception]]]:
+        """
+        Extract landmarks for several videos, yielding each as soon as it is done.
+
+        Every segment of every video is submitted to the worker pool up front, in
+        video order, so the pool stays busy across video boundaries instead of
+        idling on the last segments of each video, and the first videos finish
+        first. Segments are planned exactly as in `extract`, so each sequence is
+        identical to extracting the video on its own.
+
+        Args:
+            video_paths: Paths to the video files
+            quality: Quality tier; defaults to the engine's
+
+        Yields:
+            (index into video_paths, sequence, None), or (index, None, exception)
+            for a video that couldn't be processed, in completion order
+        """
+        quality = quality or self.quality
+        if quality not in QUALITY_TIERS:
+            raise ValueError(f"Unknown quality tier: {quality}")
+
+        if self.num_workers == 0:
+            for index, video_path in enumerate(video_paths):
+                try:
+                    yield index, self.extract(video_path, quality), None
+                except Exception as e:
+                    yield index, None, e
+            return
+
+        futures = {}
+        videos = {}
+        unreadable = []
+        submitted_at = time.time()
+        submitted = time.perf_counter()
+
+        for index, video_path in enumerate(video_paths):
+            try:
+                stream = VideoFrameStream(video_path, frame_stride=self.frame_stride, target_fps=self.target_fps)
+                tasks = self._plan_segments(video_path, stream, quality)
+            except Exception as e:
+                unreadable.append((index, e))
+                continue
+
+            videos[index] = {"fps": stream.fps, "segments": [None] * len(tasks), "remaining": len(tasks)}
+            for position, task in enumerate(tasks):
+                pool, future = self._submit(task)
+                futures[future] = (index, position, task, pool)
+
+        for index, error in unreadable:
+            yield index, None, error
+
+        for future in as_completed(futures):
+            index, position, task, pool = futures[future]
+            video = videos.get(index)
+            if video is None:
+                # An earlier segment of this video failed
+                continue
+
+            try:
+                video["segments"][position] = self._segment_result(task, pool, future)
+            except Exception as e:
+                del videos[index]
+                yield index, None, e
+                continue
+
+            video["remaining"] -= 1
+            if video["remaining"] == 0:
+                del videos[index]
+                sequence = self._merge_segments(video["segments"], video["fps"], quality)[0]
+                # Timed from submission, so it includes waiting behind the other videos' segments
+                telemetry.record_span("pose.extract", time.perf_counter() - submitted, submitted_at,
+                                      quality=quality, workers=self.num_workers, video=index,
+                                      segments=len(video["segments"]))
+                yield index, sequence, None
+
+    def compare(self, video_path: str, quality: str) -> Dict[str, Any]:
+        """
+        Speedup and landmark error of a quality tier against the "accurate" baseline.
+
+        Landmark error is the distance between the tier's and the baseline's
+        normalized x/y coordinates, over frames where both found a pose.
+
+        Args:
+            video_path: Path to the video file
+            quality: Quality tier to evaluate
+
+        Returns:
+            Report with timings, frame counts, speedup and error statistics
+        """
+        started = time.perf_counter()
+        baseline, _ = self.extract_with_stats(video_path, "accurate")
+        baseline_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        candidate, counts = self.extract_with_stats(video_path, quality)
+        seconds = time.perf_counter() - started
+
+        both = baseline.detected & candidate.detected
+        distances = np.linalg.norm(
+            candidate.data[both, :, X:Y + 1] - baseline.data[both, :, X:Y + 1], axis=-1
+        ).ravel()
+
+        return {
+            "video": os.path.basename(video_path),
+            "quality": quality,
+            "frames": len(candidate),
+            "inference": counts,
+            "baseline_seconds": round(baseline_seconds, 3),
+            "seconds": round(seconds, 3),
+            "speedup": round(baseline_seconds / seconds, 2) if seconds > 0 else None,
+            "landmark_error": {
+                "mean": round(float(distances.mean()), 5) if distances.size else None,
+                "p95": round(float(np.percentile(distances, 95)), 5) if distances.size else None,
+                "max": round(float(distances.max()), 5) if distances.size else None
+            },
+            "detection_agreement": round(float((baseline.detected == candidate.detected).mean()), 4)
+            if len(baseline) else None
+        }
+
+    def live_estimator(self, model_complexity: Optional[int] = None) -> LivePoseEstimator:
+        """
+        A pose estimator for frames streamed one at a time, running in this process.
+
+        Args:
+            model_complexity: Model complexity; defaults to the engine's
+        """
+        options = dict(self.pose_options)
+        if model_complexity is not None:
+            options["model_complexity"] = model_complexity
+        return LivePoseEstimator(options, self.roi_options)
+
+    def signature(self, quality: Optional[str] = None) -> str:
+        """Short hash of every setting that affects extracted landmarks, for cache keys"""
+        quality = quality or self.quality
+        settings = {
+            "pose": self.pose_options,
+            "quality": QUALITY_TIERS[quality],
+            "light_complexity": self.light_complexity if QUALITY_TIERS[quality]["between"] == "light" else None,
+            "roi": self.roi_options,
+            "segment_seconds": self.segment_seconds,
+            "warmup_frames": self.warmup_frames,
+            "frame_stride": self.frame_stride,
+            "target_fps": self.target_fps,
+            "max_frame_dimension": self.max_frame_dimension
+        }
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+    def start(self) -> None:
+        """
+        Start the worker processes and load their models ahead of the first request.
+
+        Workers come from a forkserver or are spawned, so this is safe to call
+        while other threads are running.
+        """
+        if self.num_workers > 0:
+            pool = self._get_pool()
+            list(pool.map(int, range(self.num_workers)))
+
+    def close(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+    def _plan_segments(self, video_path: str, stream: VideoFrameStream, quality: str) -> List[Dict[str, Any]]:
+        stride = stream.frame_stride
+
+        # Segments start on a multiple of the stride so the sampled frames match a single pass
+        segment_frames = max(stride, int(round(self.segment_seconds * stream.fps / stride)) * stride)
+        warmup = self.warmup_frames * stride
+
+        # Frame counts reported by containers are estimates; the last segment always runs to the end
+        segment_starts = list(range(0, max(stream.frame_count, 1), segment_frames))
+
+        tasks = []
+        for i, start in enumerate(segment_starts):
+            is_last = i == len(segment_starts) - 1
+            tasks.append({
+                "video_path": video_path,
+                "start_frame": start,
+                "warmup_start": max(0, start - warmup),
+                "end_frame": None if is_last else start + segment_frames,
+                "frame_stride": stride,
+                "max_dimension": self.max_frame_dimension,
+                "prefetch": self.prefetch_frames,
+                "quality": quality,
+                "model_complexity": self.pose_options["model_complexity"],
+                "light_complexity": self.light_complexity,
+                "roi": self.roi_options
+            })
+
+        return tasks
+
+    @staticmethod
+    def _merge_segments(segments: List[Tuple[LandmarkSequence, Dict[str, int], Dict[str, Any]]], fps: float,
+                        quality: str) -> Tuple[LandmarkSequence, Dict[str, int]]:
+        counts = {"full": 0, "light": 0, "interpolated": 0}
+        for segment, segment_counts, timings in segments:
+            for key, value in segment_counts.items():
+                counts[key] += value
+
+            POSE_FRAME_SECONDS.observe_many(timings["decode"], step="decode")
+            POSE_FRAME_SECONDS.observe_many(timings["inference"], step="inference")
+            telemetry.record_span("pose.segment", timings["seconds"], timings["started_at"],
+                                  worker_pid=timings["pid"], start_frame=timings["start_frame"],
+                                  frames=len(segment), inferences=len(timings["inference"]),
+                                  decode_ms=round(sum(timings["decode"]) * 1000, 1),
+                                  inference_ms=round(sum(timings["inference"]) * 1000, 1))
+
+        sequence = LandmarkSequence.concatenate([segment for segment, _, _ in segments], fps)
+        logger.info(f"Extracted {len(sequence)} frames at {quality} quality: {counts['full']} full, "
+                    f"{counts['light']} light, {counts['interpolated']} interpolated")
+        return sequence, counts
+
+    def _submit(self, task: Dict[str, Any]) -> Tuple[ProcessPoolExecutor, Future]:
+        pool = self._get_pool()
+        try:
+            return pool, pool.submit(_run_segment_in_worker, task)
+        except BrokenProcessPool:
+            self._discard_pool(pool)
+            pool = self._get_pool()
+            return pool, pool.submit(_run_segment_in_worker, task)
+
+    def _segment_result(self, task: Dict[str, Any], pool: ProcessPoolExecutor, future: Future):
+        """A segment's result; if a worker died, the pool is replaced and the segment run once more"""
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            logger.warning(f"A pose worker died, restarting the pool and retrying the segment "
+                           f"at frame {task['start_frame']} of {task['video_path']}")
+            self._discard_pool(pool)
+            return self._get_pool().submit(_run_segment_in_worker, task).result()
+
+    def _discard_pool(self, pool: ProcessPoolExecutor) -> None:
+        """Drop a broken pool so the next _get_pool starts a new one"""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker,
+                    initargs=(self.pose_options,)
+                )
+            return self._pool
@@ -0,0 +1,13 @@
+# Quality tiers for pose inference. Keyframes (every `keyframe_interval`-th
+# analysis frame, and any frame where the picture changes by more than
+# `motion_threshold` grey levels on average) always run the full model. Frames
+# in between run the light model ("light") or are linearly interpolated from the
+# surrounding keyframes ("interpolate").
+QUALITY_TIERS = {
+    "fast": {"keyframe_interval": 6, "between": "interpolate", "motion_threshold": 12.0},
+    "balanced": {"keyframe_interval": 3, "between": "light", "motion_threshold": 8.0},
+    "accurate": {"keyframe_interval": 1, "between": None, "motion_threshold": None}
+}
+
+# Side of the greyscale thumbnail that motion is measured on
+MOTION_THUMBNAIL = 64
@@ -0,0 +1,303 @@
+import logging
+import sqlite3
+from datetime import date, timedelta
+from typing import Dict, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Aggregates over every exercise type of a user are kept under this type
+ALL_EXERCISES = "*"
+
+ROLLING_WINDOWS = (7, 30)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS progress_totals (
+    user_id TEXT NOT NULL,
+    exercise_type TEXT NOT NULL,
+    sessions INTEGER NOT NULL,
+    score_sum INTEGER NOT NULL,
+    scored_sessions INTEGER NOT NULL,
+    best_score INTEGER,
+    best_exercise_id TEXT,
+    best_timestamp TEXT,
+    first_timestamp TEXT,
+    last_timestamp TEXT,
+    last_date TEXT,
+    current_streak INTEGER NOT NULL,
+    longest_streak INTEGER NOT NULL,
+    PRIMARY KEY (user_id, exercise_type)
+);
+CREATE TABLE IF NOT EXISTS progress_daily (
+    user_id TEXT NOT NULL,
+    exercise_type TEXT NOT NULL,
+    date TEXT NOT NULL,
+    sessions INTEGER NOT NULL,
+    score_sum INTEGER NOT NULL,
+    scored_sessions INTEGER NOT NULL,
+    best_score INTEGER,
+    PRIMARY KEY (user_id, exercise_type, date)
+);
+CREATE TABLE IF NOT EXISTS progress_errors (
+    user_id TEXT NOT NULL,
+    exercise_type TEXT NOT NULL,
+    error_type TEXT NOT NULL,
+    occurrences INTEGER NOT NULL,
+    sessions INTEGER NOT NULL,
+    last_seen TEXT,
+    PRIMARY KEY (user_id, exercise_type, error_type)
+);
+CREATE INDEX IF NOT EXISTS idx_progress_errors_rank
+    ON progress_errors (user_id, exercise_type, occurrences);
+"""
+
+
+class ProgressAggregates:
+    """
+    Per-user, per-exercise progress aggregates kept in the exercise database.
+
+    Every stored exercise is folded into running totals (session count, score
+    sum, personal best, streaks), a bucket for its day and counters for each
+    error type, inside the same transaction as the exercise itself. Reading a
+    user's progress then touches a fixed number of rows: one totals row, at most
+    `days` daily buckets and the top few error counters, however long the
+    history is. Totals are also kept across all exercise types under
+    ALL_EXERCISES.
+    """
+
+    def __init__(self, top_errors: int = 5):
+        """
+        Args:
+            top_errors: Number of most frequent error types reported
+        """
+        self.top_errors = top_errors
+
+    def create_schema(self, connection: sqlite3.Connection) -> None:
+        connection.executescript(SCHEMA)
+
+    def is_empty(self, connection: sqlite3.Connection) -> bool:
+        return connection.execute("SELECT 1 FROM progress_totals LIMIT 1").fetchone() is None
+
+    def apply(self, connection: sqlite3.Connection, record: Dict[str, Any]) -> None:
+        """Fold one new exercise record into the aggregates; caller owns the transaction"""
+        user_id = record["user_id"]
+        timestamp = record["timestamp"]
+        day = self._day(record)
+        result = record.get("result") or {}
+        score = result.get("score")
+        scored = 1 if isinstance(score, (int, float)) else 0
+        score = int(score) if scored else None
+
+        error_counts = {}
+        for error in result.get("errors") or []:
+            error_type = str(error.get("type") or error.get("description") or "unknown")
+            error_counts[error_type] = error_counts.get(error_type, 0) + 1
+
+        for exercise_type in (record["exercise_type"], ALL_EXERCISES):
+            key = (user_id, exercise_type)
+            new_day = self._add_to_day(connection, key, day, score, scored)
+            self._add_to_totals(connection, key, record["id"], timestamp, day, score, scored, new_day)
+
+            for error_type, occurrences in error_counts.items():
+                connection.execute(
+                    "INSERT INTO progress_errors "
+                    "(user_id, exercise_type, error_type, occurrences, sessions, last_seen) "
+                    "VALUES (?, ?, ?, ?, 1, ?) "
+                    "ON CONFLICT (user_id, exercise_type, error_type) DO UPDATE SET "
+                    "occurrences = occurrences + excluded.occurrences, "
+                    "sessions = sessions + 1, "
+                    "last_seen = MAX(COALESCE(last_seen, ''), excluded.last_seen)",
+                    (*key, error_type, occurrences, timestamp)
+                )
+
+    def clear(self, connection: sqlite3.Connection, user_id: Optional[str] = None) -> None:
+        """Delete the aggregates of one user, or of everyone"""
+        for table in ("progress_totals", "progress_daily", "progress_errors"):
+            if user_id is None:
+                connection.execute(f"DELETE FROM {table}")
+            else:
+                connection.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+
+    def summary(self, connection: sqlite3.Connection, user_id: str,
+                exercise_type: Optional[str] = None, days: int = 30,
+                today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+        """
+        Progress of a user for one exercise type, or across all of them.
+
+        Args:
+            connection: Exercise database connection
+            user_id: User to report on
+            exercise_type: Exercise type, or None for all exercises
+            days: Number of most recent days of daily buckets returned
+            today: Reference date for the windows and the current streak
+
+        Returns:
+            Summary dict, or None if the user has no exercises of this type
+        """
+        today = today or date.today()
+        key = (user_id, exercise_type or ALL_EXERCISES)
+
+        totals = connection.execute(
+            "SELECT sessions, score_sum, scored_sessions, best_score, best_exercise_id, best_timestamp, "
+            "first_timestamp, last_timestamp, last_date, current_streak, longest_streak "
+            "FROM progress_totals WHERE user_id = ? AND exercise_type = ?", key
+        ).fetchone()
+        if totals is None:
+            return None
+
+        (sessions, score_sum, scored_sessions, best_score, best_exercise_id, best_timestamp,
+         first_timestamp, last_timestamp, last_date, current_streak, longest_streak) = totals
+
+        window = max(days, *ROLLING_WINDOWS)
+        buckets = connection.execute(
+            "SELECT date, sessions, score_sum, scored_sessions, best_score FROM progress_daily "
+            "WHERE user_id = ? AND exercise_type = ? AND date > ? ORDER BY date",
+            (*key, (today - timedelta(days=window)).isoformat())
+        ).fetchall()
+
+        rolling = {}
+        for length in ROLLING_WINDOWS:
+            start = (today - timedelta(days=length)).isoformat()
+            in_window = [bucket for bucket in buckets if bucket[0] > start]
+            scored_in_window = sum(bucket[3] for bucket in in_window)
+            rolling[f"{length}d"] = (
+                round(sum(bucket[2] for bucket in in_window) / scored_in_window, 1)
+                if scored_in_window else None
+            )
+
+        daily_start = (today - timedelta(days=days)).isoformat()
+        daily = [
+            {
+                "date": bucket[0],
+                "sessions": bucket[1],
+                "average_score": round(bucket[2] / bucket[3], 1) if bucket[3] else None,
+                "best_score": bucket[4]
+            }
+            for bucket in buckets if bucket[0] > daily_start
+        ]
+
+        top_errors = connection.execute(
+            "SELECT error_type, occurrences, sessions, last_seen FROM progress_errors "
+            "WHERE user_id = ? AND exercise_type = ? ORDER BY occurrences DESC LIMIT ?",
+            (*key, self.top_errors)
+        ).fetchall()
+
+        # A streak is only current if the user trained today or yesterday
+        if last_date is None or last_date < (today - timedelta(days=1)).isoformat():
+            current_streak = 0
+
+        return {
+            "user_id": user_id,
+            "exercise_type": exercise_type or "all",
+            "sessions": sessions,
+            "average_score": round(score_sum / scored_sessions, 1) if scored_sessions else None,
+            "rolling_average": rolling,
+            "personal_best": {
+                "score": best_score,
+                "exercise_id": best_exercise_id,
+                "timestamp": best_timestamp
+            } if best_score is not None else None,
+            "first_session": first_timestamp,
+            "last_session": last_timestamp,
+            "streak": {"current": current_streak, "longest": longest_streak},
+            "daily": daily,
+            "top_errors": [
+                {"type": error_type, "occurrences": occurrences, "sessions": error_sessions, "last_seen": last_seen}
+                for error_type, occurrences, error_sessions, last_seen in top_errors
+            ]
+        }
+
+    def exercise_types(self, connection: sqlite3.Connection, user_id: str) -> List[str]:
+        rows = connection.execute(
+            "SELECT exercise_type FROM progress_totals WHERE user_id = ? AND exercise_type != ? "
+            "ORDER BY exercise_type", (user_id, ALL_EXERCISES)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _day(record: Dict[str, Any]) -> str:
+        for value in (record.get("date"), record["timestamp"][:10]):
+            try:
+                return date.fromisoformat(value).isoformat()
+            except (TypeError, ValueError):
+                continue
+        raise ValueError(f"Exercise {record['id']} has no valid date")
+
+    def _add_to_day(self, connection: sqlite3.Connection, key: Tuple[str, str], day: str,
+                    score: Optional[int], scored: int) -> bool:
+        """Add a session to its daily bucket; True if the bucket is new"""
+        new_day = connection.execute(
+            "SELECT 1 FROM progress_daily WHERE user_id = ? AND exercise_type = ? AND date = ?",
+            (*key, day)
+        ).fetchone() is None
+
+        connection.execute(
+            "INSERT INTO progress_daily "
+            "(user_id, exercise_type, date, sessions, score_sum, scored_sessions, best_score) "
+            "VALUES (?, ?, ?, 1, ?, ?, ?) "
+            "ON CONFLICT (user_id, exercise_type, date) DO UPDATE SET "
+            "sessions = sessions + 1, "
+            "score_sum = score_sum + excluded.score_sum, "
+            "scored_sessions = scored_sessions + excluded.scored_sessions, "
+            "best_score = MAX(COALESCE(best_score, excluded.best_score), COALESCE(excluded.best_score, best_score))",
+            (*key, day, score or 0, scored, score)
+        )
+        return new_day
+
+    def _add_to_totals(self, connection: sqlite3.Connection, key: Tuple[str, str], exercise_id: str,
+                       timestamp: str, day: str, score: Optional[int], scored: int, new_day: bool) -> None:
+        row = connection.execute(
+            "SELECT sessions, score_sum, scored_sessions, best_score, best_exercise_id, best_timestamp, "
+            "first_timestamp, last_timestamp, last_date, current_streak, longest_streak "
+            "FROM progress_totals WHERE user_id = ? AND exercise_type = ?", key
+        ).fetchone()
+
+        if row is None:
+            row = (0, 0, 0, None, None, None, timestamp, timestamp, None, 0, 0)
+
+        (sessions, score_sum, scored_sessions, best_score, best_exercise_id, best_timestamp,
+         first_timestamp, last_timestamp, last_date, current_streak, longest_streak) = row
+
+        # Ties go to the earliest session, so the order records arrive in doesn't matter
+        if scored and (best_score is None or score > best_score
+                       or (score == best_score and timestamp < best_timestamp)):
+            best_score, best_exercise_id, best_timestamp = score, exercise_id, timestamp
+
+        if new_day:
+            if last_date is None:
+                current_streak, last_date = 1, day
+            elif day > last_date:
+                gap = (date.fromisoformat(day) - date.fromisoformat(last_date)).days
+                current_streak = current_streak + 1 if gap == 1 else 1
+                last_date = day
+            else:
+                # A session filled in an earlier day, e.g. while backfilling history
+                current_streak, longest_streak, last_date = self._streaks(connection, key)
+            longest_streak = max(longest_streak, current_streak)
+
+        connection.execute(
+            "INSERT OR REPLACE INTO progress_totals "
+            "(user_id, exercise_type, sessions, score_sum, scored_sessions, best_score, best_exercise_id, "
+            "best_timestamp, first_timestamp, last_timestamp, last_date, current_streak, longest_streak) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                *key, sessions + 1, score_sum + (score or 0), scored_sessions + scored,
+                best_score, best_exercise_id, best_timestamp,
+                min(first_timestamp, timestamp), max(last_timestamp, timestamp),
+                last_date, current_streak, longest_streak
+            )
+        )
+
+    def _streaks(self, connection: sqlite3.Connection, key: Tuple[str, str]) -> Tuple[int, int, Optional[str]]:
+        """(current, longest, last date) recomputed from the daily buckets"""
+        current = longest = 0
+        previous = None
+
+        for (day,) in connection.execute(
+            "SELECT date FROM progress_daily WHERE user_id = ? AND exercise_type = ? ORDER BY date", key
+        ):
+            day = date.fromisoformat(day)
+            current = current + 1 if previous is not None and (day - previous).days == 1 else 1
+            longest = max(longest, current)
+            previous = day
+
+        return current, longest, previous.isoformat() if previous else None
@@ -0,0 +1,477 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+from agents.exercise_store import ExerciseStore
+from agents.segment_log import SegmentLog
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+# Records written by the old Logger as one pretty-printed file each: <data_type>_<id>.json
+LEGACY_FILE = re.compile(r"^(error_data|feedback_data|visual_data|exercise_data)_(.+)\.json$")
+
+# Segment slot of records that still live in a legacy per-record file
+LEGACY = -1
+
+# Replayed lines are merged into the index and the exercise store in chunks,
+# so readers are never blocked for long
+REPLAY_CHUNK = 1000
+
+
+class RecordIndex:
+    """
+    Location index of Logger records, rebuilt quickly after a restart.
+
+    The index maps every record ID to where its line sits in the segment log
+    (segment, byte offset, length) rather than holding the records, and reads
+    fetch the line on demand. It is saved as a compact snapshot that also
+    remembers how far each segment had been indexed. A restarted process loads
+    the newest snapshot and replays only the segment bytes written after it, so
+    restore time depends on the activity since the last snapshot rather than on
+    the size of the history.
+
+    Restoring runs in a background thread. Until it has finished, lookups fall
+    back to direct point reads of legacy record files, and progress is reported
+    by `status()`. Replayed exercise records are inserted into the exercise
+    store if they are missing, and legacy per-record files are imported once.
+
+    Server processes sharing a data directory each keep their own index. A
+    lookup that misses re-reads the tails of the other processes' segments
+    before giving up, so records written by another worker are found too.
+    """
+
+    def __init__(self, data_dir: str, segment_log: SegmentLog, exercise_store: ExerciseStore,
+                 data_types: Tuple[str, ...] = ("error_data", "feedback_data", "visual_data"),
+                 snapshot_interval: float = 300.0, keep_snapshots: int = 2):
+        """
+        Args:
+            data_dir: Logger data directory
+            segment_log: Segment log the indexed records are written to
+            exercise_store: Store that replayed exercise records are restored into
+            data_types: Record types kept in the index
+            snapshot_interval: Seconds between snapshots while records are being added
+            keep_snapshots: Number of snapshot files kept on disk
+        """
+        self.data_dir = data_dir
+        self.segment_log = segment_log
+        self.exercise_store = exercise_store
+        self.data_types = tuple(data_types)
+        self.snapshot_interval = snapshot_interval
+        self.keep_snapshots = max(1, keep_snapshots)
+        self.snapshot_dir = os.path.join(data_dir, "snapshots")
+
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._catch_up_lock = threading.Lock()
+        self._records = {data_type: {} for data_type in self.data_types}
+        self._pending = {data_type: {} for data_type in self.data_types}
+        self._segments = []
+        self._slots = {}
+        self._indexed = {}
+        self._legacy_imported = False
+        self._changes = 0
+
+        self._status = {
+            "state": "pending",
+            "snapshot": None,
+            "segments_total": 0,
+            "segments_replayed": 0,
+            "bytes_total": 0,
+            "bytes_replayed": 0,
+            "legacy_files_imported": 0,
+            "elapsed_seconds": 0.0,
+            "error": None
+        }
+        self._started_at = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._restorer = None
+        self._snapshotter = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self) -> None:
+        """Restore the index in the background and start taking periodic snapshots"""
+        if self._restorer is not None:
+            return
+
+        self._started_at = time.monotonic()
+        self._status["state"] = "restoring"
+
+        self._restorer = threading.Thread(target=self._restore, name="record-index-restore", daemon=True)
+        self._restorer.start()
+
+        self._snapshotter = threading.Thread(target=self._snapshot_loop, name="record-index-snapshot", daemon=True)
+        self._snapshotter.start()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def add_pending(self, data_type: str, record: Dict[str, Any]) -> None:
+        """Make a record readable before the segment log has written it"""
+        if data_type not in self._pending:
+            return
+        with self._lock:
+            self._pending[data_type][record["id"]] = record
+
+    def record_written(self, data_type: str, path: str, locations: List[Tuple[Dict[str, Any], int, int]]) -> None:
+        """SegmentLog callback: point the index at records that are now on disk"""
+        name = os.path.basename(path)
+        with self._lock:
+            slot = self._slot(name)
+            records = self._records.get(data_type)
+            pending = self._pending.get(data_type)
+            end = self._indexed.get(name, 0)
+
+            # Segments of other record types are tracked too, so they are not replayed
+            for record, offset, length in locations:
+                if records is not None:
+                    records[record["id"]] = (slot, offset, length)
+                    pending.pop(record["id"], None)
+                end = max(end, offset + length)
+
+            self._indexed[name] = end
+            self._changes += len(locations)
+
+    def get(self, data_type: str, record_id: str) -> Optional[Dict[str, Any]]:
+        """Read a record by ID, or None if it is unknown"""
+        record, location, segment = self._locate(data_type, record_id)
+        if record is not None:
+            return record
+
+        # Another process sharing the data directory may have written it since
+        if location is None and self.ready and data_type in self._records:
+            self._catch_up()
+            record, location, segment = self._locate(data_type, record_id)
+            if record is not None:
+                return record
+
+        try:
+            if location is None:
+                # Not restored yet; a legacy record can still be found by its file name
+                if not self.ready:
+                    return self._read_legacy(data_type, record_id)
+                return None
+
+            if segment is None:
+                return self._read_legacy(data_type, record_id)
+
+            _, offset, length = location
+            with open(os.path.join(self.segment_log.directory, segment), "rb") as f:
+                f.seek(offset)
+                return json.loads(f.read(length))
+
+        except Exception as e:
+            logger.error(f"Error reading {data_type} record {record_id}: {str(e)}")
+            return None
+
+    def _locate(self, data_type: str, record_id: str):
+        """(pending record, location, segment name) of a record ID"""
+        with self._lock:
+            record = self._pending.get(data_type, {}).get(record_id)
+            if record is not None:
+                return record, None, None
+
+            location = self._records.get(data_type, {}).get(record_id)
+            segment = None
+            if location is not None and location[0] != LEGACY:
+                segment = self._segments[location[0]]
+            return None, location, segment
+
+    def count(self, data_type: str) -> int:
+        with self._lock:
+            return len(self._records.get(data_type, {})) + len(self._pending.get(data_type, {}))
+
+    def status(self) -> Dict[str, Any]:
+        """Restore progress, for the health endpoint"""
+        with self._lock:
+            status = dict(self._status)
+            status["records"] = {data_type: len(records) for data_type, records in self._records.items()}
+
+        if self._started_at is not None and not self.ready:
+            status["elapsed_seconds"] = round(time.monotonic() - self._started_at, 3)
+        return status
+
+    def snapshot(self) -> Optional[str]:
+        """
+        Write the index to a new snapshot file.
+
+        Returns:
+            Path of the snapshot, or None if the index has not been restored yet
+        """
+        if not self.ready:
+            return None
+
+        with self._snapshot_lock:
+            with self._lock:
+                changes = self._changes
+                snapshot = {
+                    "version": SNAPSHOT_VERSION,
+                    "created_at": time.time(),
+                    "legacy_imported": self._legacy_imported,
+                    "segments": [[name, self._indexed.get(name, 0)] for name in self._segments],
+                    "records": {
+                        data_type: [[record_id, *location] for record_id, location in records.items()]
+                        for data_type, records in self._records.items()
+                    }
+                }
+
+            name = f"index-{int(time.time() * 1000):013d}-{os.getpid()}.json"
+            path = os.path.join(self.snapshot_dir, name)
+            tmp_path = f"{path}.tmp"
+
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(snapshot, f, separators=(",", ":"))
+                os.replace(tmp_path, path)
+            except Exception as e:
+                logger.error(f"Error writing index snapshot: {str(e)}")
+                return None
+
+            with self._lock:
+                self._changes -= changes
+
+            self._prune_snapshots()
+            logger.info(f"Wrote index snapshot {name}")
+            return path
+
+    def close(self) -> None:
+        """Stop the snapshot thread and snapshot any records added since the last one"""
+        self._stop.set()
+        if self._snapshotter is not None:
+            self._snapshotter.join(timeout=5)
+        if self._changes:
+            self.snapshot()
+
+    def _restore(self) -> None:
+        try:
+            self._load_snapshot()
+
+            owned = set(self.segment_log.owned_segments())
+            with self._lock:
+                start_offsets = dict(self._indexed)
+
+            plan = []
+            for path in self.segment_log.segments():
+                if path in owned:
+                    continue
+                start = start_offsets.get(os.path.basename(path), 0)
+                size = os.path.getsize(path)
+                if size > start:
+                    plan.append((path, start))
+                    self._status["bytes_total"] += size - start
+
+            self._status["segments_total"] = len(plan)
+
+            for path, start in plan:
+                self._replay(path, start)
+                self._status["segments_replayed"] += 1
+
+            if not self._legacy_imported:
+                self._import_legacy()
+
+            self._status["state"] = "ready"
+            self._status["elapsed_seconds"] = round(time.monotonic() - self._started_at, 3)
+            self._ready.set()
+
+            logger.info(
+                f"Record index restored in {self._status['elapsed_seconds']}s "
+                f"({self._status['bytes_replayed']} log bytes replayed)"
+            )
+
+            # Start the next restore from here rather than from the old snapshot
+            if plan or self._status["legacy_files_imported"]:
+                self.snapshot()
+
+        except Exception as e:
+            logger.error(f"Error restoring record index: {str(e)}")
+            self._status["state"] = "failed"
+            self._status["error"] = str(e)
+
+    def _catch_up(self) -> None:
+        """
+        Index what other processes have appended to their segments since this
+        index last looked, so a record written by another server process can be
+        read here. Only segment sizes are checked unless something was appended.
+        """
+        with self._catch_up_lock:
+            owned = set(self.segment_log.owned_segments())
+            with self._lock:
+                indexed = dict(self._indexed)
+
+            for path in self.segment_log.segments():
+                if path in owned:
+                    continue
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    continue
+                start = indexed.get(os.path.basename(path), 0)
+                if size > start:
+                    self._replay(path, start, progress=False)
+
+    def _load_snapshot(self) -> None:
+        """Load the newest readable snapshot into the index"""
+        for name in sorted(self._snapshot_names(), reverse=True):
+            try:
+                with open(os.path.join(self.snapshot_dir, name)) as f:
+                    snapshot = json.load(f)
+                if snapshot.get("version") != SNAPSHOT_VERSION:
+                    continue
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable index snapshot {name}: {str(e)}")
+                continue
+
+            with self._lock:
+                slots = [self._slot(segment) for segment, _ in snapshot["segments"]]
+                for (segment, indexed), slot in zip(snapshot["segments"], slots):
+                    self._indexed[segment] = max(self._indexed.get(segment, 0), indexed)
+
+                for data_type, entries in snapshot["records"].items():
+                    records = self._records.get(data_type)
+                    if records is None:
+                        continue
+                    for record_id, slot, offset, length in entries:
+                        if slot != LEGACY:
+                            slot = slots[slot]
+                        records.setdefault(record_id, (slot, offset, length))
+
+                self._legacy_imported = snapshot.get("legacy_imported", False)
+
+            self._status["snapshot"] = name
+            return
+
+    def _replay(self, path: str, start: int, progress: bool = True) -> None:
+        """Index the records appended to a segment after `start`"""
+        name = os.path.basename(path)
+        data_type = name.rsplit("-", 3)[0]
+        indexed = data_type in self._records
+        restore_exercises = data_type == "exercise_data"
+
+        offset = start
+        chunk = []
+
+        with open(path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                # A torn last line means the writer died mid-batch
+                if not line.endswith(b"\n"):
+                    break
+
+                try:
+                    record = json.loads(line)
+                    chunk.append((record, offset, len(line)))
+                except ValueError:
+                    logger.warning(f"Skipping malformed record in {name} at byte {offset}")
+
+                offset += len(line)
+                if progress:
+                    self._status["bytes_replayed"] += len(line)
+
+                if len(chunk) >= REPLAY_CHUNK:
+                    self._merge_replayed(name, data_type, chunk, offset, indexed, restore_exercises)
+                    chunk = []
+
+        self._merge_replayed(name, data_type, chunk, offset, indexed, restore_exercises)
+
+    def _merge_replayed(self, name: str, data_type: str, chunk: List[Tuple[Dict[str, Any], int, int]],
+                        end: int, indexed: bool, restore_exercises: bool) -> None:
+        if restore_exercises and chunk:
+            self.exercise_store.put_many([record for record, _, _ in chunk], replace=False)
+
+        with self._lock:
+            slot = self._slot(name)
+            if indexed:
+                records = self._records[data_type]
+                for record, offset, length in chunk:
+                    records.setdefault(record["id"], (slot, offset, length))
+            self._indexed[name] = max(self._indexed.get(name, 0), end)
+            self._changes += len(chunk)
+
+    def _import_legacy(self) -> None:
+        """One-off import of records the old Logger wrote as one file each"""
+        exercises = []
+        imported = 0
+
+        with os.scandir(self.data_dir) as entries:
+            for entry in entries:
+                match = LEGACY_FILE.match(entry.name)
+                if match is None or not entry.is_file():
+                    continue
+
+                data_type, record_id = match.groups()
+
+                if data_type == "exercise_data":
+                    try:
+                        with open(entry.path) as f:
+                            exercises.append(json.load(f))
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Skipping unreadable legacy record {entry.name}: {str(e)}")
+                        continue
+                    if len(exercises) >= REPLAY_CHUNK:
+                        self.exercise_store.put_many(exercises, replace=False)
+                        exercises = []
+
+                elif data_type in self._records:
+                    # Only the file name is needed to index these
+                    with self._lock:
+                        self._records[data_type].setdefault(record_id, (LEGACY, 0, 0))
+
+                imported += 1
+                self._status["legacy_files_imported"] = imported
+
+        if exercises:
+            self.exercise_store.put_many(exercises, replace=False)
+
+        with self._lock:
+            self._legacy_imported = True
+            self._changes += imported
+
+        if imported:
+            logger.info(f"Imported {imported} legacy record files")
+
+    def _read_legacy(self, data_type: str, record_id: str) -> Optional[Dict[str, Any]]:
+        if os.sep in record_id or (os.altsep and os.altsep in record_id):
+            return None
+        try:
+            with open(os.path.join(self.data_dir, f"{data_type}_{record_id}.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _slot(self, name: str) -> int:
+        """Number of a segment in the index; caller holds the lock"""
+        slot = self._slots.get(name)
+        if slot is None:
+            slot = len(self._segments)
+            self._segments.append(name)
+            self._slots[name] = slot
+        return slot
+
+    def _snapshot_loop(self) -> None:
+        while not self._stop.wait(self.snapshot_interval):
+            if self._changes:
+                self.snapshot()
+
+    def _snapshot_names(self) -> List[str]:
+        return [
+            name for name in os.listdir(self.snapshot_dir)
+            if name.startswith("index-") and name.endswith(".json")
+        ]
+
+    def _prune_snapshots(self) -> None:
+        for name in sorted(self._snapshot_names(), reverse=True)[self.keep_snapshots:]:
+            try:
+                os.remove(os.path.join(self.snapshot_dir, name))
+            except OSError:
+                pass
@@ -0,0 +1,229 @@
+import logging
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+from agents.form_rules import format_timestamp
+from agents.landmarks import LandmarkSequence, JOINT_PAIRS, X, Y
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever REP_SIGNALS or the segmentation changes
+REP_VERSION = "1"
+
+# The time series each exercise's reps are found in, declared as data.
+#
+# Signals:
+#   height - image y of a point (a left/right pair is averaged); larger is lower
+#   angle  - angle in degrees at the middle of three points, averaged over both sides
+# "rest" is the end of the movement a rep starts and finishes at: "min" or "max"
+# of the signal, and "phases" name the halves of a rep, away from rest and
+# back. "min_range" is the smallest movement, in signal units, that counts as a
+# rep. Exercises without an entry (e.g. plank) have no reps.
+REP_SIGNALS = {
+    "squat": {"signal": "height", "points": ["hips"], "rest": "min", "min_range": 0.04,
+              "phases": ["lowering", "raising"]},
+    "deadlift": {"signal": "height", "points": ["hips"], "rest": "max", "min_range": 0.04,
+                 "phases": ["lifting", "lowering"]},
+    "pushup": {"signal": "angle", "points": ["shoulders", "elbows", "wrists"], "rest": "max", "min_range": 25.0,
+               "phases": ["lowering", "pushing"]},
+    "lunge": {"signal": "height", "points": ["hips"], "rest": "min", "min_range": 0.04,
+              "phases": ["lowering", "raising"]}
+}
+
+SIGNAL_UNITS = {"height": "frame height", "angle": "degrees"}
+
+
+def _joint_angle(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    ba = a[..., X:Y + 1] - b[..., X:Y + 1]
+    bc = c[..., X:Y + 1] - b[..., X:Y + 1]
+    cosine = (ba * bc).sum(axis=-1) / (np.linalg.norm(ba, axis=-1) * np.linalg.norm(bc, axis=-1))
+    return np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+
+
+def _moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """Centered moving average of the same length, from one cumulative sum"""
+    if window <= 1:
+        return values
+    half = window // 2
+    padded = np.pad(values, (half, window - 1 - half), mode="edge")
+    totals = np.concatenate(([0.0], np.cumsum(padded)))
+    return (totals[window:] - totals[:-window]) / window
+
+
+def _zigzag(values: np.ndarray, threshold: float) -> List[tuple]:
+    """
+    Alternating peaks and valleys that differ by at least `threshold`.
+
+    Candidates are the local extrema (sign changes of the first difference) and
+    both ends of the series, found in one vectorized pass; only those few are
+    walked to drop swings smaller than the threshold.
+
+    Returns:
+        List of (row, "peak" or "valley") in time order
+    """
+    slope = np.sign(np.diff(values))
+    # Flat stretches take the direction of the slope before them
+    nonzero = slope != 0
+    if not nonzero.any():
+        return []
+    slope = slope[np.maximum.accumulate(np.where(nonzero, np.arange(len(slope)), 0))]
+    turns = np.flatnonzero(slope[1:] != slope[:-1]) + 1
+    candidates = np.concatenate(([0], turns, [len(values) - 1]))
+
+    pivots = []
+    high = low = candidates[0]
+    current, kind = None, None
+
+    for row in candidates[1:]:
+        value = values[row]
+        if kind is None:
+            high = row if value > values[high] else high
+            low = row if value < values[low] else low
+            if values[high] - values[low] >= threshold:
+                if high < low:
+                    pivots.append((int(high), "peak"))
+                    current, kind = low, "valley"
+                else:
+                    pivots.append((int(low), "valley"))
+                    current, kind = high, "peak"
+        elif kind == "peak":
+            if value > values[current]:
+                current = row
+            elif values[current] - value >= threshold:
+                pivots.append((int(current), "peak"))
+                current, kind = row, "valley"
+        else:
+            if value < values[current]:
+                current = row
+            elif value - values[current] >= threshold:
+                pivots.append((int(current), "valley"))
+                current, kind = row, "peak"
+
+    if kind is not None:
+        pivots.append((int(current), kind))
+    return pivots
+
+
+class RepSegmenter:
+    """
+    Splits a landmark sequence into repetitions.
+
+    The exercise's signal (see REP_SIGNALS) is computed for every frame, gaps
+    without a detection are interpolated and the series is smoothed with a
+    moving average. It is oriented so the rest position is high, and every
+    valley between two peaks at least `min_range` (or `min_range_fraction` of
+    the signal's spread) apart is one rep. All of this is a few linear passes
+    over the arrays. Each rep reports its boundaries, tempo (the time of each
+    phase) and range of motion; reps with much less range than the
+    set's median are flagged as partial.
+    """
+
+    def __init__(self, signals: Dict[str, Dict[str, Any]] = None, smooth_seconds: float = 0.2,
+                 min_range_fraction: float = 0.35, partial_fraction: float = 0.7):
+        """
+        Args:
+            signals: Signal per exercise type, defaults to REP_SIGNALS
+            smooth_seconds: Width of the moving average
+            min_range_fraction: Smallest rep, as a fraction of the signal's 5th-95th percentile spread
+            partial_fraction: Reps with less than this fraction of the median range of motion are partial
+        """
+        self.signals = signals if signals is not None else REP_SIGNALS
+        self.smooth_seconds = smooth_seconds
+        self.min_range_fraction = min_range_fraction
+        self.partial_fraction = partial_fraction
+
+    def supports(self, exercise_type: str) -> bool:
+        return exercise_type in self.signals
+
+    def segment(self, sequence: LandmarkSequence, exercise_type: str) -> Optional[Dict[str, Any]]:
+        """
+        Find the reps of an exercise.
+
+        Args:
+            sequence: Landmarks of the analyzed video
+            exercise_type: Type of exercise (e.g., 'squat')
+
+        Returns:
+            Rep count, the reps with boundaries, tempo and range of motion, and set
+            averages; None when the exercise has no rep signal
+        """
+        spec = self.signals.get(exercise_type)
+        if spec is None:
+            return None
+
+        signal = self._signal(sequence, spec)
+        detected = np.flatnonzero(~np.isnan(signal))
+        reps = []
+
+        if len(detected) >= 2:
+            # Bridge frames without a pose so gaps don't break a rep in two
+            rows = np.arange(len(signal))
+            filled = np.interp(rows, detected, signal[detected])
+
+            frame_step = np.median(np.diff(sequence.frame_indices))
+            window = max(1, int(round(self.smooth_seconds * sequence.fps / max(frame_step, 1))))
+            smoothed = _moving_average(filled, window)
+
+            oriented = smoothed if spec["rest"] == "max" else -smoothed
+            spread = np.percentile(oriented, 95) - np.percentile(oriented, 5)
+            threshold = max(spec["min_range"], self.min_range_fraction * spread)
+
+            reps = self._reps(sequence, oriented, _zigzag(oriented, threshold), spec["phases"])
+
+        if reps:
+            ranges = np.array([rep["range_of_motion"] for rep in reps])
+            median_range = float(np.median(ranges))
+            for rep in reps:
+                rep["partial"] = bool(rep["range_of_motion"] < self.partial_fraction * median_range)
+
+        return {
+            "signal": f"{spec['signal']}:{'/'.join(spec['points'])}",
+            "unit": SIGNAL_UNITS[spec["signal"]],
+            "count": len(reps),
+            "reps": reps,
+            "tempo": self._averages(reps, ("duration", *spec["phases"])),
+            "range_of_motion": self._averages(reps, ("range_of_motion",)).get("range_of_motion")
+        }
+
+    def _signal(self, sequence: LandmarkSequence, spec: Dict[str, Any]) -> np.ndarray:
+        points = [sequence.pair(name) if name in JOINT_PAIRS else sequence.joint(name)[:, np.newaxis]
+                  for name in spec["points"]]
+
+        if spec["signal"] == "height":
+            return points[0][..., Y].mean(axis=1)
+        if spec["signal"] == "angle":
+            return _joint_angle(*points).mean(axis=1)
+        raise ValueError(f"Unknown rep signal '{spec['signal']}'")
+
+    def _reps(self, sequence: LandmarkSequence, oriented: np.ndarray, pivots: List[tuple],
+              phases: List[str]) -> List[Dict[str, Any]]:
+        timestamps = sequence.timestamps
+        frames = sequence.frame_indices
+        reps = []
+
+        for (start, first), (turn, middle), (end, last) in zip(pivots, pivots[1:], pivots[2:]):
+            if (first, middle, last) != ("peak", "valley", "peak"):
+                continue
+
+            reps.append({
+                "index": len(reps) + 1,
+                "start": format_timestamp(frames[start], sequence.fps),
+                "end": format_timestamp(frames[end], sequence.fps),
+                "start_frame": int(frames[start]),
+                "turn_frame": int(frames[turn]),
+                "end_frame": int(frames[end]),
+                "start_time": round(float(timestamps[start]), 2),
+                "end_time": round(float(timestamps[end]), 2),
+                "duration": round(float(timestamps[end] - timestamps[start]), 2),
+                phases[0]: round(float(timestamps[turn] - timestamps[start]), 2),
+                phases[1]: round(float(timestamps[end] - timestamps[turn]), 2),
+                "range_of_motion": round(float((oriented[start] + oriented[end]) / 2 - oriented[turn]), 3)
+            })
+
+        return reps
+
+    @staticmethod
+    def _averages(reps: List[Dict[str, Any]], fields: tuple) -> Dict[str, Optional[float]]:
+        return {field: round(float(np.mean([rep[field] for rep in reps])), 2) if reps else None
+                for field in fields}
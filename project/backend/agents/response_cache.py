@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Optional, Tuple
+
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+def make_etag(*parts: Any) -> str:
+    """Opaque entity tag for a response built from these parts (versions, query arguments)"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+
+class ResponseCache:
+    """
+    Conditional, compressed JSON responses for versioned resources.
+
+    A route passes the ETag of what it is about to return, derived from the
+    Logger's version tags, and a function that builds the data. A request whose
+    If-None-Match carries that tag gets a 304 before anything is loaded or
+    serialized. Otherwise bodies of at least `min_size` bytes are compressed
+    with brotli (when installed) or gzip, as the client accepts, and the
+    encoded bytes are kept in an LRU bounded by `max_bytes`, so repeated polls
+    of the same version skip the lookup, serialization and compression.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, min_size: int = 1024, level: int = 6):
+        """
+        Args:
+            max_bytes: Total size of the cached bodies
+            min_size: Bodies smaller than this are sent uncompressed
+            level: gzip level; brotli uses the matching quality
+        """
+        self.max_bytes = max_bytes
+        self.min_size = min_size
+        self.level = level
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+        self.encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+        logger.info(f"Response cache initialized ({', '.join(self.encodings)} compression)")
+
+    def json_response(self, build: Callable[[], Any], etag: Optional[str] = None) -> Optional[Response]:
+        """
+        Respond to the current request with JSON.
+
+        Args:
+            build: Returns the data to serialize; not called for a 304 or a cached body
+            etag: Tag of the data's current version; without one nothing is cached
+                and no conditional response is possible
+
+        Returns:
+            A 304, a 200 with the (possibly compressed) body, or None if build
+            returned None
+        """
+        if etag is not None and request.if_none_match.contains_weak(etag):
+            with self._lock:
+                self.not_modified += 1
+            return self._headers(Response(status=304), etag)
+
+        encoding = request.accept_encodings.best_match(self.encodings)
+        cached = self._get((etag, encoding)) if etag is not None else None
+
+        if cached is not None:
+            body, content_encoding = cached
+        else:
+            data = build()
+            if data is None:
+                return None
+            body, content_encoding = self._encode(current_app.json.dumps(data) + "\n", encoding)
+            if etag is not None:
+                self._put((etag, encoding), (body, content_encoding))
+
+        response = Response(body, mimetype="application/json")
+        if content_encoding:
+            response.headers["Content-Encoding"] = content_encoding
+        return self._headers(response, etag)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+    def _encode(self, text: str, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+        data = text.encode("utf-8")
+        if encoding is None or len(data) < self.min_size:
+            return data, None
+        if encoding == "br":
+            return brotli.compress(data, quality=min(self.level, 11)), "br"
+        return gzip.compress(data, compresslevel=self.level, mtime=0), "gzip"
+
+    @staticmethod
+    def _headers(response: Response, etag: Optional[str]) -> Response:
+        response.vary.add("Accept-Encoding")
+        if etag is not None:
+            # Weak: the gzip and brotli bodies of one version share the tag
+            response.set_etag(etag, weak=True)
+            # Cacheable, but revalidated on every use
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    def _get(self, key: tuple) -> Optional[Tuple[bytes, Optional[str]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _put(self, key: tuple, entry: Tuple[bytes, Optional[str]]) -> None:
+        size = len(entry[0])
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[key] = entry
+            self._size += size
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[0])
@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+from agents import telemetry
+
+logger = logging.getLogger(__name__)
+
+WRITE_MODES = ("sync", "write_behind")
+
+# none: let records sit in the file buffer until it fills, buffered: hand every
+# batch to the OS, fsync: force every batch to stable storage
+DURABILITY_LEVELS = ("none", "buffered", "fsync")
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class SegmentLog:
+    """
+    Append-only JSON Lines storage for Logger records.
+
+    Records are appended to one segment file per record type, with one record per
+    line. Segment names sort by creation time, and every process writes its own
+    segments, so several server processes can share a data directory. Segments
+    are rotated once they reach `max_segment_bytes`. An optional `on_written`
+    callback learns the byte location of every record once it is on disk, which
+    is what lets an index point into the segments instead of holding records.
+
+    In "write_behind" mode records are queued in memory and a background thread
+    writes them in batches, taking disk latency off the request path. In "sync"
+    mode each append is written before it returns.
+    """
+
+    def __init__(self, directory: str, write_mode: str = "write_behind", flush_interval: float = 1.0,
+                 batch_size: int = 256, durability: str = "buffered",
+                 max_segment_bytes: int = 64 * 1024 * 1024, max_pending: int = 10000,
+                 on_written: Optional[Callable[[str, str, List[Tuple[Dict[str, Any], int, int]]], None]] = None):
+        """
+        Args:
+            directory: Directory holding the segment files
+            write_mode: "write_behind" or "sync"
+            flush_interval: Longest time in seconds a queued record waits before being written
+            batch_size: Largest number of records written in one batch
+            durability: "none", "buffered" or "fsync"
+            max_segment_bytes: Size at which a segment file is rotated
+            max_pending: Queued records at which appends block until the writer catches up
+            on_written: Called as on_written(data_type, segment_path, [(record, offset, length)])
+                after each batch of records has been written
+        """
+        if write_mode not in WRITE_MODES:
+            raise ValueError(f"Unknown write mode: {write_mode}")
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Unknown durability level: {durability}")
+
+        self.directory = directory
+        self.write_mode = write_mode
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.durability = durability
+        self.max_segment_bytes = max_segment_bytes
+        self.on_written = on_written
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._files = {}
+        self._sequence = 0
+        self._owned = set()
+        self._write_lock = threading.Lock()
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._writer = None
+
+        if write_mode == "write_behind":
+            self._writer = threading.Thread(target=self._write_behind, name="segment-writer", daemon=True)
+            self._writer.start()
+
+        logger.info(f"Segment log initialized in {directory} ({write_mode}, durability: {durability})")
+
+    def append(self, data_type: str, record: Dict[str, Any]) -> None:
+        """Store a record; in write-behind mode it is written asynchronously"""
+        if self._closed:
+            raise RuntimeError("Segment log is closed")
+
+        if self._writer is None:
+            self._write_batch([(data_type, record)])
+        else:
+            self._pending.put((data_type, record))
+
+    def pending(self) -> int:
+        """Records appended but not yet written (write-behind only)"""
+        return self._pending.qsize()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until every record appended so far has been written.
+
+        Returns:
+            False if the timeout expired first
+        """
+        if self._writer is None or not self._writer.is_alive():
+            return True
+
+        request = _FlushRequest()
+        self._pending.put(request)
+        return request.done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 30.0) -> None:
+        """Flush queued records, stop the writer and close the segment files"""
+        if self._closed:
+            return
+
+        self.flush(timeout)
+        self._closed = True
+
+        if self._writer is not None:
+            self._pending.put(None)
+            self._writer.join(timeout)
+
+        with self._write_lock:
+            for f, _ in self._files.values():
+                f.close()
+            self._files.clear()
+
+    def segments(self, data_type: Optional[str] = None) -> List[str]:
+        """Segment file paths in creation order"""
+        names = [
+            name for name in os.listdir(self.directory)
+            if name.endswith(".jsonl") and (data_type is None or name.startswith(f"{data_type}-"))
+        ]
+        return [os.path.join(self.directory, name) for name in sorted(names, key=self._segment_order)]
+
+    def owned_segments(self) -> List[str]:
+        """Paths of the segments this instance has created"""
+        with self._write_lock:
+            return list(self._owned)
+
+    def _write_behind(self) -> None:
+        while True:
+            batch, flush_requests, stop = self._next_batch()
+
+            if batch:
+                self._write_batch(batch)
+
+            for request in flush_requests:
+                request.done.set()
+
+            if stop:
+                return
+
+    def _next_batch(self) -> Tuple[List[Tuple[str, Dict[str, Any]]], List[_FlushRequest], bool]:
+        """Collect records until the batch is full, the flush interval passes or a flush is requested"""
+        batch = []
+        flush_requests = []
+        deadline = None
+
+        while len(batch) < self.batch_size:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._pending.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            if item is None:
+                return batch, flush_requests, True
+            if isinstance(item, _FlushRequest):
+                flush_requests.append(item)
+                break
+
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+
+        return batch, flush_requests, False
+
+    def _write_batch(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        # One write call per record type per batch
+        records = {}
+        for data_type, record in batch:
+            records.setdefault(data_type, []).append(record)
+
+        with self._write_lock:
+            for data_type, type_records in records.items():
+                try:
+                    with telemetry.span("segment_log.write", data_type=data_type, records=len(type_records)):
+                        lines = [
+                            (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+                            for record in type_records
+                        ]
+                        f, path = self._segment_for(data_type)
+                        offset = f.tell()
+                        f.write(b"".join(lines))
+
+                        if self.durability != "none":
+                            f.flush()
+                        if self.durability == "fsync":
+                            os.fsync(f.fileno())
+
+                except Exception as e:
+                    logger.error(f"Error writing {len(type_records)} {data_type} records: {str(e)}")
+                    continue
+
+                if self.on_written is not None:
+                    locations = []
+                    for record, line in zip(type_records, lines):
+                        locations.append((record, offset, len(line)))
+                        offset += len(line)
+                    try:
+                        self.on_written(data_type, path, locations)
+                    except Exception as e:
+                        logger.error(f"Error reporting written {data_type} records: {str(e)}")
+
+    def _segment_for(self, data_type: str):
+        """Open segment for a record type, rotating it when it is full"""
+        current = self._files.get(data_type)
+        if current is not None:
+            f, path = current
+            if f.tell() < self.max_segment_bytes:
+                return f, path
+            f.close()
+
+        self._sequence += 1
+        name = f"{data_type}-{int(time.time() * 1000):013d}-{os.getpid()}-{self._sequence:06d}.jsonl"
+        path = os.path.join(self.directory, name)
+        # Binary mode, so tell() is the byte offset the index refers to
+        f = open(path, "ab")
+        self._files[data_type] = (f, path)
+        self._owned.add(path)
+        return f, path
+
+    @staticmethod
+    def _segment_order(name: str):
+        # <data_type>-<created ms>-<pid>-<sequence>.jsonl
+        parts = name[:-len(".jsonl")].rsplit("-", 3)
+        try:
+            return int(parts[1]), int(parts[2]), int(parts[3])
+        except (IndexError, ValueError):
+            return 0, 0, 0
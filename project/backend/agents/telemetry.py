@@ -0,0 +1,420 @@
+import bisect
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets, from a pose frame to a full analysis
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Request the current code runs on behalf of, and the innermost open span
+_request_id = contextvars.ContextVar("request_id", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_span_ids = itertools.count(1)
+_tracer = None
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 2 ** 53:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    """
+    One metric family; each combination of label values is a separate series.
+
+    Series set with `set_function` are read by calling the function at scrape
+    time, which suits queue depths and hit counts that another component
+    already tracks.
+    """
+
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._series = {}
+        self._functions = {}
+        self._lock = threading.Lock()
+
+    def set_function(self, function: Callable[[], float], **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} takes labels {', '.join(self.label_names) or 'none'}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                value = float(function())
+            except Exception as e:
+                logger.warning(f"Could not read metric {self.name}: {str(e)}")
+                continue
+            with self._lock:
+                self._series[key] = value
+
+        with self._lock:
+            series = sorted(self._series.items())
+        return [f"{self.name}{self._labels(key)} {_format_value(value)}" for key, value in series]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        return "\n".join(lines + self._samples())
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (the last one past every bound), sum of the values
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def observe_many(self, values: Iterable[float], **labels: Any) -> None:
+        """Record several values at once, e.g. timings collected in a worker process"""
+        key = self._key(labels)
+        indexes = [(bisect.bisect_left(self.buckets, value), value) for value in values]
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            for index, value in indexes:
+                series[0][index] += 1
+                series[1] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+
+        lines = []
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                bucket = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{self._labels(key, bucket)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Named metrics of this process, rendered in the Prometheus text format.
+
+    Metrics are created on first use and returned again for the same name, so
+    modules declare the ones they record at import time, like loggers.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._get(Counter, name, documentation, label_names)
+
+    def gauge(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        return self._get(Gauge, name, documentation, label_names)
+
+    def histogram(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, documentation, label_names, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def _get(self, cls, name: str, documentation: str, label_names: Tuple[str, ...], **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, label_names, **kwargs)
+            elif not isinstance(metric, cls) or metric.label_names != tuple(label_names):
+                raise ValueError(f"Metric {name} is already registered with a different type or labels")
+            return metric
+
+
+metrics = MetricsRegistry()
+
+SPAN_SECONDS = metrics.histogram(
+    "formfit_span_duration_seconds",
+    "Duration of traced operations (agent calls, pipeline steps, file writes)",
+    ("span",)
+)
+SPAN_ERRORS = metrics.counter(
+    "formfit_span_errors_total",
+    "Traced operations that raised an exception",
+    ("span",)
+)
+TRACE_DROPPED = metrics.counter(
+    "formfit_trace_spans_dropped_total",
+    "Spans not written to the trace file because its queue was full"
+)
+
+
+class TraceWriter:
+    """
+    Appends finished spans to a JSON Lines file from a background thread.
+
+    Spans are queued without blocking; when the writer falls more than
+    `max_pending` spans behind, new ones are dropped and counted instead of
+    slowing down requests.
+    """
+
+    def __init__(self, path: str, max_pending: int = 10000):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._file = open(path, "a", encoding="utf-8")
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._write, name="trace-writer", daemon=True)
+        self._thread.start()
+
+        logger.info(f"Writing traces to {path}")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            TRACE_DROPPED.inc()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _write(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            self._file.write(json.dumps(record, default=str) + "\n")
+            # Flush once the queue is drained rather than after every span
+            if self._queue.empty():
+                self._file.flush()
+        self._file.close()
+
+
+class Span:
+    """
+    Times one operation as a context manager.
+
+    The duration goes to the formfit_span_duration_seconds histogram under the
+    span's name, and, when tracing to a file, the span is written with its
+    request ID, parent span and attributes. Attributes can be added while the
+    span is open with `set`.
+    """
+
+    __slots__ = ("name", "attributes", "span_id", "parent_id", "request_id", "started_at",
+                 "duration", "error", "_started", "_token")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = None
+        self.parent_id = None
+        self.request_id = None
+        self.started_at = None
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        parent = _current_span.get()
+        self.span_id = next(_span_ids)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.request_id = _request_id.get()
+        self.started_at = time.time()
+        self._token = _current_span.set(self)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.duration = time.perf_counter() - self._started
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        _finish(self)
+
+
+def _finish(span: Span) -> None:
+    SPAN_SECONDS.observe(span.duration, span=span.name)
+    if span.error is not None:
+        SPAN_ERRORS.inc(span=span.name)
+
+    tracer = _tracer
+    if tracer is not None:
+        record = {
+            "request_id": span.request_id,
+            "span_id": f"{os.getpid()}-{span.span_id}",
+            "parent_id": f"{os.getpid()}-{span.parent_id}" if span.parent_id is not None else None,
+            "name": span.name,
+            "start": round(span.started_at, 6),
+            "duration_ms": round(span.duration * 1000, 3),
+            "thread": threading.current_thread().name
+        }
+        if span.error is not None:
+            record["error"] = span.error
+        if span.attributes:
+            record["attributes"] = span.attributes
+        tracer.write(record)
+
+
+def span(name: str, **attributes: Any) -> Span:
+    """
+    Trace the enclosed block:
+
+        with telemetry.span("llm.request", model=self.model):
+            ...
+    """
+    return Span(name, attributes)
+
+
+def traced(name: str) -> Callable:
+    """Decorator tracing every call of a function as a span"""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with Span(name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_span(name: str, duration: float, started_at: Optional[float] = None, **attributes: Any) -> None:
+    """Record an operation timed elsewhere, e.g. in a worker process, as a child of the current span"""
+    recorded = Span(name, attributes)
+    parent = _current_span.get()
+    recorded.span_id = next(_span_ids)
+    recorded.parent_id = parent.span_id if parent is not None else None
+    recorded.request_id = _request_id.get()
+    recorded.started_at = started_at if started_at is not None else time.time() - duration
+    recorded.duration = duration
+    _finish(recorded)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def set_request_id(request_id: Optional[str]) -> contextvars.Token:
+    """Make spans opened from here on belong to this request; pass the token to reset_request_id"""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token: contextvars.Token) -> None:
+    _request_id.reset(token)
+
+
+@contextmanager
+def request_context(request_id: Optional[str] = None) -> Iterator[str]:
+    """Run a block on behalf of a request, e.g. a queued job of the request that submitted it"""
+    request_id = request_id or new_request_id()
+    request_token = _request_id.set(request_id)
+    # Spans opened in the block start a new tree rather than nest under the caller's
+    span_token = _current_span.set(None)
+    try:
+        yield request_id
+    finally:
+        _current_span.reset(span_token)
+        _request_id.reset(request_token)
+
+
+def in_context(function: Callable) -> Callable:
+    """
+    Bind a function to the current request and span before handing it to
+    another thread, e.g. executor.submit(in_context(function), ...).
+    The returned callable must be run only once.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(function, *args, **kwargs)
+
+
+def configure_tracing(path: Optional[str], max_pending: int = 10000) -> None:
+    """Start, or with None stop, writing spans to a JSON Lines trace file"""
+    global _tracer
+    previous = _tracer
+    _tracer = TraceWriter(path, max_pending) if path else None
+    if previous is not None:
+        previous.close()
+
+
+def close_tracing() -> None:
+    configure_tracing(None)
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, List, Any, Optional, Tuple, BinaryIO
+
+from agents import telemetry
+from agents.landmarks import LandmarkSequence
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadStore:
+    """
+    Content-addressed storage for uploaded videos and their analysis artifacts.
+
+    Videos are hashed while they stream to disk and stored under their SHA-256,
+    so re-uploads of the same clip share one file. Pose landmarks and detected
+    errors are cached next to each video, letting a duplicate upload skip
+    decoding and inference. When the store grows past its quota, the least
+    recently used videos are deleted together with their cached artifacts.
+    Usage is kept as a running total rather than measured on every write; the
+    tree is only walked at startup, when the total passes the quota, and every
+    rescan_seconds to pick up files written by other processes.
+
+    Layout:
+        <root>/videos/<hash[:2]>/<hash><ext>
+        <root>/cache/<hash>/landmarks-<pipeline>.npz
+        <root>/cache/<hash>/errors-<exercise>-<rules>-<pipeline>.json
+    """
+
+    def __init__(self, root: str = "uploads", max_bytes: int = 10 * 1024 ** 3, min_age_seconds: int = 3600,
+                 rescan_seconds: float = 300.0):
+        """
+        Args:
+            root: Directory holding the store
+            max_bytes: Disk quota for videos and cached artifacts
+            min_age_seconds: Videos used more recently than this are never collected,
+                so clips waiting in the job queue aren't deleted under it
+            rescan_seconds: How often the running usage total is re-measured from disk
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.min_age_seconds = min_age_seconds
+        self.rescan_seconds = rescan_seconds
+        self.videos_dir = os.path.join(root, "videos")
+        self.cache_dir = os.path.join(root, "cache")
+        self.tmp_dir = os.path.join(root, "tmp")
+
+        for directory in (self.videos_dir, self.cache_dir, self.tmp_dir):
+            os.makedirs(directory, exist_ok=True)
+
+        self._gc_lock = threading.Lock()
+        self._usage_lock = threading.Lock()
+        self._usage = self.usage_bytes()
+        self._scanned_at = time.monotonic()
+
+        logger.info(f"Upload store initialized at {root} with a {max_bytes // 1024 ** 2} MB quota")
+
+    @telemetry.traced("upload_store.save")
+    def save(self, stream: BinaryIO, filename: str) -> Tuple[str, str]:
+        """
+        Stream an upload to disk, hashing it on the way.
+
+        Args:
+            stream: File-like object with the uploaded bytes
+            filename: Original file name, used for its extension
+
+        Returns:
+            Tuple of (content hash, path of the stored video)
+        """
+        digest = hashlib.sha256()
+        tmp_path = os.path.join(self.tmp_dir, f"{uuid.uuid4()}.part")
+
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            content_hash = digest.hexdigest()
+            existing = self.find_video(content_hash)
+
+            if existing:
+                path = existing
+                logger.info(f"Upload {content_hash[:12]} already stored, reusing it")
+                os.remove(tmp_path)
+            else:
+                path = self._video_path(content_hash, self._extension(filename))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                self._add_usage(os.path.getsize(path))
+
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.touch(content_hash)
+        self.collect_garbage(keep=content_hash)
+        return content_hash, path
+
+    def find_video(self, content_hash: str) -> Optional[str]:
+        """Path of a stored video, if it is still in the store"""
+        directory = os.path.join(self.videos_dir, content_hash[:2])
+        try:
+            for name in os.listdir(directory):
+                if name.startswith(content_hash):
+                    return os.path.join(directory, name)
+        except FileNotFoundError:
+            pass
+        return None
+
+    def touch(self, content_hash: str) -> None:
+        """Mark a video as recently used for LRU collection"""
+        path = self.find_video(content_hash)
+        if path:
+            os.utime(path, None)
+
+    @telemetry.traced("upload_store.load_landmarks")
+    def load_landmarks(self, content_hash: str, pipeline: str) -> Optional[LandmarkSequence]:
+        path = self._cache_path(content_hash, f"landmarks-{pipeline}.npz")
+        try:
+            sequence = LandmarkSequence.load(path)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        self.touch(content_hash)
+        return sequence
+
+    def store_landmarks(self, content_hash: str, pipeline: str, sequence: LandmarkSequence) -> None:
+        self._write_cache(content_hash, f"landmarks-{pipeline}.npz", sequence.save)
+
+    def load_errors(self, content_hash: str, key: str) -> Optional[List[Dict[str, Any]]]:
+        path = self._cache_path(content_hash, f"errors-{key}.json")
+        try:
+            with open(path) as f:
+                errors = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        self.touch(content_hash)
+        return errors
+
+    def store_errors(self, content_hash: str, key: str, errors: List[Dict[str, Any]]) -> None:
+        def write(path):
+            with open(path, "w") as f:
+                json.dump(errors, f)
+
+        self._write_cache(content_hash, f"errors-{key}.json", write)
+
+    def load_reps(self, content_hash: str, key: str) -> Optional[Dict[str, Any]]:
+        path = self._cache_path(content_hash, f"reps-{key}.json")
+        try:
+            with open(path) as f:
+                reps = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        self.touch(content_hash)
+        return reps
+
+    def store_reps(self, content_hash: str, key: str, reps: Optional[Dict[str, Any]]) -> None:
+        def write(path):
+            with open(path, "w") as f:
+                json.dump(reps, f)
+
+        self._write_cache(content_hash, f"reps-{key}.json", write)
+
+    def usage_bytes(self) -> int:
+        """Bytes used by videos and cached artifacts, measured by walking the store"""
+        total = 0
+        for directory in (self.videos_dir, self.cache_dir):
+            for dirpath, _, filenames in os.walk(directory):
+                for name in filenames:
+                    try:
+                        total += os.path.getsize(os.path.join(dirpath, name))
+                    except OSError:
+                        pass
+        return total
+
+    @telemetry.traced("upload_store.collect_garbage")
+    def collect_garbage(self, keep: Optional[str] = None) -> int:
+        """
+        Delete least recently used videos and their artifacts until the store fits its quota.
+
+        Args:
+            keep: Content hash that must survive this collection
+
+        Returns:
+            Number of bytes freed
+        """
+        if (self._usage <= self.max_bytes
+                and time.monotonic() - self._scanned_at < self.rescan_seconds):
+            return 0
+
+        with self._gc_lock:
+            # The running total only sees this process's writes, so re-measure before evicting
+            usage = self._rescan()
+            if usage <= self.max_bytes:
+                return 0
+
+            cutoff = time.time() - self.min_age_seconds
+            freed = 0
+
+            for last_used, content_hash, path in self._videos_by_last_use():
+                if usage - freed <= self.max_bytes:
+                    break
+                if content_hash == keep or last_used > cutoff:
+                    continue
+
+                freed += self._delete(content_hash, path)
+
+            if usage - freed > self.max_bytes:
+                logger.warning(f"Upload store is over quota ({(usage - freed) // 1024 ** 2} MB) "
+                               f"but all remaining videos are in use")
+
+            logger.info(f"Upload store garbage collection freed {freed // 1024 ** 2} MB")
+            return freed
+
+    def _rescan(self) -> int:
+        usage = self.usage_bytes()
+        with self._usage_lock:
+            self._usage = usage
+            self._scanned_at = time.monotonic()
+        return usage
+
+    def _add_usage(self, delta: int) -> None:
+        with self._usage_lock:
+            self._usage = max(0, self._usage + delta)
+
+    def _videos_by_last_use(self) -> List[Tuple[float, str, str]]:
+        videos = []
+        for dirpath, _, filenames in os.walk(self.videos_dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    videos.append((os.path.getmtime(path), os.path.splitext(name)[0], path))
+                except OSError:
+                    pass
+        videos.sort()
+        return videos
+
+    def _delete(self, content_hash: str, path: str) -> int:
+        freed = 0
+        cache_path = os.path.join(self.cache_dir, content_hash)
+
+        try:
+            freed += os.path.getsize(path)
+            os.remove(path)
+
+            if os.path.isdir(cache_path):
+                for name in os.listdir(cache_path):
+                    freed += os.path.getsize(os.path.join(cache_path, name))
+                shutil.rmtree(cache_path, ignore_errors=True)
+
+            logger.info(f"Evicted video {content_hash[:12]} from upload store")
+
+        except OSError as e:
+            logger.error(f"Error evicting video {content_hash[:12]}: {str(e)}")
+
+        self._add_usage(-freed)
+        return freed
+
+    @telemetry.traced("upload_store.write_cache")
+    def _write_cache(self, content_hash: str, name: str, write) -> None:
+        """Write an artifact atomically so readers never see a partial file"""
+        path = self._cache_path(content_hash, name)
+        tmp_path = os.path.join(self.tmp_dir, f"{uuid.uuid4()}.part")
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write(tmp_path)
+            size = os.path.getsize(tmp_path)
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(tmp_path, path)
+            self._add_usage(size)
+
+        except Exception as e:
+            logger.error(f"Error caching {name} for {content_hash[:12]}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _video_path(self, content_hash: str, extension: str) -> str:
+        return os.path.join(self.videos_dir, content_hash[:2], f"{content_hash}{extension}")
+
+    def _cache_path(self, content_hash: str, name: str) -> str:
+        return os.path.join(self.cache_dir, content_hash, name)
+
+    @staticmethod
+    def _extension(filename: str) -> str:
+        extension = os.path.splitext(filename or "")[1].lower()
+        return extension if re.fullmatch(r"\.[a-z0-9]{1,5}", extension) else ""
@@ -0,0 +1,433 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from agents import telemetry
+from agents.landmarks import LandmarkSequence, VISIBILITY, X, Y
+from agents.video_stream import VideoFrameStream
+
+logger = logging.getLogger(__name__)
+
+ANNOTATION_PENDING = "pending"
+ANNOTATION_READY = "ready"
+ANNOTATION_FAILED = "failed"
+
+# Bones drawn between MediaPipe Pose landmarks
+SKELETON = [
+    (11, 12), (11, 13), (13, 15), (12, 14), (14, 16),
+    (11, 23), (12, 24), (23, 24),
+    (23, 25), (25, 27), (27, 29), (29, 31), (27, 31),
+    (24, 26), (26, 28), (28, 30), (30, 32), (28, 32),
+    (0, 11), (0, 12)
+]
+
+SKELETON_COLOR = (80, 220, 80)
+ERROR_COLOR = (40, 40, 230)
+
+# H.264 profiles ffprobe reports that libx264 can encode a matching segment in
+X264_PROFILES = {"Constrained Baseline": "baseline", "Main": "main", "High": "high"}
+X264_PIXEL_FORMATS = ("yuv420p", "yuvj420p")
+
+# Stream parameters a re-encoded segment must share with the source to be joined with it
+SEGMENT_PARAMETERS = ("codec_name", "profile", "level", "pix_fmt", "width", "height")
+
+
+class SegmentMismatchError(Exception):
+    """Raised when a re-encoded segment can't be joined with the stream-copied source."""
+
+
+def merge_intervals(errors: List[Dict[str, Any]], padding: float = 0.0) -> List[Tuple[float, float]]:
+    """Time ranges in seconds covered by at least one error, padded and merged"""
+    spans = sorted(
+        (max(0.0, error["start_time"] - padding), error.get("end_time", error["start_time"]) + padding)
+        for error in errors if error.get("start_time") is not None
+    )
+
+    merged = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def draw_overlay(frame: np.ndarray, landmarks: Optional[np.ndarray], labels: List[str]) -> None:
+    """Draw the skeleton and error labels onto a BGR frame in place"""
+    height, width = frame.shape[:2]
+    thickness = max(2, round(min(width, height) / 240))
+
+    if landmarks is not None:
+        points = np.column_stack((landmarks[:, X] * width, landmarks[:, Y] * height)).astype(np.int32)
+        visible = landmarks[:, VISIBILITY] >= 0.5
+
+        for a, b in SKELETON:
+            if visible[a] and visible[b]:
+                cv2.line(frame, tuple(points[a]), tuple(points[b]), SKELETON_COLOR, thickness, cv2.LINE_AA)
+        for index in np.flatnonzero(visible):
+            cv2.circle(frame, tuple(points[index]), thickness + 1, SKELETON_COLOR, -1, cv2.LINE_AA)
+
+    scale = max(0.5, min(width, height) / 720)
+    line_height = int(32 * scale)
+    for row, label in enumerate(labels):
+        origin = (int(12 * scale), line_height * (row + 1))
+        cv2.putText(frame, label, origin, cv2.FONT_HERSHEY_SIMPLEX, 0.8 * scale, (0, 0, 0), thickness + 2, cv2.LINE_AA)
+        cv2.putText(frame, label, origin, cv2.FONT_HERSHEY_SIMPLEX, 0.8 * scale, ERROR_COLOR, thickness, cv2.LINE_AA)
+
+
+class VideoAnnotator:
+    """
+    Renders skeleton and error overlays onto analyzed videos in the background.
+
+    Only the error intervals are decoded, drawn and re-encoded. With ffmpeg and
+    an H.264 source, each interval is widened to the surrounding keyframes and
+    encoded with the source's profile, level and pixel format, the untouched
+    stretches in between are stream-copied, and the pieces are joined, so the
+    cost grows with the length of the errors rather than the clip. The pieces
+    go through MPEG-TS (Annex B, with SPS/PPS in-band at every keyframe) and the
+    output keeps the source's track timescale, so the decoder picks up each
+    piece's parameter sets and timing at the boundaries. When a re-encoded piece
+    can't match the source, or the source isn't H.264, the whole clip is
+    re-encoded with ffmpeg instead. Without ffmpeg the whole clip is rewritten
+    with OpenCV, if its build can write H.264; otherwise the annotator is not
+    `available`. Audio is not kept.
+
+    Output goes to `output_dir/<exercise_id>.mp4`; `status` reports whether a
+    rendering is pending, ready or failed. A `<exercise_id>.pending` marker
+    sits next to it from submission until the rendering ends, so every server
+    process sharing the directory reports a queued video as pending.
+    """
+
+    def __init__(self, output_dir: str = "annotated", max_workers: int = 1,
+                 ffmpeg: Optional[str] = None, ffprobe: Optional[str] = None, padding: float = 0.25,
+                 pending_timeout: float = 3600.0):
+        """
+        Args:
+            output_dir: Directory annotated videos are written to
+            max_workers: Videos rendered at the same time
+            ffmpeg: ffmpeg executable; looked up on PATH when None
+            ffprobe: ffprobe executable; looked up on PATH when None
+            padding: Seconds drawn before and after each error interval
+            pending_timeout: Seconds after which a pending marker left by a process
+                that died before finishing no longer counts
+        """
+        self.output_dir = os.path.abspath(output_dir)
+        self.ffmpeg = ffmpeg or shutil.which("ffmpeg")
+        self.ffprobe = ffprobe or shutil.which("ffprobe")
+        self.padding = padding
+        self.pending_timeout = pending_timeout
+
+        os.makedirs(output_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="annotator")
+        self._status = {}
+        self._lock = threading.Lock()
+
+        # Only H.264 plays in browsers: without ffmpeg, OpenCV must be able to write it
+        self.available = bool(self.ffmpeg and self.ffprobe) or self._opencv_writes_h264()
+
+        if self.available:
+            logger.info(f"Video annotator initialized ({'ffmpeg segment copy' if self.ffmpeg and self.ffprobe else 'OpenCV'})")
+        else:
+            logger.warning("Video annotator unavailable: ffmpeg is not installed and OpenCV can't write H.264")
+
+    def submit(self, exercise_id: str, video_path: str, errors: List[Dict[str, Any]],
+               load_landmarks: Callable[[], LandmarkSequence]) -> None:
+        """
+        Queue a video for annotation.
+
+        Args:
+            exercise_id: ID the annotated video is stored and served under
+            video_path: Path to the analyzed video
+            errors: Detected error intervals
+            load_landmarks: Returns the video's landmarks; called on the render thread
+        """
+        with self._lock:
+            self._status[exercise_id] = ANNOTATION_PENDING
+        with open(self._pending_path(exercise_id), "w") as f:
+            f.write(str(os.getpid()))
+        # Rendering is traced under the request that produced the analysis
+        self._executor.submit(telemetry.in_context(self._run), exercise_id, video_path, errors, load_landmarks)
+
+    def status(self, exercise_id: str) -> Optional[str]:
+        """Rendering state of an exercise, or None if it was never annotated"""
+        with self._lock:
+            state = self._status.get(exercise_id)
+        if state is not None:
+            return state
+
+        # Queued or rendered by another process
+        if os.path.exists(self.output_path(exercise_id)):
+            return ANNOTATION_READY
+        try:
+            if time.time() - os.path.getmtime(self._pending_path(exercise_id)) < self.pending_timeout:
+                return ANNOTATION_PENDING
+        except OSError:
+            pass
+        return None
+
+    def pending(self) -> int:
+        """Videos queued or being rendered"""
+        with self._lock:
+            return sum(state == ANNOTATION_PENDING for state in self._status.values())
+
+    def output_path(self, exercise_id: str) -> str:
+        return os.path.join(self.output_dir, f"{os.path.basename(exercise_id)}.mp4")
+
+    def _pending_path(self, exercise_id: str) -> str:
+        return os.path.join(self.output_dir, f"{os.path.basename(exercise_id)}.pending")
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, exercise_id: str, video_path: str, errors: List[Dict[str, Any]],
+             load_landmarks: Callable[[], LandmarkSequence]) -> None:
+        output_path = self.output_path(exercise_id)
+        partial_path = os.path.splitext(output_path)[0] + ".partial.mp4"
+        pending_path = self._pending_path(exercise_id)
+
+        # Restart the marker's timeout now that the video has left the queue
+        try:
+            os.utime(pending_path, None)
+        except OSError:
+            pass
+
+        try:
+            with telemetry.span("annotate.render", exercise_id=exercise_id):
+                self.annotate(video_path, errors, load_landmarks(), partial_path)
+            os.replace(partial_path, output_path)
+            state = ANNOTATION_READY
+            logger.info(f"Annotated video for exercise {exercise_id}")
+        except Exception as e:
+            logger.error(f"Error annotating video for exercise {exercise_id}: {str(e)}")
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            state = ANNOTATION_FAILED
+
+        # Only once the output is in place, so other processes never find neither file
+        try:
+            os.remove(pending_path)
+        except OSError:
+            pass
+
+        with self._lock:
+            if state == ANNOTATION_READY:
+                # The file itself records success, so the entry can go
+                self._status.pop(exercise_id, None)
+            else:
+                self._status[exercise_id] = state
+
+    def annotate(self, video_path: str, errors: List[Dict[str, Any]], sequence: LandmarkSequence,
+                 output_path: str) -> None:
+        """Write an MP4 of the video with overlays drawn during the error intervals"""
+        intervals = merge_intervals(errors, self.padding)
+
+        if not (self.ffmpeg and self.ffprobe):
+            self._annotate_whole(video_path, errors, intervals, sequence, output_path)
+            return
+
+        source = self._probe(video_path)
+        if self._can_copy(source):
+            try:
+                self._annotate_segments(video_path, source, errors, intervals, sequence, output_path)
+                return
+            except SegmentMismatchError as e:
+                logger.warning(f"{str(e)}; re-encoding the whole video")
+
+        stream = VideoFrameStream(video_path)
+        self._render(video_path, errors, intervals, sequence, stream, 0.0, None, output_path,
+                     output_args=("-movflags", "+faststart", "-f", "mp4"))
+
+    def _annotate_segments(self, video_path: str, source: Dict[str, Any], errors: List[Dict[str, Any]],
+                           intervals: List[Tuple[float, float]], sequence: LandmarkSequence,
+                           output_path: str) -> None:
+        stream = VideoFrameStream(video_path)
+        duration = stream.frame_count / stream.fps
+        keyframes = self._keyframes(video_path)
+
+        # Widen each interval to keyframes so the copied stretches start on one
+        ranges = []
+        for start, end in intervals:
+            start = max([time for time in keyframes if time <= start], default=0.0)
+            end = min([time for time in keyframes if time > end], default=duration)
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+            else:
+                ranges.append((start, end))
+
+        # Match the source so the decoder can continue across the joins
+        encode_args = ("-profile:v", X264_PROFILES[source["profile"]], "-level", str(source["level"]),
+                       "-pix_fmt", source["pix_fmt"])
+
+        with tempfile.TemporaryDirectory(prefix="annotate-") as work_dir:
+            # Split the source at every range boundary in one copy pass. The segment muxer
+            # cuts in decode order, so no frames of the next group of pictures leak across
+            bounds = sorted({time for time_range in ranges for time in time_range if 0.0 < time < duration})
+            command = ["-i", video_path, "-map", "0:v:0", "-c", "copy", "-an", "-bsf:v", "h264_mp4toannexb",
+                       "-f", "segment", "-segment_format", "mpegts", "-reset_timestamps", "1"]
+            if bounds:
+                # Slightly early, so a keyframe whose time was rounded down still starts the next piece
+                command += ["-segment_times", ",".join(f"{max(0.0, time - 0.001):.6f}" for time in bounds)]
+            self._ffmpeg(*command, os.path.join(work_dir, "copy-%04d.ts"))
+
+            starts = [0.0] + bounds
+            pieces = [os.path.join(work_dir, f"copy-{index:04d}.ts") for index in range(len(starts))]
+            if not all(os.path.exists(piece) for piece in pieces):
+                raise SegmentMismatchError("The source could not be split at its keyframes")
+
+            for start, end in ranges:
+                index = starts.index(start)
+                piece = os.path.join(work_dir, f"render-{index:04d}.ts")
+                self._render(video_path, errors, intervals, sequence, stream, start, end, piece,
+                             rate=source["frame_rate"], encode_args=encode_args, output_args=("-f", "mpegts"))
+                self._check_segment(source, piece)
+                pieces[index] = piece
+
+            playlist = os.path.join(work_dir, "pieces.txt")
+            with open(playlist, "w") as f:
+                f.writelines(f"file '{piece}'\n" for piece in pieces)
+
+            self._ffmpeg("-f", "concat", "-safe", "0", "-i", playlist, "-map", "0:v:0", "-c", "copy",
+                         "-video_track_timescale", str(source["timescale"]),
+                         "-movflags", "+faststart", "-f", "mp4", output_path)
+
+    def _render(self, video_path: str, errors: List[Dict[str, Any]], intervals: List[Tuple[float, float]],
+                sequence: LandmarkSequence, stream: VideoFrameStream, start: float, end: Optional[float],
+                output_path: str, rate: Optional[str] = None, encode_args: Tuple[str, ...] = ("-pix_fmt", "yuv420p"),
+                output_args: Tuple[str, ...] = ()) -> None:
+        """Decode, draw and encode the frames from start to end seconds (the end of the video when None)"""
+        encoder = subprocess.Popen(
+            [self.ffmpeg, "-v", "error", "-y", "-f", "rawvideo", "-pix_fmt", "bgr24",
+             "-s", f"{stream.width}x{stream.height}", "-r", rate or f"{stream.fps}", "-i", "-",
+             "-c:v", "libx264", "-preset", "veryfast", *encode_args, "-an", *output_args, output_path],
+            stdin=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        try:
+            frames = VideoFrameStream(video_path, start_frame=int(round(start * stream.fps)),
+                                      end_frame=int(round(end * stream.fps)) if end is not None else None)
+            for frame_index, frame in frames:
+                self._draw(frame, frame_index, stream.fps, errors, intervals, sequence)
+                encoder.stdin.write(frame.tobytes())
+        finally:
+            # Closes stdin, so the encoder flushes and exits
+            _, stderr = encoder.communicate()
+
+        if encoder.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed encoding a segment: {stderr.decode(errors='replace').strip()}")
+
+    def _check_segment(self, source: Dict[str, Any], piece_path: str) -> None:
+        piece = self._probe(piece_path)
+        for name in SEGMENT_PARAMETERS:
+            if piece.get(name) != source.get(name):
+                raise SegmentMismatchError(
+                    f"Re-encoded segment has {name} {piece.get(name)}, the source {source.get(name)}"
+                )
+
+    @staticmethod
+    def _can_copy(source: Dict[str, Any]) -> bool:
+        """Whether segments of the source can be re-encoded to match it"""
+        return (source.get("codec_name") == "h264" and source.get("profile") in X264_PROFILES
+                and source.get("pix_fmt") in X264_PIXEL_FORMATS and bool(source.get("level"))
+                and bool(source.get("timescale")) and bool(source.get("frame_rate")))
+
+    def _annotate_whole(self, video_path: str, errors: List[Dict[str, Any]],
+                        intervals: List[Tuple[float, float]], sequence: LandmarkSequence,
+                        output_path: str) -> None:
+        stream = VideoFrameStream(video_path)
+
+        # Browsers only play H.264 MP4s; an MPEG-4 Part 2 fallback would be served but never play
+        writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"avc1"), stream.fps,
+                                 (stream.width, stream.height))
+        if not writer.isOpened():
+            writer.release()
+            raise RuntimeError("OpenCV can't write H.264 and ffmpeg is not installed")
+
+        try:
+            for frame_index, frame in stream:
+                self._draw(frame, frame_index, stream.fps, errors, intervals, sequence)
+                writer.write(frame)
+        finally:
+            writer.release()
+
+    @staticmethod
+    def _opencv_writes_h264() -> bool:
+        with tempfile.TemporaryDirectory(prefix="annotate-") as work_dir:
+            writer = cv2.VideoWriter(os.path.join(work_dir, "probe.mp4"), cv2.VideoWriter_fourcc(*"avc1"),
+                                     30.0, (64, 64))
+            try:
+                return writer.isOpened()
+            finally:
+                writer.release()
+
+    def _draw(self, frame: np.ndarray, frame_index: int, fps: float, errors: List[Dict[str, Any]],
+              intervals: List[Tuple[float, float]], sequence: LandmarkSequence) -> None:
+        time = frame_index / fps
+        if not any(start <= time <= end for start, end in intervals):
+            return
+
+        labels = [error.get("description", error.get("type", "")) for error in errors
+                  if error.get("start_time") is not None
+                  and error["start_time"] <= time <= error.get("end_time", error["start_time"])]
+        draw_overlay(frame, self._landmarks_at(sequence, frame_index), labels)
+
+    @staticmethod
+    def _landmarks_at(sequence: LandmarkSequence, frame_index: int) -> Optional[np.ndarray]:
+        """Landmarks of the latest analyzed frame at or before a source frame"""
+        row = int(np.searchsorted(sequence.frame_indices, frame_index, side="right")) - 1
+        if row < 0 or not sequence.detected[row]:
+            return None
+
+        # Strided analysis leaves frames in between; don't hold a pose across longer gaps
+        step = np.median(np.diff(sequence.frame_indices)) if len(sequence) > 1 else 1
+        if frame_index - sequence.frame_indices[row] > 2 * step:
+            return None
+        return sequence.data[row]
+
+    def _probe(self, video_path: str) -> Dict[str, Any]:
+        """Codec parameters and timing of the video's first video stream"""
+        output = subprocess.run(
+            [self.ffprobe, "-v", "error", "-select_streams", "v:0", "-show_entries",
+             "stream=codec_name,profile,level,pix_fmt,width,height,time_base,avg_frame_rate,r_frame_rate",
+             "-of", "json", video_path],
+            capture_output=True, check=True, text=True
+        ).stdout
+        streams = json.loads(output).get("streams") or [{}]
+        source = streams[0]
+
+        # Track timescale, e.g. 15360 for a 1/15360 time base
+        _, _, denominator = source.get("time_base", "").partition("/")
+        source["timescale"] = int(denominator) if denominator.isdigit() else None
+
+        # Variable frame rate sources report their real rate as the average
+        source["frame_rate"] = next((rate for rate in (source.get("avg_frame_rate"), source.get("r_frame_rate"))
+                                     if rate and not rate.startswith("0")), None)
+        return source
+
+    def _keyframes(self, video_path: str) -> List[float]:
+        """Presentation times in seconds of the video's keyframes"""
+        output = subprocess.run(
+            [self.ffprobe, "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags",
+             "-of", "csv=p=0", video_path],
+            capture_output=True, check=True, text=True
+        ).stdout
+
+        times = []
+        for line in output.splitlines():
+            pts_time, _, flags = line.partition(",")
+            if "K" in flags and pts_time not in ("", "N/A"):
+                times.append(float(pts_time))
+        return sorted(times)
+
+    def _ffmpeg(self, *args: str) -> None:
+        result = subprocess.run([self.ffmpeg, "-v", "error", "-y", *args], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
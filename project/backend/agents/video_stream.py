@@ -0,0 +1,141 @@
+import logging
+import queue
+import threading
+from typing import Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the decoded frames in the prefetch queue
+_END_OF_STREAM = object()
+
+
+class VideoFrameStream:
+    """
+    Lazily decodes a video file one frame at a time.
+
+    Iterating yields (frame_index, frame) pairs, where frame_index is the frame's
+    position in the source video. Decoding runs on a background thread that stays
+    at most `prefetch` frames ahead of the consumer, so memory use is bounded by
+    the prefetch buffer no matter how long the clip is.
+    """
+
+    def __init__(self, video_path: str, frame_stride: int = 1, target_fps: Optional[float] = None,
+                 max_dimension: Optional[int] = None, prefetch: int = 8,
+                 start_frame: int = 0, end_frame: Optional[int] = None):
+        """
+        Args:
+            video_path: Path to the video file
+            frame_stride: Analyze every n-th frame
+            target_fps: Analysis frame rate; overrides frame_stride when set
+            max_dimension: Downscale frames so their longest side is at most this many pixels
+            prefetch: Number of decoded frames buffered ahead of the consumer
+            start_frame: First source frame to decode
+            end_frame: Source frame to stop before; decodes to the end of the video when None
+        """
+        self.video_path = video_path
+        self.start_frame = max(0, start_frame)
+        self.end_frame = end_frame
+        self.max_dimension = max_dimension
+        self.prefetch = max(1, prefetch)
+
+        capture = cv2.VideoCapture(video_path)
+        if not capture.isOpened():
+            raise ValueError(f"Could not open video: {video_path}")
+
+        try:
+            self.fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+            self.frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            self.width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        finally:
+            capture.release()
+
+        if target_fps:
+            frame_stride = round(self.fps / target_fps)
+        self.frame_stride = max(1, int(frame_stride))
+
+    @property
+    def analysis_fps(self) -> float:
+        """Rate at which frames are yielded, in frames per second of video"""
+        return self.fps / self.frame_stride
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        frames = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        decoder = threading.Thread(target=self._decode, args=(frames, stop),
+                                   name="frame-decoder", daemon=True)
+        decoder.start()
+
+        try:
+            while True:
+                item = frames.get()
+                if item is _END_OF_STREAM:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Unblock the decoder if the consumer stopped early
+            stop.set()
+            while decoder.is_alive():
+                try:
+                    frames.get_nowait()
+                except queue.Empty:
+                    decoder.join(0.05)
+
+    def _decode(self, frames: queue.Queue, stop: threading.Event) -> None:
+        capture = cv2.VideoCapture(self.video_path)
+
+        try:
+            frame_index = self.start_frame
+            if frame_index:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+
+            while not stop.is_set():
+                if self.end_frame is not None and frame_index >= self.end_frame:
+                    break
+
+                # grab() skips the colour conversion and copy for frames we don't analyze
+                if not capture.grab():
+                    break
+
+                if frame_index % self.frame_stride == 0:
+                    ok, frame = capture.retrieve()
+                    if not ok:
+                        break
+                    self._put(frames, (frame_index, self._downscale(frame)), stop)
+
+                frame_index += 1
+
+            self._put(frames, _END_OF_STREAM, stop)
+
+        except Exception as e:
+            logger.error(f"Error decoding video {self.video_path}: {str(e)}")
+            self._put(frames, e, stop)
+
+        finally:
+            capture.release()
+
+    def _downscale(self, frame: np.ndarray) -> np.ndarray:
+        if not self.max_dimension:
+            return frame
+
+        height, width = frame.shape[:2]
+        scale = self.max_dimension / max(height, width)
+        if scale >= 1.0:
+            return frame
+
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def _put(frames: queue.Queue, item, stop: threading.Event) -> None:
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
@@ -1,18 +1,25 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS
+import click
 import os
+import re
 import uuid
 import json
-from datetime import datetime
+import atexit
+import tempfile
+import time
+from datetime import date, datetime
 import logging
 
-# Import agent modules
-from agents.agent_manager import AgentManager
-from agents.computer_vision_agent import ComputerVisionAgent
-from agents.llm_agent import LLMAgent
-from agents.motion_capture_agent import MotionCaptureAgent
-from agents.feedback_combiner import FeedbackCombiner
+# Import agent modules; the heavy agents are imported by their registry factories
+from agents.agent_registry import AgentRegistry
 from agents.logger import Logger
+from agents.upload_store import UploadStore
+from agents.feedback_cache import FeedbackCache
+from agents.job_queue import JobQueue, QueueFullError, JOB_COMPLETED, JOB_FAILED
+from agents.pose_quality import QUALITY_TIERS
+from agents.response_cache import ResponseCache, make_etag
+from agents import telemetry
 
 app = Flask(__name__)
 CORS(app)
@@ -22,38 +29,348 @@ logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize agents
-computer_vision_agent = ComputerVisionAgent()
-llm_agent = LLMAgent()
-motion_capture_agent = MotionCaptureAgent()
-feedback_combiner = FeedbackCombiner()
-system_logger = Logger()
-agent_manager = AgentManager(
-    computer_vision_agent=computer_vision_agent,
-    llm_agent=llm_agent,
-    motion_capture_agent=motion_capture_agent,
-    feedback_combiner=feedback_combiner,
-    logger=system_logger
+# Content-addressed store for uploaded videos and cached analysis artifacts
+UPLOAD_FOLDER = 'uploads'
+UPLOAD_QUOTA_MB = int(os.getenv('UPLOAD_QUOTA_MB', '10240'))
+upload_store = UploadStore(root=UPLOAD_FOLDER, max_bytes=UPLOAD_QUOTA_MB * 1024 * 1024)
+
+# Frame sampling for video analysis
+ANALYSIS_FPS = float(os.getenv('ANALYSIS_FPS', '0')) or None
+FRAME_STRIDE = int(os.getenv('FRAME_STRIDE', '1'))
+MAX_FRAME_DIMENSION = int(os.getenv('MAX_FRAME_DIMENSION', '0')) or None
+
+# Pose estimation worker processes (defaults to one per CPU core)
+POSE_WORKERS = int(os.getenv('POSE_WORKERS')) if os.getenv('POSE_WORKERS') else None
+POSE_SEGMENT_SECONDS = float(os.getenv('POSE_SEGMENT_SECONDS', '10'))
+
+# Annotated videos with skeleton and error overlays, rendered in the background
+ANNOTATE_VIDEOS = os.getenv('ANNOTATE_VIDEOS', '1') == '1'
+ANNOTATED_FOLDER = os.getenv('ANNOTATED_FOLDER', 'annotated')
+ANNOTATION_WORKERS = int(os.getenv('ANNOTATION_WORKERS', '1'))
+
+# Pose estimation worker start method; defaults to "forkserver", which keeps models
+# and the locks of running threads in this process out of the pose workers
+POSE_START_METHOD = os.getenv('POSE_START_METHOD') or None
+
+# Default pose quality tier for uploads that don't pick one: fast, balanced or accurate
+POSE_QUALITY = os.getenv('POSE_QUALITY', 'accurate')
+
+# Pose inference on a padded crop around the athlete instead of the whole frame
+POSE_ROI = os.getenv('POSE_ROI', '1') == '1'
+POSE_ROI_PADDING = float(os.getenv('POSE_ROI_PADDING', '0.25'))
+POSE_ROI_DIMENSION = int(os.getenv('POSE_ROI_DIMENSION', '480'))
+
+# Exercise recognition for uploads sent with exerciseType=unknown; classifier
+# windows from concurrent requests are batched, waiting at most this long
+CLASSIFIER_BATCH_SIZE = int(os.getenv('CLASSIFIER_BATCH_SIZE', '256'))
+CLASSIFIER_MAX_LATENCY_MS = float(os.getenv('CLASSIFIER_MAX_LATENCY_MS', '20'))
+
+# Cache of LLM feedback keyed by error profile
+FEEDBACK_CACHE_SIZE = int(os.getenv('FEEDBACK_CACHE_SIZE', '1024'))
+FEEDBACK_CACHE_TTL = int(os.getenv('FEEDBACK_CACHE_TTL', str(24 * 3600)))
+FEEDBACK_CACHE_PATH = os.getenv('FEEDBACK_CACHE_PATH', os.path.join('data', 'feedback_cache.json')) or None
+feedback_cache = FeedbackCache(
+    max_entries=FEEDBACK_CACHE_SIZE,
+    ttl_seconds=FEEDBACK_CACHE_TTL,
+    persist_path=FEEDBACK_CACHE_PATH
 )
+atexit.register(feedback_cache.close)
 
-# Create uploads directory if it doesn't exist
-UPLOAD_FOLDER = 'uploads'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Record persistence; write-behind batches disk writes off the request path
+system_logger = Logger(
+    write_mode=os.getenv('LOGGER_WRITE_MODE', 'write_behind'),
+    flush_interval=float(os.getenv('LOGGER_FLUSH_INTERVAL', '1.0')),
+    batch_size=int(os.getenv('LOGGER_BATCH_SIZE', '256')),
+    durability=os.getenv('LOGGER_DURABILITY', 'buffered'),
+    snapshot_interval=float(os.getenv('LOGGER_SNAPSHOT_INTERVAL', '300'))
+)
+# Flush queued records on shutdown
+atexit.register(system_logger.close)
+
+# Conditional GET and compression for the read endpoints, with encoded bodies
+# of recently read versions kept in memory
+RESPONSE_CACHE_MB = float(os.getenv('RESPONSE_CACHE_MB', '32'))
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+response_cache = ResponseCache(
+    max_bytes=int(RESPONSE_CACHE_MB * 1024 * 1024),
+    min_size=COMPRESS_MIN_BYTES
+)
+
+# Spans of every request and job feed the histograms at /api/metrics; with
+# TRACE_FILE set they are also appended to that file as JSON lines
+TRACE_FILE = os.getenv('TRACE_FILE') or None
+telemetry.configure_tracing(TRACE_FILE)
+atexit.register(telemetry.close_tracing)
+
+# Request IDs accepted from clients and proxies in X-Request-ID; others are replaced
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+HTTP_REQUEST_SECONDS = telemetry.metrics.histogram(
+    'formfit_http_request_duration_seconds',
+    'Time to answer HTTP requests',
+    ('method', 'endpoint', 'status')
+)
+
+@app.before_request
+def start_request_trace():
+    request_id = request.headers.get('X-Request-ID', '')
+    if not REQUEST_ID_PATTERN.match(request_id):
+        request_id = telemetry.new_request_id()
+    g.request_id = request_id
+    g.request_id_token = telemetry.set_request_id(request_id)
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def finish_request_trace(response):
+    if 'request_started' in g:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.request_started,
+                                     method=request.method, endpoint=endpoint, status=response.status_code)
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@app.teardown_request
+def end_request_trace(exception=None):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        telemetry.reset_request_id(token)
+
+# Initialize agents lazily: each is built on first use or by warm-up, so the
+# app imports quickly and /api/health answers while models are loading
+def create_computer_vision_agent():
+    from agents.computer_vision_agent import ComputerVisionAgent
+    agent = ComputerVisionAgent(
+        frame_stride=FRAME_STRIDE,
+        target_fps=ANALYSIS_FPS,
+        max_frame_dimension=MAX_FRAME_DIMENSION,
+        pose_workers=POSE_WORKERS,
+        segment_seconds=POSE_SEGMENT_SECONDS,
+        upload_store=upload_store,
+        pose_start_method=POSE_START_METHOD,
+        pose_quality=POSE_QUALITY,
+        person_roi=POSE_ROI,
+        roi_padding=POSE_ROI_PADDING,
+        roi_dimension=POSE_ROI_DIMENSION,
+        classifier_batch_size=CLASSIFIER_BATCH_SIZE,
+        classifier_max_latency=CLASSIFIER_MAX_LATENCY_MS / 1000
+    )
+    try:
+        agent.warm_up()
+    except Exception:
+        # Don't leave the pose workers running when the agent can't be built
+        agent.pose_engine.close()
+        raise
+    return agent
+
+def create_llm_agent():
+    from agents.llm_agent import LLMAgent
+    return LLMAgent(feedback_cache=feedback_cache)
+
+def create_motion_capture_agent():
+    from agents.motion_capture_agent import MotionCaptureAgent
+    return MotionCaptureAgent()
+
+def create_feedback_combiner():
+    from agents.feedback_combiner import FeedbackCombiner
+    return FeedbackCombiner()
+
+def create_video_annotator():
+    from agents.video_annotator import VideoAnnotator
+    annotator = VideoAnnotator(output_dir=ANNOTATED_FOLDER, max_workers=ANNOTATION_WORKERS)
+    atexit.register(annotator.shutdown)
+    return annotator
+
+def create_agent_manager():
+    from agents.agent_manager import AgentManager
+    return AgentManager(
+        computer_vision_agent=agents.get('computer_vision_agent'),
+        llm_agent=agents.get('llm_agent'),
+        motion_capture_agent=agents.get('motion_capture_agent'),
+        feedback_combiner=agents.get('feedback_combiner'),
+        logger=system_logger,
+        video_annotator=agents.get('video_annotator') if ANNOTATE_VIDEOS else None
+    )
+
+agents = AgentRegistry()
+agents.register('computer_vision_agent', create_computer_vision_agent)
+agents.register('llm_agent', create_llm_agent)
+agents.register('motion_capture_agent', create_motion_capture_agent)
+agents.register('feedback_combiner', create_feedback_combiner)
+agents.register('video_annotator', create_video_annotator)
+agents.register('agent_manager', create_agent_manager)
+
+# Live sessions: frames are analyzed as they arrive, each within a latency budget
+STREAM_FRAME_BUDGET_MS = float(os.getenv('STREAM_FRAME_BUDGET_MS', '150'))
+STREAM_MAX_SESSIONS = int(os.getenv('STREAM_MAX_SESSIONS', '4'))
+STREAM_IDLE_SECONDS = float(os.getenv('STREAM_IDLE_SECONDS', '60'))
+STREAM_MODEL_COMPLEXITY = int(os.getenv('STREAM_MODEL_COMPLEXITY', '1'))
+# Sessions are held in memory by the process that opened them; their IDs start with this
+STREAM_INSTANCE = os.getenv('STREAM_INSTANCE') or None
+
+def create_live_session_manager():
+    from agents.live_sessions import LiveSessionManager
+    computer_vision_agent = agents.get('computer_vision_agent')
+    manager = LiveSessionManager(
+        create_estimator=lambda: computer_vision_agent.pose_engine.live_estimator(STREAM_MODEL_COMPLEXITY),
+        rule_engine=computer_vision_agent.rule_engine,
+        frame_budget=STREAM_FRAME_BUDGET_MS / 1000,
+        max_sessions=STREAM_MAX_SESSIONS,
+        idle_timeout=STREAM_IDLE_SECONDS,
+        instance_id=STREAM_INSTANCE
+    )
+    atexit.register(manager.shutdown)
+    return manager
+
+agents.register('live_sessions', create_live_session_manager)
+
+# Load every agent in the background as soon as the app starts, instead of on the first upload
+WARM_UP_ON_START = os.getenv('WARM_UP_ON_START', '1') == '1'
+
+# Background analysis jobs
+JOBS_FOLDER = 'jobs'
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_QUEUE_DEPTH = int(os.getenv('JOB_QUEUE_DEPTH', '16'))
+
+def run_analysis_job(payload, report_progress):
+    """Run one queued upload, or batch of uploads, through the agent pipeline"""
+    if "clips" in payload:
+        return agents.get('agent_manager').process_batch(
+            clips=payload["clips"],
+            fitness_level=payload["fitness_level"],
+            user_id=payload["user_id"],
+            quality=payload.get("quality"),
+            progress_callback=report_progress
+        )
+    
+    return agents.get('agent_manager').process_exercise_video(
+        video_path=payload["video_path"],
+        exercise_type=payload["exercise_type"],
+        fitness_level=payload["fitness_level"],
+        user_id=payload["user_id"],
+        video_hash=payload.get("video_hash"),
+        quality=payload.get("quality"),
+        progress_callback=report_progress
+    )
+
+job_queue = JobQueue(
+    handler=run_analysis_job,
+    jobs_dir=JOBS_FOLDER,
+    num_workers=JOB_WORKERS,
+    max_queue_depth=JOB_QUEUE_DEPTH
+)
+
+# Queue depths and cache counts, read whenever /api/metrics is scraped
+def loaded_agent_value(name, read):
+    """Read a value from an agent, or 0 while it isn't loaded (scrapes never build agents)"""
+    return read(agents.get(name)) if agents.is_loaded(name) else 0
+
+QUEUE_DEPTH = telemetry.metrics.gauge(
+    'formfit_queue_depth',
+    'Items waiting in internal queues',
+    ('queue',)
+)
+QUEUE_DEPTH.set_function(lambda: job_queue.stats()['queued'], queue='jobs')
+QUEUE_DEPTH.set_function(system_logger.pending_writes, queue='record_writes')
+QUEUE_DEPTH.set_function(lambda: loaded_agent_value('video_annotator', lambda annotator: annotator.pending()),
+                         queue='annotations')
+QUEUE_DEPTH.set_function(lambda: loaded_agent_value('computer_vision_agent',
+                                                    lambda agent: agent.classifier.batcher.pending()),
+                         queue='classifier')
+
+JOBS_RUNNING = telemetry.metrics.gauge('formfit_jobs_running', 'Analysis jobs being processed')
+JOBS_RUNNING.set_function(lambda: job_queue.stats()['running'])
+
+LIVE_SESSIONS = telemetry.metrics.gauge('formfit_live_sessions', 'Open live analysis sessions')
+LIVE_SESSIONS.set_function(lambda: loaded_agent_value('live_sessions', lambda manager: manager.stats()['sessions']))
+
+CACHE_ENTRIES = telemetry.metrics.gauge('formfit_cache_entries', 'Entries held by in-memory caches', ('cache',))
+CACHE_ENTRIES.set_function(lambda: feedback_cache.stats()['size'], cache='feedback')
+CACHE_ENTRIES.set_function(lambda: response_cache.stats()['size'], cache='response')
+
+CACHE_LOOKUPS = telemetry.metrics.counter('formfit_cache_lookups_total', 'Cache lookups', ('cache', 'result'))
+for result in ('hits', 'misses'):
+    CACHE_LOOKUPS.set_function(lambda result=result: feedback_cache.stats()[result], cache='feedback', result=result)
+    CACHE_LOOKUPS.set_function(lambda result=result: response_cache.stats()[result], cache='response', result=result)
+
+AGENT_READY = telemetry.metrics.gauge('formfit_agent_ready', 'Whether each agent has been loaded', ('agent',))
+for name in agents.names():
+    AGENT_READY.set_function(lambda name=name: agents.is_loaded(name), agent=name)
+
+# Clips accepted in one batch upload; a batch is a single job
+BATCH_MAX_CLIPS = int(os.getenv('BATCH_MAX_CLIPS', '20'))
+
+# Exercise listings are paged so responses don't grow with a user's history
+EXERCISE_PAGE_SIZE = int(os.getenv('EXERCISE_PAGE_SIZE', '50'))
+EXERCISE_MAX_PAGE_SIZE = int(os.getenv('EXERCISE_MAX_PAGE_SIZE', '200'))
+
+def queue_full_response():
+    response = jsonify({"error": "Server is busy, please retry later"})
+    response.headers['Retry-After'] = str(job_queue.retry_after_seconds())
+    return response, 429
+
+def parse_time_arg(value, end_of_day=False):
+    """Validate an ISO date or date-time query argument"""
+    if not value:
+        return None
+    
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}")
+    
+    # Stored timestamps are naive local ISO strings and compare as text, so a
+    # time with an offset is converted to the server's local time first
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    if len(value) == 10 and end_of_day:
+        parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return parsed.isoformat()
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()})
+    """Liveness: the process is up and serving, whether or not the agents are loaded"""
+    return jsonify({
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "jobs": job_queue.stats(),
+        "feedback_cache": feedback_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "restore": system_logger.restore_status()
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Latency histograms, counters and queue gauges in the Prometheus text format"""
+    return Response(telemetry.metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: 200 once every agent is loaded and the record index is restored, else 503"""
+    agents_ready = agents.is_ready()
+    restore = system_logger.restore_status()
+    ready = agents_ready and restore["state"] == "ready"
+    
+    return jsonify({
+        "status": "ready" if ready else "not_ready",
+        "timestamp": datetime.now().isoformat(),
+        "agents": agents.status(),
+        "restore": restore
+    }), 200 if ready else 503
 
 @app.route('/api/upload', methods=['POST'])
 def upload_video():
     """
-    Upload and process an exercise video
+    Upload an exercise video and queue it for analysis
+    
+    Responds with 202 and a job ID right away; poll /api/jobs/<job_id> for
+    progress and fetch /api/jobs/<job_id>/result once it has completed.
     ---
     Expected form data:
     - video: The exercise video file
     - exerciseType: Type of exercise (e.g., 'squat', 'deadlift')
     - fitnessLevel: User's fitness level (e.g., 'beginner', 'intermediate', 'advanced')
     - userId: Optional user ID for tracking
+    - quality: Optional pose quality tier ('fast', 'balanced' or 'accurate')
     """
     try:
         if 'video' not in request.files:
@@ -63,51 +380,362 @@ def upload_video():
         if video_file.filename == '':
             return jsonify({"error": "No video file selected"}), 400
         
+        # Refuse early so we don't store a video we can't process
+        if job_queue.is_full():
+            return queue_full_response()
+        
         # Get form data
         exercise_type = request.form.get('exerciseType', 'unknown')
         fitness_level = request.form.get('fitnessLevel', 'beginner')
         user_id = request.form.get('userId', 'anonymous')
+        quality = request.form.get('quality') or POSE_QUALITY
         
-        # Generate unique ID for this upload
-        upload_id = str(uuid.uuid4())
+        if quality not in QUALITY_TIERS:
+            return jsonify({"error": f"quality must be one of: {', '.join(QUALITY_TIERS)}"}), 400
         
-        # Save video temporarily
-        video_path = os.path.join(UPLOAD_FOLDER, f"{upload_id}_{video_file.filename}")
-        video_file.save(video_path)
+        # Store the video by content hash; identical re-uploads reuse earlier analysis
+        video_hash, video_path = upload_store.save(video_file.stream, video_file.filename)
         
-        logger.info(f"Video saved at {video_path}, starting analysis")
+        logger.info(f"Video saved at {video_path}, queueing analysis")
         
-        # Process the video through agent manager
-        result = agent_manager.process_exercise_video(
-            video_path=video_path,
-            exercise_type=exercise_type,
-            fitness_level=fitness_level,
-            user_id=user_id
-        )
+        try:
+            job = job_queue.submit({
+                "video_path": video_path,
+                "exercise_type": exercise_type,
+                "fitness_level": fitness_level,
+                "user_id": user_id,
+                "video_hash": video_hash,
+                "quality": quality
+            })
+        except QueueFullError:
+            # The stored video is left for the store's garbage collection
+            return queue_full_response()
         
-        # Return the combined feedback and analysis
         return jsonify({
-            "id": upload_id,
-            "status": "success",
-            "result": result
-        })
+            "id": job["id"],
+            "status": job["status"],
+            "status_url": f"/api/jobs/{job['id']}",
+            "result_url": f"/api/jobs/{job['id']}/result"
+        }), 202
         
     except Exception as e:
         logger.error(f"Error processing video: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/uploads/batch', methods=['POST'])
+def upload_batch():
+    """
+    Upload a session of exercise videos and queue them for analysis together
+    
+    The clips share one job: their pose extraction is scheduled together and one
+    coaching request covers the session. Responds with 202 and a batch ID; poll
+    /api/batches/<batch_id> for each clip's state and result as it finishes.
+    ---
+    Expected form data:
+    - videos: The exercise video files, in session order
+    - exerciseType: One type for every clip, or one per clip in the same order
+    - fitnessLevel: User's fitness level
+    - userId: Optional user ID for tracking
+    - quality: Optional pose quality tier ('fast', 'balanced' or 'accurate')
+    """
+    try:
+        video_files = [video_file for video_file in request.files.getlist('videos') if video_file.filename]
+        if not video_files:
+            return jsonify({"error": "No video files provided"}), 400
+        
+        if len(video_files) > BATCH_MAX_CLIPS:
+            return jsonify({"error": f"At most {BATCH_MAX_CLIPS} videos per batch"}), 400
+        
+        exercise_types = request.form.getlist('exerciseType') or ['unknown']
+        if len(exercise_types) == 1:
+            exercise_types = exercise_types * len(video_files)
+        elif len(exercise_types) != len(video_files):
+            return jsonify({"error": "Send one exerciseType, or one per video"}), 400
+        
+        fitness_level = request.form.get('fitnessLevel', 'beginner')
+        user_id = request.form.get('userId', 'anonymous')
+        quality = request.form.get('quality') or POSE_QUALITY
+        
+        if quality not in QUALITY_TIERS:
+            return jsonify({"error": f"quality must be one of: {', '.join(QUALITY_TIERS)}"}), 400
+        
+        if job_queue.is_full():
+            return queue_full_response()
+        
+        clips = []
+        for video_file, exercise_type in zip(video_files, exercise_types):
+            video_hash, video_path = upload_store.save(video_file.stream, video_file.filename)
+            clips.append({
+                "video_path": video_path,
+                "video_hash": video_hash,
+                "exercise_type": exercise_type,
+                "filename": video_file.filename
+            })
+        
+        logger.info(f"Saved {len(clips)} videos, queueing batch analysis")
+        
+        try:
+            job = job_queue.submit(
+                {
+                    "clips": clips,
+                    "fitness_level": fitness_level,
+                    "user_id": user_id,
+                    "quality": quality
+                },
+                partial={str(index): {"index": index, "filename": clip["filename"], "status": "queued"}
+                         for index, clip in enumerate(clips)}
+            )
+        except QueueFullError:
+            return queue_full_response()
+        
+        return jsonify({
+            "id": job["id"],
+            "status": job["status"],
+            "clips": len(clips),
+            "status_url": f"/api/batches/{job['id']}"
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Error processing batch upload: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/batches/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    """Get the state of every clip of a batch, with results for the clips that are done"""
+    try:
+        job = job_queue.get_result(batch_id)
+        
+        # Batch jobs start out with a partial entry per clip
+        if not job or not job["partial"]:
+            return jsonify({"error": "Batch not found"}), 404
+        
+        if job["status"] == JOB_COMPLETED:
+            clips = job["result"]["clips"]
+            session_feedback = job["result"]["session_feedback"]
+        else:
+            clips = [job["partial"][key] for key in sorted(job["partial"], key=int)]
+            session_feedback = None
+        
+        return jsonify({
+            "id": job["id"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "error": job["error"],
+            "session_feedback": session_feedback,
+            "clips": clips
+        }), 200 if job["status"] in (JOB_COMPLETED, JOB_FAILED) else 202
+        
+    except Exception as e:
+        logger.error(f"Error fetching batch {batch_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status and current stage of an analysis job"""
+    try:
+        job = job_queue.get_job(job_id)
+        
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        
+        return jsonify(job)
+        
+    except Exception as e:
+        logger.error(f"Error fetching job {job_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Get the analysis result of a job, or its status while it is still pending"""
+    try:
+        job = job_queue.get_result(job_id)
+        
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        
+        if job["status"] == JOB_COMPLETED:
+            return jsonify({
+                "id": job["id"],
+                "status": "success",
+                "result": job["result"]
+            })
+        
+        if job["status"] == JOB_FAILED:
+            return jsonify({"id": job["id"], "status": job["status"], "error": job["error"]}), 500
+        
+        # Still queued or running
+        return jsonify({
+            "id": job["id"],
+            "status": job["status"],
+            "stage": job["stage"]
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Error fetching result for job {job_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def live_session_not_found(session_id):
+    """404 for an unknown session, 421 for one held by another server process"""
+    if agents.get('live_sessions').owns(session_id):
+        return jsonify({"error": "Live session not found"}), 404
+    return jsonify({
+        "error": "Live session is held by another server process; live streams need a single "
+                 "worker or routing by session ID (see STREAM_INSTANCE)"
+    }), 421
+
+@app.route('/api/streams', methods=['POST'])
+def create_stream():
+    """
+    Open a live analysis session
+    
+    Expected form or JSON data:
+    - exerciseType: Type of exercise (e.g., 'squat'); must be given, it isn't detected live
+    - fitnessLevel: User's fitness level
+    - userId: Optional user ID for tracking
+    """
+    from agents.live_sessions import SessionLimitError
+    
+    try:
+        data = request.get_json(silent=True) or request.form
+        exercise_type = data.get('exerciseType', '')
+        fitness_level = data.get('fitnessLevel', 'beginner')
+        user_id = data.get('userId', 'anonymous')
+        
+        try:
+            session = agents.get('live_sessions').create(exercise_type, fitness_level, user_id)
+        except SessionLimitError as e:
+            return jsonify({"error": str(e)}), 429
+        
+        return jsonify({
+            "id": session.id,
+            "exercise_type": session.exercise_type,
+            "budget_ms": STREAM_FRAME_BUDGET_MS,
+            "frames_url": f"/api/streams/{session.id}/frames",
+            "close_url": f"/api/streams/{session.id}/close"
+        }), 201
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error opening live session: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/streams/<session_id>/frames', methods=['POST'])
+def add_stream_frames(session_id):
+    """
+    Send frames of a live session and get back the errors they revealed
+    
+    Expected form data, either:
+    - frame: One or more encoded images (JPEG, PNG), in order
+    - timestamps: Optional comma-separated seconds since the session started, one per frame
+    or:
+    - chunk: A short video clip
+    - start: Optional seconds since the session started of the clip's first frame
+    Frames without a timestamp are placed at their arrival time.
+    """
+    from agents.live_sessions import decode_image, decode_chunk
+    
+    received_at = time.monotonic()
+    try:
+        session = agents.get('live_sessions').get(session_id)
+        if session is None:
+            return live_session_not_found(session_id)
+        
+        if 'chunk' in request.files:
+            start = request.form.get('start')
+            start = float(start) if start else received_at - session.started
+            chunk = request.files['chunk']
+            
+            suffix = os.path.splitext(chunk.filename or '')[1] or '.mp4'
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+                chunk.save(f)
+            try:
+                frames = decode_chunk(f.name, start)
+            finally:
+                os.remove(f.name)
+        else:
+            images = request.files.getlist('frame')
+            if not images:
+                return jsonify({"error": "No frames provided"}), 400
+            
+            timestamps = [float(t) for t in request.form.get('timestamps', '').split(',') if t.strip()]
+            if timestamps and len(timestamps) != len(images):
+                return jsonify({"error": "Expected one timestamp per frame"}), 400
+            
+            frames = [(timestamps[i] if timestamps else None, decode_image(image.read()))
+                      for i, image in enumerate(images)]
+        
+        return jsonify(session.add_frames(frames, received_at))
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error analyzing live frames: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/streams/<session_id>/close', methods=['POST'])
+def close_stream(session_id):
+    """Close a live session and get its summary with LLM feedback, stored like an upload's analysis"""
+    try:
+        closed = agents.get('live_sessions').close(session_id)
+        if closed is None:
+            return live_session_not_found(session_id)
+        
+        session, errors, stats = closed
+        result = agents.get('agent_manager').complete_live_session(
+            exercise_type=session.exercise_type,
+            fitness_level=session.fitness_level,
+            errors=errors,
+            stats=stats,
+            user_id=session.user_id
+        )
+        return jsonify(result)
+        
+    except Exception as e:
+        logger.error(f"Error closing live session: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/videos/<exercise_id>', methods=['GET'])
+def get_annotated_video(exercise_id):
+    """
+    Get the annotated video of an analysis
+    
+    Supports HTTP range requests, so players can seek without downloading the
+    whole file. Responds with 202 while the video is still being rendered.
+    """
+    try:
+        annotator = agents.get('video_annotator')
+        status = annotator.status(exercise_id)
+        
+        if status == 'pending':
+            response = jsonify({"status": status})
+            response.headers['Retry-After'] = '2'
+            return response, 202
+        if status != 'ready':
+            return jsonify({"error": "Annotated video not available"}), 404
+        
+        return send_file(annotator.output_path(exercise_id), mimetype='video/mp4', conditional=True)
+        
+    except Exception as e:
+        logger.error(f"Error serving annotated video: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/exercises/<exercise_id>', methods=['GET'])
 def get_exercise(exercise_id):
     """Get details for a specific exercise analysis"""
     try:
-        # In a real app, this would fetch from a database
-        # For demo, we'll simulate fetching from the logger
-        exercise_data = system_logger.get_exercise_data(exercise_id)
+        # Stored records only change if replaced, so their version answers If-None-Match;
+        # legacy records still being restored have none and are sent in full
+        version = system_logger.exercise_version(exercise_id)
+        response = response_cache.json_response(
+            lambda: system_logger.get_exercise_data(exercise_id),
+            etag=make_etag("exercise", version) if version is not None else None
+        )
         
-        if not exercise_data:
+        if response is None:
             return jsonify({"error": "Exercise not found"}), 404
             
-        return jsonify(exercise_data)
+        return response
         
     except Exception as e:
         logger.error(f"Error fetching exercise {exercise_id}: {str(e)}")
@@ -115,20 +743,100 @@ def get_exercise(exercise_id):
 
 @app.route('/api/exercises', methods=['GET'])
 def get_exercises():
-    """Get a list of exercise analyses, optionally filtered by user ID"""
+    """
+    Get a page of exercise analyses, newest first
+    
+    Query parameters:
+        userId, exerciseType: Filters
+        from, to: ISO date or date-time range; a date-only `to` includes that whole day
+        limit: Page size (default EXERCISE_PAGE_SIZE, at most EXERCISE_MAX_PAGE_SIZE)
+        cursor: next_cursor from the previous page
+        fields: Comma-separated projection, e.g. id,date,type,score
+    """
     try:
-        user_id = request.args.get('userId', None)
+        user_id = request.args.get('userId') or None
         exercise_type = request.args.get('exerciseType', None)
         
-        # In a real app, this would query a database
-        # For demo, we'll simulate fetching from the logger
-        exercises = system_logger.get_exercises(user_id=user_id, exercise_type=exercise_type)
+        try:
+            since = parse_time_arg(request.args.get('from'))
+            until = parse_time_arg(request.args.get('to'), end_of_day=True)
+            limit = min(max(int(request.args.get('limit', EXERCISE_PAGE_SIZE)), 1), EXERCISE_MAX_PAGE_SIZE)
+            fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+            cursor = request.args.get('cursor') or None
             
-        return jsonify(exercises)
+            # A page is unchanged while its arguments and the user's history version are
+            etag = make_etag("exercises", system_logger.history_version(user_id), exercise_type,
+                             since, until, limit, cursor, fields)
+            
+            # Built inside the try, so an invalid cursor is still a 400
+            return response_cache.json_response(
+                lambda: system_logger.get_exercise_page(
+                    limit,
+                    user_id=user_id,
+                    exercise_type=exercise_type,
+                    since=since,
+                    until=until,
+                    cursor=cursor,
+                    fields=fields or None
+                ),
+                etag=etag
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
     except Exception as e:
         logger.error(f"Error fetching exercises: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/progress', methods=['GET'])
+def get_progress():
+    """
+    Get a user's progress aggregates: averages, daily buckets, top errors,
+    personal best and streaks, for one exercise type or all of them
+    """
+    try:
+        user_id = request.args.get('userId', None)
+        exercise_type = request.args.get('exerciseType', None)
+        
+        try:
+            days = min(max(int(request.args.get('days', '30')), 1), 365)
+        except ValueError:
+            return jsonify({"error": "days must be an integer"}), 400
+        
+        # Progress follows the user's history, and its windows move with the date
+        etag = make_etag("progress", system_logger.history_version(user_id or "anonymous"),
+                         exercise_type, days, date.today().isoformat())
+        response = response_cache.json_response(
+            lambda: system_logger.get_progress(user_id=user_id, exercise_type=exercise_type, days=days),
+            etag=etag
+        )
+        
+        if response is None:
+            return jsonify({"error": "No exercises found"}), 404
+            
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error fetching progress: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.cli.command('rebuild-progress')
+@click.option('--user-id', default=None, help='Only rebuild this user')
+def rebuild_progress(user_id):
+    """Recompute progress aggregates from the stored exercise history"""
+    folded = system_logger.rebuild_progress(user_id)
+    click.echo(f"Rebuilt progress aggregates from {folded} exercises")
+
+@app.cli.command('pose-report')
+@click.argument('video_path')
+@click.option('--quality', default='balanced', type=click.Choice(list(QUALITY_TIERS)),
+              help='Quality tier to compare against the accurate baseline')
+def pose_report(video_path, quality):
+    """Report speedup and landmark error of a quality tier on one video"""
+    report = agents.get('computer_vision_agent').pose_engine.compare(video_path, quality)
+    click.echo(json.dumps(report, indent=2))
+
 if __name__ == '__main__':
+    if WARM_UP_ON_START:
+        agents.warm_up_async()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
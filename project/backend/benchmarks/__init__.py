@@ -0,0 +1 @@
+"""Offline benchmarks of the analysis pipeline; see benchmarks.run"""
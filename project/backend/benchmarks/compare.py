@@ -0,0 +1,85 @@
+"""
+Compare two benchmark result files.
+
+    python -m benchmarks.compare base.json new.json --threshold 10
+
+Prints the change in throughput, p50/p99 latency and peak memory for every
+(stage, fixture) present in both files, and exits with status 1 when any of
+them got worse by more than the threshold percentage.
+"""
+import json
+import sys
+from typing import Any, Dict, Optional, Tuple
+
+import click
+
+# Metric, how to read it from a result row, and whether higher is better
+METRICS = [
+    ("throughput", lambda row: row["throughput"], True),
+    ("p50 ms", lambda row: row["latency_ms"]["p50"], False),
+    ("p99 ms", lambda row: row["latency_ms"]["p99"], False),
+    ("peak MB", lambda row: row["rss_mb"]["peak"], False)
+]
+
+
+def _load(path: str) -> Tuple[Dict[str, Any], Dict[Tuple[str, str], Dict[str, Any]]]:
+    with open(path) as f:
+        report = json.load(f)
+    return report, {(row["stage"], row["fixture"]): row for row in report["results"]}
+
+
+def _change(base: Optional[float], new: Optional[float]) -> Optional[float]:
+    if base is None or new is None or base == 0:
+        return None
+    return (new - base) / base * 100
+
+
+@click.command()
+@click.argument("base", type=click.Path(exists=True, dir_okay=False))
+@click.argument("new", type=click.Path(exists=True, dir_okay=False))
+@click.option("--threshold", default=10.0, show_default=True,
+              help="Percentage by which a metric may get worse before it counts as a regression")
+def main(base, new, threshold):
+    """Show how the NEW results differ from BASE"""
+    base_report, base_rows = _load(base)
+    new_report, new_rows = _load(new)
+
+    click.echo(f"base: {base_report.get('commit') or '?'} {base_report.get('created_at')}")
+    click.echo(f"new:  {new_report.get('commit') or '?'} {new_report.get('created_at')}")
+    if base_report.get("config") != new_report.get("config"):
+        click.echo("warning: the runs used different settings")
+
+    header = f"{'stage':<17}{'fixture':<16}" + "".join(f"{name:>26}" for name, _, _ in METRICS)
+    click.echo(header)
+    click.echo("-" * len(header))
+
+    regressions = []
+    for key in sorted(base_rows.keys() & new_rows.keys()):
+        cells = []
+        for name, read, higher_is_better in METRICS:
+            before, after = read(base_rows[key]), read(new_rows[key])
+            change = _change(before, after)
+            if change is None:
+                cells.append(f"{'-':>26}")
+                continue
+
+            worse = -change if higher_is_better else change
+            flag = " !" if worse > threshold else "  "
+            if worse > threshold:
+                regressions.append(f"{key[0]} {key[1]} {name}: {before} -> {after} ({change:+.1f}%)")
+            cells.append(f"{before:>9} -> {after:<9}{change:+6.1f}%{flag}")
+
+        click.echo(f"{key[0]:<17}{key[1]:<16}" + "".join(cells))
+
+    for key in sorted(base_rows.keys() ^ new_rows.keys()):
+        click.echo(f"{key[0]:<17}{key[1]:<16}only in {'base' if key in base_rows else 'new'}")
+
+    if regressions:
+        click.echo(f"\n{len(regressions)} regression(s) beyond {threshold}%:")
+        for regression in regressions:
+            click.echo(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import logging
+import os
+from typing import Dict, Tuple
+
+import cv2
+import numpy as np
+
+from agents.landmarks import LandmarkSequence, LANDMARK_INDEX, NUM_LANDMARKS, NUM_CHANNELS, X, Y, Z, VISIBILITY
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = {
+    "360p": (640, 360),
+    "480p": (854, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080)
+}
+
+# Side view of a standing athlete, normalized image coordinates (x, y)
+STANDING_POSE = {
+    "nose": (0.52, 0.17),
+    "shoulder": (0.50, 0.28),
+    "elbow": (0.53, 0.40),
+    "wrist": (0.58, 0.47),
+    "hip": (0.50, 0.54),
+    "knee": (0.50, 0.71),
+    "ankle": (0.50, 0.88),
+    "heel": (0.48, 0.90),
+    "foot_index": (0.56, 0.90)
+}
+
+FACE_OFFSETS = {
+    "left_eye_inner": (0.010, -0.012), "left_eye": (0.012, -0.012), "left_eye_outer": (0.014, -0.012),
+    "right_eye_inner": (0.006, -0.012), "right_eye": (0.004, -0.012), "right_eye_outer": (0.002, -0.012),
+    "left_ear": (-0.012, -0.006), "right_ear": (-0.016, -0.006),
+    "mouth_left": (0.010, 0.012), "mouth_right": (0.006, 0.012)
+}
+
+# BGR colors of the rendered athlete
+SKIN = (140, 170, 220)
+HAIR = (30, 40, 60)
+SHIRT = (160, 60, 40)
+PANTS = (50, 50, 60)
+SHOES = (30, 30, 30)
+
+# How far each joint moves at the bottom of a squat
+SQUAT_TRAVEL = {
+    "nose": (-0.06, 0.13),
+    "shoulder": (-0.05, 0.12),
+    "elbow": (-0.01, 0.12),
+    "wrist": (0.04, 0.10),
+    "hip": (-0.12, 0.15),
+    "knee": (0.06, 0.02)
+}
+
+
+def squat_landmarks(seconds: float, fps: float = 30.0, rep_seconds: float = 2.5,
+                    fault_every: int = 3, seed: int = 0) -> LandmarkSequence:
+    """
+    Landmarks of a synthetic squat set, seen from the side.
+
+    Every `fault_every`-th rep pushes the knees well past the toes, so the
+    form rules have violations to find.
+
+    Args:
+        seconds: Length of the set
+        fps: Frame rate
+        rep_seconds: Duration of one rep
+        fault_every: Reps between faulty ones; 0 for none
+        seed: Seed of the landmark jitter
+    """
+    rng = np.random.default_rng(seed)
+    frames = max(1, int(round(seconds * fps)))
+    times = np.arange(frames) / fps
+
+    # Depth 0 standing to 1 at the bottom, a smooth cycle per rep
+    depth = (1 - np.cos(2 * np.pi * times / rep_seconds)) / 2
+    rep = (times // rep_seconds).astype(int)
+    faulty = (rep % fault_every == fault_every - 1) if fault_every else np.zeros(frames, dtype=bool)
+
+    data = np.zeros((frames, NUM_LANDMARKS, NUM_CHANNELS), dtype=np.float32)
+    data[..., VISIBILITY] = 0.98
+
+    for joint, (x, y) in STANDING_POSE.items():
+        travel_x, travel_y = SQUAT_TRAVEL.get(joint, (0.0, 0.0))
+        xs = x + travel_x * depth
+        if joint == "knee":
+            xs = xs + 0.09 * depth * faulty
+        ys = y + travel_y * depth
+
+        names = [joint] if joint == "nose" else [f"left_{joint}", f"right_{joint}"]
+        for side, name in enumerate(names):
+            index = LANDMARK_INDEX[name]
+            # The far side sits slightly behind the near one
+            data[:, index, X] = xs - 0.01 * side
+            data[:, index, Y] = ys
+            data[:, index, Z] = -0.1 + 0.2 * side
+
+    nose = data[:, LANDMARK_INDEX["nose"]]
+    for name, (dx, dy) in FACE_OFFSETS.items():
+        index = LANDMARK_INDEX[name]
+        data[:, index, X] = nose[:, X] + dx
+        data[:, index, Y] = nose[:, Y] + dy
+        data[:, index, Z] = nose[:, Z]
+
+    for finger in ("pinky", "index", "thumb"):
+        for side in ("left", "right"):
+            data[:, LANDMARK_INDEX[f"{side}_{finger}"]] = data[:, LANDMARK_INDEX[f"{side}_wrist"]]
+            data[:, LANDMARK_INDEX[f"{side}_{finger}"], X] += 0.015
+
+    data[..., X:Y + 1] += rng.normal(0, 0.002, size=data[..., X:Y + 1].shape).astype(np.float32)
+
+    return LandmarkSequence(data, np.arange(frames, dtype=np.int64), np.ones(frames, dtype=bool), fps)
+
+
+def _draw_athlete(frame: np.ndarray, landmarks: np.ndarray) -> None:
+    """Filled limbs, torso and head, close enough to a person for the pose detector to pick up"""
+    height, width = frame.shape[:2]
+    unit = max(3, height // 40)
+
+    def point(name):
+        return int(landmarks[LANDMARK_INDEX[name], X] * width), int(landmarks[LANDMARK_INDEX[name], Y] * height)
+
+    def limb(a, b, color, thickness):
+        cv2.line(frame, point(a), point(b), color, unit * thickness, cv2.LINE_AA)
+
+    # Far side first, so the near side is drawn over it
+    for side in ("right", "left"):
+        limb(f"{side}_hip", f"{side}_knee", PANTS, 4)
+        limb(f"{side}_knee", f"{side}_ankle", PANTS, 3)
+        limb(f"{side}_heel", f"{side}_foot_index", SHOES, 2)
+    limb("left_shoulder", "left_hip", SHIRT, 7)
+    for side in ("right", "left"):
+        limb(f"{side}_shoulder", f"{side}_elbow", SHIRT, 3)
+        limb(f"{side}_elbow", f"{side}_wrist", SKIN, 2)
+
+    nose_x, nose_y = point("nose")
+    cv2.line(frame, point("left_shoulder"), (nose_x - unit, nose_y + unit * 2), SKIN, unit * 3, cv2.LINE_AA)
+    cv2.ellipse(frame, (nose_x - unit, nose_y - unit), (int(unit * 2.6), int(unit * 3.2)), 0, 0, 360,
+                SKIN, -1, cv2.LINE_AA)
+    cv2.ellipse(frame, (nose_x - unit * 2, nose_y - unit * 3), (int(unit * 2.8), int(unit * 1.6)), 0, 180, 360,
+                HAIR, -1, cv2.LINE_AA)
+    cv2.circle(frame, (nose_x + unit // 2, nose_y - unit), max(1, unit // 3), SHOES, -1)
+
+
+def render_video(sequence: LandmarkSequence, path: str, width: int, height: int) -> None:
+    """Draw a landmark sequence as an athlete on a textured background and write it as MP4"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), sequence.fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open a video writer for {path}")
+
+    # Static background with some texture, so the encoder and the decoder have real work
+    rng = np.random.default_rng(1)
+    gradient = np.linspace(90, 170, height, dtype=np.float32)[:, np.newaxis, np.newaxis]
+    background = np.clip(gradient + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+    cv2.rectangle(background, (0, int(height * 0.91)), (width, height), (60, 70, 80), -1)
+
+    try:
+        for landmarks in sequence.data:
+            frame = background.copy()
+            _draw_athlete(frame, landmarks)
+            writer.write(frame)
+    finally:
+        writer.release()
+
+
+def video_fixture(fixtures_dir: str, seconds: float, resolution: str,
+                  fps: float = 30.0) -> Tuple[str, LandmarkSequence]:
+    """
+    Path of a synthetic squat video and the landmarks it was drawn from.
+
+    Videos are rendered once per (length, resolution, fps) and reused from
+    `fixtures_dir` by later runs.
+    """
+    width, height = RESOLUTIONS[resolution]
+    sequence = squat_landmarks(seconds, fps)
+
+    os.makedirs(fixtures_dir, exist_ok=True)
+    path = os.path.join(fixtures_dir, f"squat-{seconds:g}s-{resolution}-{fps:g}fps.mp4")
+    if not os.path.exists(path):
+        logger.info(f"Rendering fixture {os.path.basename(path)}")
+        partial_path = f"{os.path.splitext(path)[0]}.partial.mp4"
+        render_video(sequence, partial_path, width, height)
+        os.replace(partial_path, path)
+
+    return path, sequence
+
+
+def fixture_name(seconds: float, resolution: str) -> str:
+    return f"{seconds:g}s-{resolution}"
+
+
+def parse_resolutions(value: str) -> Dict[str, Tuple[int, int]]:
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in RESOLUTIONS]
+    if unknown:
+        raise ValueError(f"Unknown resolution(s) {', '.join(unknown)}; choose from {', '.join(RESOLUTIONS)}")
+    return {name: RESOLUTIONS[name] for name in names}
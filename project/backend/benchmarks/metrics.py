@@ -0,0 +1,131 @@
+import os
+import resource
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss(pid: int) -> int:
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def _children(pid: int) -> List[int]:
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            children.extend(int(child) for child in f.read().split())
+    return children
+
+
+def tree_rss(pid: Optional[int] = None) -> int:
+    """Resident bytes of a process and all its descendants (pose workers included)"""
+    pid = pid or os.getpid()
+    try:
+        total = _rss(pid)
+        for child in _children(pid):
+            total += tree_rss(child)
+        return total
+    except (OSError, ValueError):
+        # The process exited while it was being read
+        return 0
+
+
+class PeakRSS:
+    """
+    Highest resident memory of this process tree while the block runs.
+
+    Memory is sampled from /proc every `interval` seconds on a background
+    thread. Where /proc isn't available only this process's lifetime peak
+    (getrusage) can be reported.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.supported = os.path.exists("/proc/self/statm")
+        self.start_bytes = 0
+        self.peak_bytes = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self) -> "PeakRSS":
+        if self.supported:
+            self.start_bytes = self.peak_bytes = tree_rss()
+            self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.supported:
+            self._stop.set()
+            self._thread.join()
+            self.peak_bytes = max(self.peak_bytes, tree_rss())
+        else:
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak_bytes = peak if sys.platform == "darwin" else peak * 1024
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, tree_rss())
+
+
+def summarize(stage: str, fixture: str, unit: str, latencies: List[float], items: int, seconds: float,
+              rss: PeakRSS, **extra: Any) -> Dict[str, Any]:
+    """One result row: throughput in `unit`s per second, latency percentiles and peak memory"""
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "stage": stage,
+        "fixture": fixture,
+        "runs": len(latencies),
+        "items": items,
+        "unit": unit,
+        "seconds": round(seconds, 4),
+        "throughput": round(items / seconds, 2) if seconds > 0 else None,
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies_ms, 50)), 3) if len(latencies) else None,
+            "p99": round(float(np.percentile(latencies_ms, 99)), 3) if len(latencies) else None,
+            "mean": round(float(latencies_ms.mean()), 3) if len(latencies) else None,
+            "max": round(float(latencies_ms.max()), 3) if len(latencies) else None
+        },
+        "rss_mb": {
+            "start": round(rss.start_bytes / 2 ** 20, 1) if rss.supported else None,
+            "peak": round(rss.peak_bytes / 2 ** 20, 1)
+        },
+        **extra
+    }
+
+
+def measure(stage: str, fixture: str, unit: str, operation: Callable[[], int], runs: int,
+            warmup: int = 1, **extra: Any) -> Dict[str, Any]:
+    """
+    Time an operation over several runs.
+
+    Args:
+        stage: Pipeline stage being measured
+        fixture: Name of the input
+        unit: What the operation's return value counts (frames, records, ...)
+        operation: Does one run and returns the number of items it processed
+        runs: Timed runs
+        warmup: Untimed runs before them, to load models and fill caches
+    """
+    for _ in range(warmup):
+        operation()
+
+    latencies = []
+    items = 0
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        for _ in range(runs):
+            run_started = time.perf_counter()
+            items += operation()
+            latencies.append(time.perf_counter() - run_started)
+        seconds = time.perf_counter() - started
+
+    return summarize(stage, fixture, unit, latencies, items, seconds, rss, **extra)
@@ -0,0 +1,344 @@
+"""
+Offline end-to-end benchmark of the analysis pipeline.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --lengths 10,30 --resolutions 360p,720p --output results.json
+
+Synthetic squat videos are rendered from generated landmarks (see
+benchmarks.fixtures), and the OpenAI client is replaced by a local stub with a
+configurable latency, so no network access, API key or classifier model is
+needed. Each stage is timed over several runs per fixture and reported with
+throughput, p50/p99 latency and the peak resident memory of the process tree
+(pose workers included). Compare two result files with benchmarks.compare.
+"""
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Any
+
+import click
+
+from benchmarks.fixtures import RESOLUTIONS, fixture_name, parse_resolutions, video_fixture
+from benchmarks.metrics import PeakRSS, measure, summarize
+from benchmarks.stub_llm import StubOpenAIClient
+
+logger = logging.getLogger(__name__)
+
+STAGES = ["decode", "pose", "detection", "scoring", "feedback", "persistence", "pipeline"]
+
+RESULTS_VERSION = 1
+
+
+def _split(value: str) -> List[str]:
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _llm_agent(latency: float, jitter: float):
+    from agents.llm_agent import LLMAgent
+
+    # The real client is built from the environment and replaced straight away
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    agent = LLMAgent(feedback_cache=None)
+    agent.client = StubOpenAIClient(latency=latency, jitter=jitter)
+    return agent
+
+
+def bench_decode(path: str, fixture: str, runs: int) -> Dict[str, Any]:
+    from agents.video_stream import VideoFrameStream
+
+    def decode():
+        return sum(1 for _ in VideoFrameStream(path))
+
+    return measure("decode", fixture, "frames", decode, runs)
+
+
+def bench_pose(engine, path: str, fixture: str, runs: int, quality: str) -> Dict[str, Any]:
+    detected = []
+
+    def extract():
+        sequence = engine.extract(path, quality)
+        detected.append(float(sequence.detected.mean()) if len(sequence) else 0.0)
+        return len(sequence)
+
+    result = measure("pose", fixture, "frames", extract, runs, workers=engine.num_workers, quality=quality)
+    result["detection_rate"] = round(detected[-1], 3)
+    return result
+
+
+def bench_detection(sequence, fixture: str, runs: int) -> Dict[str, Any]:
+    from agents.form_rules import FormRuleEngine
+    from agents.rep_segmentation import RepSegmenter
+
+    rule_engine = FormRuleEngine()
+    segmenter = RepSegmenter()
+    found = {}
+
+    def detect():
+        found["errors"] = rule_engine.evaluate(sequence, "squat")
+        found["reps"] = segmenter.segment(sequence, "squat")
+        return len(sequence)
+
+    result = measure("detection", fixture, "frames", detect, runs)
+    result.update(errors=len(found["errors"]), reps=found["reps"]["count"] if found["reps"] else 0)
+    return result, found["errors"], found["reps"]
+
+
+def bench_scoring(errors, reps, fixture: str, runs: int) -> Dict[str, Any]:
+    from agents.feedback_combiner import FeedbackCombiner
+
+    combiner = FeedbackCombiner()
+
+    def score():
+        scored = combiner.score_reps(reps, errors)
+        combiner.calculate_score(errors, scored)
+        return 1
+
+    # Scoring a clip takes microseconds, so it is timed over many clips
+    return measure("scoring", fixture, "clips", score, runs * 200, warmup=10)
+
+
+def bench_feedback(llm_agent, errors, reps, fixture: str, runs: int) -> Dict[str, Any]:
+    def generate():
+        llm_agent.generate_feedback(errors, {"exercise_type": "squat", "fitness_level": "beginner"}, reps)
+        return 1
+
+    return measure("feedback", fixture, "requests", generate, runs, warmup=0,
+                   llm_latency_ms=round(llm_agent.client.latency * 1000, 1))
+
+
+def bench_persistence(data_dir: str, result: Dict[str, Any], records: int, threads: int) -> List[Dict[str, Any]]:
+    """Concurrent exercise writes through Logger, flushed to disk, then paged reads of the history"""
+    from agents.logger import Logger
+
+    system_logger = Logger(data_dir=data_dir, write_mode="write_behind")
+    latencies = []
+    lock = threading.Lock()
+    per_thread = max(1, records // threads)
+
+    def write(worker: int):
+        own = []
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            system_logger.store_exercise_data(f"user-{worker}", "squat", "beginner",
+                                              {**result, "id": str(uuid.uuid4())})
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(own)
+
+    try:
+        with PeakRSS() as rss:
+            started = time.perf_counter()
+            workers = [threading.Thread(target=write, args=(worker,)) for worker in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            flush_started = time.perf_counter()
+            system_logger.flush()
+            finished = time.perf_counter()
+
+        writes = summarize("persistence", f"{len(latencies)} records", "records", latencies, len(latencies),
+                           finished - started, rss, threads=threads,
+                           flush_seconds=round(finished - flush_started, 4))
+
+        def read_history():
+            cursor, rows = None, 0
+            while True:
+                page = system_logger.get_exercise_page(50, user_id="user-0", cursor=cursor)
+                rows += len(page["exercises"])
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    return rows
+
+        reads = measure("persistence_read", f"{per_thread} records", "records", read_history, 5)
+        return [writes, reads]
+
+    finally:
+        system_logger.close()
+
+
+def bench_pipeline(manager, path: str, fixture: str, runs: int, quality: str) -> Dict[str, Any]:
+    def process():
+        # A new content hash each run, so it is analyzed like a first upload rather than served from cache
+        manager.process_exercise_video(video_path=path, exercise_type="squat", fitness_level="beginner",
+                                       user_id="benchmark", video_hash=uuid.uuid4().hex, quality=quality)
+        return 1
+
+    return measure("pipeline", fixture, "videos", process, runs)
+
+
+@click.command()
+@click.option("--lengths", default="10,30", show_default=True, help="Video lengths in seconds, comma-separated")
+@click.option("--resolutions", default="360p,720p", show_default=True,
+              help=f"Video resolutions, comma-separated: {', '.join(RESOLUTIONS)}")
+@click.option("--fps", default=30.0, show_default=True, help="Frame rate of the synthetic videos")
+@click.option("--stages", default=",".join(STAGES), show_default=True, help="Stages to run, comma-separated")
+@click.option("--runs", default=3, show_default=True, help="Timed runs per stage and fixture")
+@click.option("--quality", default="accurate", show_default=True, help="Pose quality tier")
+@click.option("--model-complexity", default=1, show_default=True,
+              help="MediaPipe Pose model; 1 ships with MediaPipe, 0 and 2 are downloaded on first use")
+@click.option("--pose-workers", default=None, type=int, help="Pose worker processes (default: CPU count)")
+@click.option("--llm-latency", default=0.5, show_default=True, help="Seconds each stubbed LLM request takes")
+@click.option("--llm-jitter", default=0.0, show_default=True, help="Random extra seconds per LLM request")
+@click.option("--persist-records", default=2000, show_default=True, help="Exercise records written by the persistence stage")
+@click.option("--persist-threads", default=4, show_default=True, help="Threads writing them concurrently")
+@click.option("--fixtures-dir", default=os.path.join(tempfile.gettempdir(), "formfit-benchmark-fixtures"),
+              show_default=True, help="Where synthetic videos are rendered and reused")
+@click.option("--output", default=None, help="Results file (default: benchmarks/results/<time>.json)")
+def main(lengths, resolutions, fps, stages, runs, quality, model_complexity, pose_workers, llm_latency,
+         llm_jitter, persist_records, persist_threads, fixtures_dir, output):
+    """Benchmark the analysis pipeline offline and write the results as JSON"""
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    logger.setLevel(logging.INFO)
+
+    stages = _split(stages)
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        raise click.BadParameter(f"Unknown stage(s) {', '.join(unknown)}", param_hint="--stages")
+    try:
+        resolutions = list(parse_resolutions(resolutions))
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--resolutions")
+
+    fixtures = [(float(length), resolution) for length in _split(lengths) for resolution in resolutions]
+    work_dir = tempfile.mkdtemp(prefix="formfit-benchmark-")
+    results = []
+
+    engine = manager = None
+    try:
+        llm_agent = _llm_agent(llm_latency, llm_jitter)
+
+        if "pose" in stages:
+            from agents.pose_engine import PoseEngine
+            engine = PoseEngine(num_workers=pose_workers, model_complexity=model_complexity, quality=quality)
+            engine.start()
+
+        if "pipeline" in stages:
+            from agents.agent_manager import AgentManager
+            from agents.computer_vision_agent import ComputerVisionAgent
+            from agents.feedback_combiner import FeedbackCombiner
+            from agents.logger import Logger
+            from agents.motion_capture_agent import MotionCaptureAgent
+            from agents.upload_store import UploadStore
+
+            manager = AgentManager(
+                computer_vision_agent=ComputerVisionAgent(
+                    pose_workers=pose_workers,
+                    pose_quality=quality,
+                    model_complexity=model_complexity,
+                    upload_store=UploadStore(root=os.path.join(work_dir, "uploads"))
+                ),
+                llm_agent=_llm_agent(llm_latency, llm_jitter),
+                motion_capture_agent=MotionCaptureAgent(),
+                feedback_combiner=FeedbackCombiner(),
+                logger=Logger(data_dir=os.path.join(work_dir, "pipeline"))
+            )
+
+        sample = None
+        for seconds, resolution in fixtures:
+            name = fixture_name(seconds, resolution)
+            first_result = len(results)
+            path, sequence = video_fixture(fixtures_dir, seconds, resolution, fps)
+            logger.info(f"Fixture {name}: {len(sequence)} frames")
+
+            if "decode" in stages:
+                results.append(bench_decode(path, name, runs))
+            if "pose" in stages:
+                results.append(bench_pose(engine, path, name, runs, quality))
+
+            # Detection, scoring and feedback run on the generated landmarks, one size per length
+            if resolution == resolutions[0]:
+                landmark_name = f"{seconds:g}s-landmarks"
+                detection, errors, reps = bench_detection(sequence, landmark_name, runs)
+                if "detection" in stages:
+                    results.append(detection)
+
+                # The persistence stage stores copies of this result
+                from agents.feedback_combiner import FeedbackCombiner
+                combiner = FeedbackCombiner()
+                scored = combiner.score_reps(reps, errors)
+                sample = {"score": combiner.calculate_score(errors, scored), "errors": errors, "reps": scored}
+
+                if "scoring" in stages:
+                    results.append(bench_scoring(errors, reps, landmark_name, runs))
+                if "feedback" in stages:
+                    results.append(bench_feedback(llm_agent, errors, scored, landmark_name, runs))
+
+            if "pipeline" in stages:
+                results.append(bench_pipeline(manager, path, name, runs, quality))
+
+            for result in results[first_result:]:
+                logger.info(f"{result['stage']:>12} {result['fixture']:>14}: {result['throughput']} "
+                            f"{result['unit']}/s, p50 {result['latency_ms']['p50']} ms, "
+                            f"p99 {result['latency_ms']['p99']} ms, peak {result['rss_mb']['peak']} MB")
+
+        if "persistence" in stages and sample is not None:
+            sample["feedback"], sample["form_cues"] = llm_agent.generate_feedback(
+                sample["errors"], {"exercise_type": "squat", "fitness_level": "beginner"}, sample["reps"])
+            results.extend(bench_persistence(os.path.join(work_dir, "persistence"), sample,
+                                             persist_records, persist_threads))
+
+    finally:
+        if engine is not None:
+            engine.close()
+        if manager is not None:
+            manager.computer_vision_agent.pose_engine.close()
+            manager.logger.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "version": RESULTS_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "commit": _git_commit(),
+        "host": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "config": {
+            "lengths": _split(lengths),
+            "resolutions": resolutions,
+            "fps": fps,
+            "stages": stages,
+            "runs": runs,
+            "quality": quality,
+            "model_complexity": model_complexity,
+            "pose_workers": pose_workers,
+            "llm_latency": llm_latency,
+            "llm_jitter": llm_jitter,
+            "persist_records": persist_records,
+            "persist_threads": persist_threads
+        },
+        "results": results
+    }
+
+    if output is None:
+        output = os.path.join(os.path.dirname(__file__), "results", f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    click.echo(f"Wrote {len(results)} results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+
+class StubOpenAIClient:
+    """
+    Stands in for the OpenAI client of LLMAgent, so the pipeline runs offline.
+
+    `chat.completions.create` waits `latency` seconds (plus up to `jitter`) and
+    answers with the tool call the agent asked for, in the shape the OpenAI SDK
+    returns, so the agent's parsing runs as in production.
+    """
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, seed: int = 0):
+        """
+        Args:
+            latency: Seconds each request takes
+            jitter: Up to this many seconds are added at random to each request
+            seed: Seed of the jitter
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model: str, messages: List[Dict[str, str]], tools: Optional[List[Dict[str, Any]]] = None,
+                tool_choice: Optional[Dict[str, Any]] = None, **kwargs) -> SimpleNamespace:
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.random() * self.jitter
+        time.sleep(delay)
+
+        prompt = messages[-1]["content"]
+        name = tool_choice["function"]["name"] if tool_choice else None
+
+        if name == "submit_session_feedback":
+            clips = len(re.findall(r"^\s*Clip \d+:", prompt, flags=re.MULTILINE))
+            arguments = {
+                "summary": "Solid session overall; keep the knees tracking over the feet.",
+                "clips": [
+                    {"clip": number, "feedback": self._feedback(prompt), "form_cues": "Knees over toes, chest up."}
+                    for number in range(1, clips + 1)
+                ]
+            }
+        else:
+            arguments = {"feedback": self._feedback(prompt), "form_cues": "Knees over toes, chest up."}
+
+        tool_call = SimpleNamespace(function=SimpleNamespace(name=name, arguments=json.dumps(arguments)))
+        message = SimpleNamespace(role="assistant", content=None, tool_calls=[tool_call])
+        return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message, finish_reason="tool_calls")])
+
+    @staticmethod
+    def _feedback(prompt: str) -> str:
+        # Roughly the length of a real answer, so storage and responses carry realistic payloads
+        errors = len(re.findall(r"^\s*- ", prompt, flags=re.MULTILINE))
+        return ("Good depth and a steady tempo. " * 8 +
+                f"Work on the {errors} flagged moments: keep the knees behind the toes as you descend. " * 4)
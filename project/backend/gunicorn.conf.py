@@ -0,0 +1,51 @@
+"""
+Gunicorn configuration for the backend: gunicorn -c gunicorn.conf.py app:app
+
+The app itself is not preloaded, because the Logger, the job queue and the pose
+worker pool start threads and processes that would not survive the fork into
+each worker. Instead the master imports the heavy libraries and loads the
+exercise classifier before forking (PRELOAD_MODELS), so workers inherit them
+ready-made and share the model weights copy-on-write. Each worker then builds
+its agents in the background after it has loaded the app (WARM_UP_ON_START),
+and reports readiness through /api/ready.
+
+Live stream sessions are held in the memory of the worker that opened them,
+and gunicorn can't route a session's requests back to that worker. Serve
+streams with GUNICORN_WORKERS=1, or with single-worker instances routed on the
+session ID prefix (STREAM_INSTANCE); see the README.
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', '1') == '1'
+WARM_UP_ON_START = os.getenv('WARM_UP_ON_START', '1') == '1'
+
+# Every worker starts its own pose pool, so the machine's cores are divided between them
+os.environ.setdefault('POSE_WORKERS', str(max(1, (os.cpu_count() or 1) // workers)))
+
+
+def on_starting(server):
+    if not PRELOAD_MODELS:
+        return
+
+    import cv2  # noqa: F401
+    import numpy  # noqa: F401
+    import openai  # noqa: F401
+    from agents.computer_vision_agent import load_classifier
+
+    try:
+        load_classifier()
+    except Exception as e:
+        server.log.error(f"Error preloading exercise classifier: {str(e)}")
+
+
+def post_worker_init(worker):
+    if not WARM_UP_ON_START:
+        return
+
+    from app import agents
+    agents.warm_up_async()
@@ -0,0 +1,69 @@
+"""
+Synthetic pose landmarks for tests that don't run pose estimation.
+"""
+import numpy as np
+
+from agents.landmarks import (LandmarkSequence, JOINT_PAIRS, LANDMARK_INDEX, NUM_CHANNELS, NUM_LANDMARKS,
+                              VISIBILITY, X, Y)
+
+# Normalized image coordinates of a person standing side-on to the camera;
+# pairs are (left, right). Shoulders sit 0.25 above the hips and the hips are
+# high in the frame, so there is room to squat.
+STANDING = {
+    "nose": (0.5, 0.05),
+    "shoulders": ((0.46, 0.15), (0.54, 0.15)),
+    "elbows": ((0.44, 0.27), (0.56, 0.27)),
+    "wrists": ((0.44, 0.38), (0.56, 0.38)),
+    "hips": ((0.47, 0.4), (0.53, 0.4)),
+    "knees": ((0.47, 0.65), (0.53, 0.65)),
+    "ankles": ((0.47, 0.9), (0.53, 0.9)),
+    "heels": ((0.46, 0.92), (0.52, 0.92)),
+    "feet": ((0.49, 0.93), (0.55, 0.93))
+}
+
+
+def standing_frame() -> np.ndarray:
+    """(33, 4) landmarks of the standing pose, fully visible"""
+    landmarks = np.zeros((NUM_LANDMARKS, NUM_CHANNELS), dtype=np.float32)
+    landmarks[:, VISIBILITY] = 1.0
+    for name, position in STANDING.items():
+        index = JOINT_PAIRS.get(name, LANDMARK_INDEX.get(name))
+        landmarks[index, X:Y + 1] = position
+    return landmarks
+
+
+def pose_frames(frame_count: int) -> np.ndarray:
+    """(frames, 33, 4) array of the standing pose"""
+    return np.repeat(standing_frame()[np.newaxis], frame_count, axis=0)
+
+
+def to_sequence(frames: np.ndarray, fps: float, missing=()) -> LandmarkSequence:
+    """Sequence of every frame of `frames`, without a detection on the `missing` rows"""
+    missing = set(missing)
+    return LandmarkSequence.from_frames(
+        [(index, None if index in missing else frame) for index, frame in enumerate(frames)], fps
+    )
+
+
+def squat_frames(depths, fps: float, rep_seconds: float = 2.0, pause_seconds: float = 0.5,
+                 descent_fraction: float = 0.5) -> np.ndarray:
+    """
+    Frames of a set of squats, one per entry of `depths` (how far the hips drop,
+    in frame heights). Each rep lowers for `descent_fraction` of `rep_seconds`,
+    rises for the rest, and is followed by a pause standing.
+    """
+    offsets = []
+    for depth in depths:
+        down = int(round(rep_seconds * descent_fraction * fps))
+        up = int(round(rep_seconds * fps)) - down
+        offsets.extend(depth * (1 - np.cos(np.linspace(0, np.pi, down, endpoint=False))) / 2)
+        offsets.extend(depth * (1 + np.cos(np.linspace(0, np.pi, up, endpoint=False))) / 2)
+        offsets.extend([0.0] * int(round(pause_seconds * fps)))
+    offsets = np.array([0.0] * int(round(pause_seconds * fps)) + offsets, dtype=np.float32)
+
+    frames = pose_frames(len(offsets))
+    # The torso moves down with the hips, so only the hips' height changes the rules see
+    for name in ("shoulders", "elbows", "wrists", "hips"):
+        frames[:, JOINT_PAIRS[name], Y] += offsets[:, np.newaxis]
+    frames[:, LANDMARK_INDEX["nose"], Y] += offsets
+    return frames
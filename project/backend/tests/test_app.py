@@ -0,0 +1,157 @@
+"""
+Tests of the HTTP API that don't need the agents (pose estimation, the
+classifier or the LLM): upload backpressure, conditional listings and query
+argument parsing. The app is imported in a temporary directory, so its
+uploads, data and jobs folders don't touch the working tree:
+
+    cd project/backend && python -m pytest tests
+"""
+import importlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+from agents.job_queue import JobQueue
+
+
+app_module = None
+client = None
+work_dir = None
+previous_cwd = None
+
+
+def setUpModule():
+    global app_module, client, work_dir, previous_cwd
+    previous_cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="app-test-")
+    os.chdir(work_dir)
+    with mock.patch.dict(os.environ, {"LOGGER_WRITE_MODE": "sync", "JOB_WORKERS": "1"}):
+        app_module = importlib.import_module("app")
+    client = app_module.app.test_client()
+
+
+def tearDownModule():
+    app_module.job_queue.shutdown()
+    app_module.system_logger.close()
+    app_module.feedback_cache.close()
+    os.chdir(previous_cwd)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class UploadBackpressureTest(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.started = threading.Semaphore(0)
+        self.jobs_dir = tempfile.mkdtemp(prefix="jobs-", dir=work_dir)
+        self.queue = JobQueue(self.handler, jobs_dir=self.jobs_dir, num_workers=1, max_queue_depth=1)
+        patcher = mock.patch.object(app_module, "job_queue", self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.release.set()
+        self.queue.shutdown()
+
+    def handler(self, payload, report_progress):
+        self.started.release()
+        self.release.wait(10)
+        return {"score": 80}
+
+    def upload(self, content=b"video"):
+        return client.post("/api/upload", data={
+            "video": (io.BytesIO(content), "squat.mp4"),
+            "exerciseType": "squat"
+        }, content_type="multipart/form-data")
+
+    def test_uploads_past_the_queue_depth_get_a_429(self):
+        running = self.upload(b"first")
+        self.assertEqual(running.status_code, 202)
+        self.assertTrue(self.started.acquire(timeout=10))
+
+        queued = self.upload(b"second")
+        self.assertEqual(queued.status_code, 202)
+        self.assertEqual(client.get(queued.get_json()["status_url"]).get_json()["status"], "queued")
+
+        rejected = self.upload(b"third")
+        self.assertEqual(rejected.status_code, 429)
+        self.assertGreaterEqual(int(rejected.headers["Retry-After"]), 1)
+
+        batch = client.post("/api/uploads/batch", data={
+            "videos": [(io.BytesIO(b"fourth"), "a.mp4"), (io.BytesIO(b"fifth"), "b.mp4")],
+            "exerciseType": "squat"
+        }, content_type="multipart/form-data")
+        self.assertEqual(batch.status_code, 429)
+
+        self.release.set()
+        job_url = running.get_json()["result_url"]
+        self.assertTrue(self.started.acquire(timeout=10))
+        self.assertEqual(client.get(job_url).get_json()["result"], {"score": 80})
+
+    def test_unknown_quality_is_rejected_before_queueing(self):
+        response = client.post("/api/upload", data={
+            "video": (io.BytesIO(b"video"), "squat.mp4"),
+            "quality": "best"
+        }, content_type="multipart/form-data")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.queue.stats()["queued"] + self.queue.stats()["running"], 0)
+
+
+class ExerciseListingTest(unittest.TestCase):
+    def store(self, user_id):
+        return app_module.system_logger.store_exercise_data(user_id, "squat", "beginner", {"score": 70})
+
+    def test_listing_is_revalidated_against_the_history_version(self):
+        self.store("alice")
+        first = client.get("/api/exercises?userId=alice")
+        etag = first.headers["ETag"]
+        self.assertEqual(client.get("/api/exercises?userId=alice",
+                                         headers={"If-None-Match": etag}).status_code, 304)
+
+        # Another user's exercise doesn't change this user's listing
+        self.store("bob")
+        self.assertEqual(client.get("/api/exercises?userId=alice",
+                                         headers={"If-None-Match": etag}).status_code, 304)
+
+        self.store("alice")
+        changed = client.get("/api/exercises?userId=alice", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.get_json()["exercises"]), len(first.get_json()["exercises"]) + 1)
+
+    def test_empty_user_filter_lists_and_tags_every_user(self):
+        listing = client.get("/api/exercises?userId=")
+        self.assertEqual(listing.headers["ETag"], client.get("/api/exercises").headers["ETag"])
+
+        self.store("carol")
+        changed = client.get("/api/exercises?userId=", headers={"If-None-Match": listing.headers["ETag"]})
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn("carol", [exercise["user_id"] for exercise in changed.get_json()["exercises"]])
+
+    def test_invalid_arguments_are_a_400(self):
+        self.assertEqual(client.get("/api/exercises?cursor=nonsense").status_code, 400)
+        self.assertEqual(client.get("/api/exercises?from=yesterday").status_code, 400)
+        self.assertEqual(client.get("/api/exercises?fields=id,secret").status_code, 400)
+
+
+class TimeArgumentTest(unittest.TestCase):
+    def test_offsets_are_converted_to_local_time(self):
+        parse = app_module.parse_time_arg
+        expected = datetime(2026, 1, 1, 7, 0, tzinfo=timezone.utc).astimezone().replace(tzinfo=None).isoformat()
+
+        self.assertEqual(parse("2026-01-01T12:00:00+05:00"), expected)
+        self.assertEqual(parse("2026-01-01T07:00:00Z"), expected)
+        self.assertEqual(parse("2026-01-01T07:00:00"), "2026-01-01T07:00:00")
+
+    def test_date_only_end_covers_the_day(self):
+        parse = app_module.parse_time_arg
+        self.assertEqual(parse("2026-01-01", end_of_day=True), "2026-01-01T23:59:59.999999")
+        self.assertEqual(parse("2026-01-01"), "2026-01-01T00:00:00")
+        self.assertIsNone(parse(""))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+"""
+Tests of the LLM feedback cache and the conditional response cache:
+
+    cd project/backend && python -m pytest tests
+"""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from agents.feedback_cache import FeedbackCache
+from agents.response_cache import ResponseCache, make_etag
+
+ERRORS = [{"type": "knees_over_ankles", "severity": "high", "start_time": 1.2}]
+METADATA = {"exercise_type": "squat", "fitness_level": "beginner"}
+
+
+class FeedbackCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="feedback-cache-test-")
+        self.path = os.path.join(self.work_dir, "feedback_cache.json")
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def cache(self, **kwargs):
+        cache = FeedbackCache(**kwargs)
+        self.caches.append(cache)
+        return cache
+
+    def test_key_ignores_timing_and_order_of_errors(self):
+        moved = [{"type": "knees_over_ankles", "severity": "high", "start_time": 7.5}]
+        self.assertEqual(FeedbackCache.make_key(ERRORS, METADATA), FeedbackCache.make_key(ERRORS * 2, METADATA))
+        self.assertEqual(FeedbackCache.make_key(ERRORS, METADATA), FeedbackCache.make_key(moved, METADATA))
+        self.assertNotEqual(FeedbackCache.make_key(ERRORS, METADATA),
+                            FeedbackCache.make_key(ERRORS, {**METADATA, "fitness_level": "advanced"}))
+
+        reps = {"reps": [{"errors": ["knees_over_ankles"], "partial": False}], "tempo": {"duration": 2.1}}
+        self.assertNotEqual(FeedbackCache.make_key(ERRORS, METADATA), FeedbackCache.make_key(ERRORS, METADATA, reps))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = self.cache(max_entries=2)
+        cache.put("a", ("feedback a", "form a"))
+        cache.put("b", ("feedback b", "form b"))
+        self.assertEqual(cache.get("a"), ("feedback a", "form a"))
+
+        cache.put("c", ("feedback c", "form c"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), ("feedback a", "form a"))
+
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"], stats["evictions"]), (2, 2, 1, 1))
+
+    def test_entries_expire(self):
+        cache = self.cache(ttl_seconds=60)
+        with mock.patch("agents.feedback_cache.time") as clock:
+            clock.time.return_value = 1000.0
+            cache.put("a", ("feedback", "form"))
+
+            clock.time.return_value = 1059.0
+            self.assertEqual(cache.get("a"), ("feedback", "form"))
+
+            clock.time.return_value = 1061.0
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_entries_survive_a_restart(self):
+        cache = self.cache(persist_path=self.path)
+        cache.put("a", ("feedback a", "form a"))
+        cache.put("b", ("feedback b", "form b"))
+        cache.close()
+
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+        restarted = self.cache(persist_path=self.path)
+        self.assertEqual(restarted.get("a"), ("feedback a", "form a"))
+        self.assertEqual(restarted.stats()["size"], 2)
+
+    def test_legacy_single_array_file_is_loaded(self):
+        entry = {"value": ["feedback", "form"], "expires_at": 4102444800}
+        with open(self.path, "w") as f:
+            json.dump([["a", entry], ["b", entry]], f)
+
+        cache = self.cache(persist_path=self.path)
+        self.assertEqual(cache.get("b"), ("feedback", "form"))
+
+    def test_processes_sharing_the_file_see_each_others_entries(self):
+        first = self.cache(persist_path=self.path)
+        second = self.cache(persist_path=self.path)
+
+        first.put("a", ("feedback a", "form a"))
+        second.put("b", ("feedback b", "form b"))
+        first.flush()
+        second.flush()
+
+        self.assertEqual(second.get("a"), ("feedback a", "form a"))
+        self.assertEqual(first.get("b"), ("feedback b", "form b"))
+
+        # Neither overwrote the other's entry
+        restarted = self.cache(persist_path=self.path)
+        self.assertEqual(restarted.stats()["size"], 2)
+
+    def test_file_is_compacted_to_the_live_entries(self):
+        cache = self.cache(max_entries=4, compact_factor=2, persist_path=self.path)
+        for index in range(20):
+            cache.put(f"key-{index % 6}", (f"feedback {index}", "form"))
+            cache.flush()
+
+        with open(self.path) as f:
+            self.assertLessEqual(len(f.readlines()), 2 * 4)
+
+        restarted = self.cache(max_entries=4, persist_path=self.path)
+        self.assertEqual(restarted.get("key-1"), ("feedback 19", "form"))
+        self.assertEqual(restarted.stats()["size"], 4)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.cache = ResponseCache(max_bytes=4096, min_size=100)
+        self.builds = 0
+        self.data = {"exercises": [{"id": "a", "notes": "x" * 300}]}
+        self.version = "v1"
+
+        @self.app.route("/data")
+        def data():
+            def build():
+                self.builds += 1
+                return self.data
+            response = self.cache.json_response(build, make_etag("data", self.version))
+            return response if response is not None else ("", 404)
+
+        self.client = self.app.test_client()
+
+    def test_current_tag_gets_a_304_without_building(self):
+        response = self.client.get("/data")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        etag = response.headers["ETag"]
+        self.assertTrue(etag.startswith("W/"))
+
+        response = self.client.get("/data", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(self.builds, 1)
+
+        self.version = "v2"
+        response = self.client.get("/data", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(self.builds, 2)
+
+    def test_encoded_body_is_reused_per_encoding(self):
+        plain = self.client.get("/data")
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(plain.get_json(), self.data)
+
+        compressed = self.client.get("/data", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(compressed.headers["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(compressed.data)), self.data)
+        self.assertIn("Accept-Encoding", compressed.headers["Vary"])
+
+        self.client.get("/data", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(self.builds, 2)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_small_bodies_are_not_compressed(self):
+        self.data = {"id": "a"}
+        response = self.client.get("/data", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_cache_is_bounded_by_bytes(self):
+        for version in range(20):
+            self.version = f"v{version}"
+            self.client.get("/data")
+
+        stats = self.cache.stats()
+        self.assertLessEqual(stats["bytes"], 4096)
+        self.assertLess(stats["size"], 20)
+
+        # The oldest versions were evicted, the newest is still cached
+        self.client.get("/data")
+        self.assertEqual(self.builds, 20)
+        self.version = "v0"
+        self.client.get("/data")
+        self.assertEqual(self.builds, 21)
+
+    def test_missing_data_is_not_cached(self):
+        self.data = None
+        self.assertEqual(self.client.get("/data").status_code, 404)
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+"""
+Tests of the exercise store: keyset pagination, history versions and the
+progress aggregates kept next to it:
+
+    cd project/backend && python -m pytest tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+
+from agents.exercise_store import ExerciseStore, ALL_USERS
+
+TODAY = date(2026, 3, 10)
+
+
+def exercise(exercise_id, user_id="alice", exercise_type="squat", day=TODAY, time="10:00:00",
+             score=80, errors=()):
+    return {
+        "id": exercise_id,
+        "user_id": user_id,
+        "exercise_type": exercise_type,
+        "fitness_level": "beginner",
+        "timestamp": f"{day.isoformat()}T{time}",
+        "date": day.isoformat(),
+        "result": {"score": score, "errors": [{"type": error} for error in errors]}
+    }
+
+
+class ExerciseStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="exercise-store-test-")
+        self.db_path = os.path.join(self.work_dir, "exercises.db")
+        self.store = ExerciseStore(self.db_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+class PaginationTest(ExerciseStoreTestCase):
+    def setUp(self):
+        super().setUp()
+        start = datetime(2026, 3, 1, 8)
+        records = []
+        for index in range(25):
+            # Pairs of exercises share a timestamp, so ties are broken by ID
+            timestamp = start + timedelta(hours=index // 2)
+            records.append(exercise(f"ex-{index:02d}", user_id="alice" if index % 3 else "bob",
+                                    exercise_type="squat" if index % 2 else "pushup",
+                                    day=timestamp.date(), time=timestamp.strftime("%H:%M:%S")))
+        self.store.put_many(records)
+
+    def pages(self, limit, **filters):
+        pages, cursor = [], None
+        while True:
+            page = self.store.page(limit, cursor=cursor, **filters)
+            pages.append([record["id"] for record in page["exercises"]])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_the_listing_once_newest_first(self):
+        expected = [record["id"] for record in self.store.query()]
+        self.assertEqual(len(expected), 25)
+
+        pages = self.pages(7)
+        self.assertEqual([len(page) for page in pages], [7, 7, 7, 4])
+        self.assertEqual(sum(pages, []), expected)
+
+        timestamps = [record["timestamp"] for record in self.store.query()]
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+
+    def test_exact_multiple_of_the_page_size_has_no_empty_last_page(self):
+        self.assertEqual([len(page) for page in self.pages(5)], [5] * 5)
+
+    def test_pages_dont_shift_when_newer_exercises_arrive(self):
+        first = self.store.page(10)
+        self.store.put(exercise("ex-new", day=date(2026, 4, 1)))
+        second = self.store.page(10, cursor=first["next_cursor"])
+
+        expected = [record["id"] for record in self.store.query()][11:21]
+        self.assertEqual([record["id"] for record in second["exercises"]], expected)
+
+    def test_filters_and_projection(self):
+        bob_squats = self.store.query(user_id="bob", exercise_type="squat")
+        self.assertTrue(bob_squats)
+        self.assertTrue(all(r["user_id"] == "bob" and r["exercise_type"] == "squat" for r in bob_squats))
+
+        pages = self.pages(2, user_id="bob", exercise_type="squat")
+        self.assertEqual(sum(pages, []), [record["id"] for record in bob_squats])
+
+        window = self.store.query(since="2026-03-01T10:00:00", until="2026-03-01T12:00:00")
+        self.assertEqual(len(window), 6)
+
+        page = self.store.page(3, fields=["id", "type", "score"])
+        self.assertEqual(page["exercises"][0], {"id": "ex-24", "type": "pushup", "score": 80})
+
+    def test_rejects_unknown_fields_and_bad_cursors(self):
+        with self.assertRaises(ValueError):
+            self.store.page(5, fields=["id", "record"])
+        with self.assertRaises(ValueError):
+            self.store.page(5, cursor="not-a-cursor")
+
+
+class HistoryVersionTest(ExerciseStoreTestCase):
+    def test_write_bumps_the_users_and_the_global_version_only(self):
+        self.assertEqual(self.store.history_version("alice"), 0)
+
+        self.store.put(exercise("a1"))
+        self.store.put(exercise("b1", user_id="bob"))
+        alice, bob, everyone = (self.store.history_version(scope) for scope in ("alice", "bob", ALL_USERS))
+
+        self.store.put(exercise("a2"))
+        self.assertGreater(self.store.history_version("alice"), alice)
+        self.assertEqual(self.store.history_version("bob"), bob)
+        self.assertGreater(self.store.history_version(ALL_USERS), everyone)
+
+    def test_kept_duplicate_doesnt_change_the_version(self):
+        self.store.put(exercise("a1"))
+        version = self.store.history_version("alice")
+
+        self.store.put_many([exercise("a1", score=10)], replace=False)
+        self.assertEqual(self.store.history_version("alice"), version)
+        self.assertEqual(self.store.get("a1")["result"]["score"], 80)
+
+    def test_replacing_a_record_moves_both_users(self):
+        self.store.put(exercise("x1", user_id="alice"))
+        alice, bob = self.store.history_version("alice"), self.store.history_version("bob")
+
+        self.store.put(exercise("x1", user_id="bob"))
+        self.assertGreater(self.store.history_version("alice"), alice)
+        self.assertGreater(self.store.history_version("bob"), bob)
+
+    def test_versions_are_shared_between_processes(self):
+        other = ExerciseStore(self.db_path)
+        version = other.history_version("alice")
+
+        self.store.put(exercise("a1"))
+        self.assertGreater(other.history_version("alice"), version)
+        self.assertEqual(other.get("a1")["id"], "a1")
+
+
+class ProgressTest(ExerciseStoreTestCase):
+    def summary(self, user_id="alice", exercise_type=None, days=30):
+        return self.store.aggregates.summary(self.store._connection(), user_id, exercise_type, days, today=TODAY)
+
+    def test_totals_best_and_daily_buckets(self):
+        self.store.put_many([
+            exercise("a1", day=TODAY - timedelta(days=2), score=60, errors=["knees_over_ankles"]),
+            exercise("a2", day=TODAY - timedelta(days=1), score=90, errors=["knees_over_ankles", "back_straight"]),
+            exercise("a3", day=TODAY, time="09:00:00", score=70, exercise_type="pushup", errors=["hips_sagging"]),
+            exercise("a4", day=TODAY, time="18:00:00", score=90),
+            exercise("b1", user_id="bob", score=10)
+        ])
+
+        summary = self.summary()
+        self.assertEqual(summary["sessions"], 4)
+        self.assertEqual(summary["average_score"], 77.5)
+        # Ties go to the earlier session
+        self.assertEqual(summary["personal_best"]["exercise_id"], "a2")
+        self.assertEqual(summary["streak"], {"current": 3, "longest": 3})
+        self.assertEqual(summary["first_session"], exercise("a1", day=TODAY - timedelta(days=2))["timestamp"])
+        self.assertEqual([bucket["sessions"] for bucket in summary["daily"]], [1, 1, 2])
+        self.assertEqual(summary["daily"][-1]["average_score"], 80.0)
+        self.assertEqual(summary["top_errors"][0]["type"], "knees_over_ankles")
+        self.assertEqual(summary["top_errors"][0]["occurrences"], 2)
+
+        squats = self.summary(exercise_type="squat")
+        self.assertEqual(squats["sessions"], 3)
+        self.assertNotIn("hips_sagging", [error["type"] for error in squats["top_errors"]])
+
+        self.assertEqual(self.store.exercise_types("alice"), ["pushup", "squat"])
+        self.assertIsNone(self.summary(exercise_type="lunge"))
+
+    def test_rolling_windows_and_daily_range(self):
+        self.store.put_many([
+            exercise("old", day=TODAY - timedelta(days=20), score=40),
+            exercise("recent", day=TODAY - timedelta(days=3), score=80)
+        ])
+
+        summary = self.summary(days=7)
+        self.assertEqual(summary["rolling_average"], {"7d": 80.0, "30d": 60.0})
+        self.assertEqual([bucket["date"] for bucket in summary["daily"]], [(TODAY - timedelta(days=3)).isoformat()])
+        # Last session three days ago, so the streak is over
+        self.assertEqual(summary["streak"], {"current": 0, "longest": 1})
+
+    def test_backfilled_day_recomputes_streaks(self):
+        self.store.put(exercise("a1", day=TODAY - timedelta(days=2)))
+        self.store.put(exercise("a3", day=TODAY))
+        self.assertEqual(self.summary()["streak"], {"current": 1, "longest": 1})
+
+        self.store.put(exercise("a2", day=TODAY - timedelta(days=1)))
+        self.assertEqual(self.summary()["streak"], {"current": 3, "longest": 3})
+
+    def test_replaced_record_is_not_counted_twice(self):
+        self.store.put(exercise("a1", score=50))
+        self.store.put(exercise("a1", score=70))
+
+        summary = self.summary()
+        self.assertEqual(summary["sessions"], 1)
+        self.assertEqual(summary["average_score"], 70.0)
+
+    def test_rebuild_matches_incremental_aggregates(self):
+        self.store.put_many([
+            exercise(f"a{index}", day=TODAY - timedelta(days=index % 4), time=f"1{index % 10}:00:00",
+                     score=50 + index, errors=["knees_over_ankles"] * (index % 3))
+            for index in range(12)
+        ])
+        incremental = self.summary()
+
+        self.assertEqual(self.store.rebuild_progress(), 12)
+        self.assertEqual(self.summary(), incremental)
+
+
+if __name__ == "__main__":
+    unittest.main()
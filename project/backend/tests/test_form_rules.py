@@ -0,0 +1,154 @@
+"""
+Tests of the form rules, their interval merging and the frame-by-frame evaluator
+used by live sessions, on synthetic landmarks:
+
+    cd project/backend && python -m pytest tests
+"""
+import unittest
+
+import numpy as np
+
+from agents.error_intervals import merge_violations
+from agents.form_rules import FormRuleEngine
+from agents.landmarks import JOINT_PAIRS, X
+from agents.online_rules import OnlineRuleEvaluator
+from synthetic import pose_frames, squat_frames, to_sequence
+
+FPS = 30
+
+
+def knee_drift(offsets):
+    """Standing frames whose knees sit `offsets[i]` in front of the ankles"""
+    frames = pose_frames(len(offsets))
+    frames[:, JOINT_PAIRS["knees"], X] += np.asarray(offsets, dtype=np.float32)[:, np.newaxis]
+    return frames
+
+
+class MergeViolationsTest(unittest.TestCase):
+    def merge(self, excess, **kwargs):
+        excess = np.asarray(excess, dtype=np.float32)
+        return merge_violations(excess, np.full(len(excess), 0.9), np.arange(len(excess)), FPS, **kwargs)
+
+    def test_value_hovering_at_the_limit_is_one_interval_with_hysteresis(self):
+        excess = np.tile([0.01, -0.005], 10)
+
+        self.assertEqual(len(self.merge(excess)), 10)
+
+        intervals = self.merge(excess, release=0.02)
+        self.assertEqual(len(intervals), 1)
+        self.assertEqual((intervals[0]["start_frame"], intervals[0]["end_frame"]), (0, 19))
+        self.assertEqual(intervals[0]["frames"], 10)
+
+    def test_interval_closes_once_the_value_is_back_past_the_release_margin(self):
+        intervals = self.merge([-0.1, 0.05, 0.02, -0.01, -0.03, -0.1, 0.04, -0.1], release=0.02)
+        self.assertEqual([(i["start_frame"], i["end_frame"]) for i in intervals], [(1, 3), (6, 6)])
+
+    def test_release_band_alone_is_not_a_violation(self):
+        self.assertEqual(self.merge([-0.01, -0.01, -0.01], release=0.02), [])
+
+    def test_short_gaps_are_joined_and_short_intervals_dropped(self):
+        excess = [0.1] * 6 + [np.nan] * 2 + [0.1] * 6 + [-1] * 10 + [0.1] * 2
+
+        intervals = self.merge(excess, max_gap=2, min_duration=0.1)
+        self.assertEqual([(i["start_frame"], i["end_frame"]) for i in intervals], [(0, 13)])
+        self.assertEqual(intervals[0]["frames"], 12)
+        self.assertEqual(intervals[0]["peak_confidence"], 0.9)
+
+        self.assertEqual(len(self.merge(excess, max_gap=1, min_duration=0.1)), 2)
+
+
+class FormRuleEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = FormRuleEngine()
+
+    def test_clean_squats_have_no_errors(self):
+        sequence = to_sequence(squat_frames([0.2, 0.2, 0.2], FPS), FPS)
+        self.assertEqual(self.engine.evaluate(sequence, "squat"), [])
+
+    def test_knees_hovering_around_the_limit_are_one_error(self):
+        # Alternates just over and just under the 0.1 limit for two seconds
+        offsets = [0.0] * 15 + [0.105, 0.105, 0.095] * 20 + [0.0] * 15
+        errors = self.engine.evaluate(to_sequence(knee_drift(offsets), FPS), "squat")
+
+        self.assertEqual([error["type"] for error in errors], ["knees_over_ankles"])
+        self.assertEqual(errors[0]["start_frame"], 15)
+        # The last frame is under the limit but inside the release margin
+        self.assertEqual(errors[0]["end_frame"], 74)
+        self.assertEqual(errors[0]["severity"], "high")
+        self.assertEqual(errors[0]["start"], "00:00")
+
+    def test_frames_without_a_pose_never_violate(self):
+        offsets = [0.3] * 60
+        sequence = to_sequence(knee_drift(offsets), FPS, missing=range(60))
+        self.assertEqual(self.engine.evaluate(sequence, "squat"), [])
+
+    def test_fast_descent_is_flagged(self):
+        frames = squat_frames([0.45], FPS, rep_seconds=1.2, descent_fraction=0.25)
+        errors = self.engine.evaluate(to_sequence(frames, FPS), "squat")
+        self.assertEqual([error["type"] for error in errors], ["descent_speed"])
+
+    def test_fast_ascent_is_not_a_fast_descent(self):
+        frames = squat_frames([0.45], FPS, rep_seconds=1.2, descent_fraction=0.75)
+        self.assertEqual(self.engine.evaluate(to_sequence(frames, FPS), "squat"), [])
+
+    def test_tempo_uses_source_frame_numbers_of_strided_sequences(self):
+        frames = squat_frames([0.6], FPS, rep_seconds=2.0, descent_fraction=0.25)
+        every_frame = self.engine.evaluate(to_sequence(frames, FPS), "squat")
+
+        strided = to_sequence(frames, FPS)
+        strided.data, strided.frame_indices, strided.detected = (
+            strided.data[::2], strided.frame_indices[::2], strided.detected[::2]
+        )
+        errors = self.engine.evaluate(strided, "squat")
+
+        self.assertEqual([error["type"] for error in errors], ["descent_speed"])
+        self.assertAlmostEqual(errors[0]["start_time"], every_frame[0]["start_time"], delta=2 / FPS)
+
+
+class OnlineRuleEvaluatorTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = FormRuleEngine()
+
+    def noisy_session(self, seed):
+        rng = np.random.default_rng(seed)
+        frames = squat_frames([0.2, 0.3, 0.25], FPS, rep_seconds=1.0)
+        frames[..., :2] += rng.normal(0, 0.03, frames[..., :2].shape).astype(np.float32)
+        frames[..., 3] = rng.uniform(0.5, 1.0, frames.shape[:2])
+        missing = set(rng.choice(len(frames), 20, replace=False).tolist())
+        return frames, missing
+
+    def test_matches_the_batch_engine(self):
+        for seed, exercise_type in enumerate(["squat", "deadlift", "pushup", "plank", "lunge"]):
+            with self.subTest(exercise_type=exercise_type):
+                frames, missing = self.noisy_session(seed)
+                expected = self.engine.evaluate(to_sequence(frames, FPS, missing), exercise_type)
+                self.assertTrue(expected)
+
+                evaluator = OnlineRuleEvaluator(self.engine, exercise_type, FPS)
+                reported = []
+                for frame_index, landmarks in enumerate(frames):
+                    reported.extend(evaluator.push(frame_index, None if frame_index in missing else landmarks))
+
+                self.assertEqual(evaluator.finish(), expected)
+                # Every error is reported once while the session runs
+                self.assertEqual(len(reported), len(expected))
+
+    def test_reports_an_error_once_it_is_long_enough(self):
+        offsets = [0.0] * 10 + [0.2] * 30 + [0.0] * 10
+        evaluator = OnlineRuleEvaluator(self.engine, "squat", FPS)
+
+        reported_at = []
+        for frame_index, landmarks in enumerate(knee_drift(offsets)):
+            if evaluator.push(frame_index, landmarks):
+                reported_at.append(frame_index)
+            if frame_index == 20:
+                self.assertEqual(evaluator.active(), ["knees_over_ankles"])
+
+        # Reported on the frame the interval reaches the 0.2 s minimum duration
+        self.assertEqual(reported_at, [10 + int(0.2 * FPS) - 1])
+        self.assertEqual(evaluator.active(), [])
+        self.assertEqual(len(evaluator.finish()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+"""
+Tests of the background job queue: progress, journal recovery after a restart
+and backpressure:
+
+    cd project/backend && python -m pytest tests
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from agents.job_queue import JobQueue, QueueFullError, JOB_COMPLETED, JOB_FAILED, JOB_QUEUED, JOB_RUNNING
+
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def dead_pid():
+    """PID of a process that has exited"""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+class JobQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.jobs_dir = tempfile.mkdtemp(prefix="job-queue-test-")
+        self.queues = []
+        self.release = threading.Event()
+        self.calls = []
+
+    def tearDown(self):
+        self.release.set()
+        for queue in self.queues:
+            queue.shutdown()
+        shutil.rmtree(self.jobs_dir, ignore_errors=True)
+
+    def start(self, handler=None, **kwargs):
+        queue = JobQueue(handler or self.handler, jobs_dir=self.jobs_dir, **kwargs)
+        self.queues.append(queue)
+        return queue
+
+    def handler(self, payload, report_progress):
+        self.calls.append(payload)
+        report_progress("extracting", {"frames": 10})
+        report_progress("scoring")
+        return {"score": payload["n"] * 10}
+
+    def blocking_handler(self, payload, report_progress):
+        self.calls.append(payload)
+        self.release.wait(10)
+        return {"n": payload["n"]}
+
+    def finished(self, queue, job_id):
+        return lambda: queue.get_job(job_id)["status"] in (JOB_COMPLETED, JOB_FAILED)
+
+    def journal(self, job):
+        with open(os.path.join(self.jobs_dir, f"{job['id']}.json"), "w") as f:
+            json.dump(job, f)
+
+    def journaled_job(self, job_id, status, attempts, owner_pid):
+        return {
+            "id": job_id, "status": status, "stage": status, "stages_completed": [],
+            "created_at": "2026-03-01T10:00:00", "updated_at": "2026-03-01T10:00:00",
+            "attempts": attempts, "owner_pid": owner_pid, "request_id": None,
+            "payload": {"n": 4}, "partial": {}, "result": None, "error": None
+        }
+
+    def test_job_reports_stages_and_result(self):
+        queue = self.start()
+        job = queue.submit({"n": 3}, partial={"video": "a.mp4"})
+        self.assertEqual(job["status"], JOB_QUEUED)
+        self.assertTrue(wait_for(self.finished(queue, job["id"])))
+
+        record = queue.get_result(job["id"])
+        self.assertEqual(record["status"], JOB_COMPLETED)
+        self.assertEqual(record["result"], {"score": 30})
+        self.assertEqual(record["partial"], {"video": "a.mp4", "frames": 10})
+        self.assertEqual(record["stages_completed"], ["extracting", "scoring"])
+        self.assertEqual(record["attempts"], 1)
+
+        # Any process can answer from the journal
+        with open(os.path.join(self.jobs_dir, f"{job['id']}.json")) as f:
+            self.assertEqual(json.load(f)["status"], JOB_COMPLETED)
+
+    def test_failed_job_keeps_its_error(self):
+        def failing(payload, report_progress):
+            raise RuntimeError("no pose found")
+
+        queue = self.start(failing)
+        job = queue.submit({"n": 1})
+        self.assertTrue(wait_for(self.finished(queue, job["id"])))
+        self.assertEqual(queue.get_result(job["id"])["error"], "no pose found")
+
+    def test_unfinished_jobs_of_a_dead_process_are_recovered(self):
+        pid = dead_pid()
+        self.journal(self.journaled_job("queued-job", JOB_QUEUED, 0, pid))
+        self.journal(self.journaled_job("running-job", JOB_RUNNING, 1, pid))
+        self.journal(self.journaled_job("exhausted-job", JOB_RUNNING, 2, pid))
+        self.journal({**self.journaled_job("done-job", JOB_COMPLETED, 1, pid), "result": {"score": 1}})
+
+        queue = self.start(max_attempts=2)
+        for job_id in ("queued-job", "running-job"):
+            self.assertTrue(wait_for(self.finished(queue, job_id)))
+            self.assertEqual(queue.get_result(job_id)["result"], {"score": 40})
+
+        self.assertEqual(queue.get_job("running-job")["attempts"], 2)
+
+        exhausted = queue.get_result("exhausted-job")
+        self.assertEqual(exhausted["status"], JOB_FAILED)
+        self.assertIn("interrupted", exhausted["error"])
+
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(queue.get_result("done-job")["result"], {"score": 1})
+
+    def test_jobs_of_a_live_process_are_left_alone(self):
+        # The parent process of this test is alive
+        self.journal(self.journaled_job("other-job", JOB_QUEUED, 0, os.getppid()))
+
+        queue = self.start()
+        time.sleep(0.2)
+        self.assertEqual(self.calls, [])
+        self.assertEqual(queue.get_job("other-job")["status"], JOB_QUEUED)
+
+    def test_queued_jobs_survive_a_shutdown(self):
+        queue = self.start(self.blocking_handler, num_workers=1)
+        running = queue.submit({"n": 1})
+        self.assertTrue(wait_for(lambda: queue.stats()["running"] == 1))
+        waiting = queue.submit({"n": 2})
+        queue.shutdown(wait=False)
+
+        # The journal still shows the job as queued, owned by this process
+        with open(os.path.join(self.jobs_dir, f"{waiting['id']}.json")) as f:
+            self.assertEqual(json.load(f)["status"], JOB_QUEUED)
+
+        self.release.set()
+        self.assertTrue(wait_for(lambda: queue.get_job(running["id"])["status"] == JOB_COMPLETED))
+
+        # A restarted server (same PID here, as in a container) picks it up
+        restarted = self.start()
+        self.assertTrue(wait_for(self.finished(restarted, waiting["id"])))
+        self.assertEqual(restarted.get_result(waiting["id"])["result"], {"score": 20})
+
+    def test_full_queue_rejects_submissions(self):
+        queue = self.start(self.blocking_handler, num_workers=1, max_queue_depth=2)
+        first = queue.submit({"n": 1})
+        self.assertTrue(wait_for(lambda: queue.stats()["running"] == 1))
+
+        queue.submit({"n": 2})
+        self.assertFalse(queue.is_full())
+        queue.submit({"n": 3})
+        self.assertTrue(queue.is_full())
+
+        with self.assertRaises(QueueFullError):
+            queue.submit({"n": 4})
+        self.assertEqual(queue.stats(), {"queued": 2, "running": 1, "workers": 1, "max_queue_depth": 2})
+        self.assertGreaterEqual(queue.retry_after_seconds(), 1)
+
+        self.release.set()
+        self.assertTrue(wait_for(lambda: queue.stats()["queued"] == 0 and queue.stats()["running"] == 0))
+        self.assertEqual(queue.get_result(first["id"])["result"], {"n": 1})
+        self.assertEqual(sorted(call["n"] for call in self.calls), [1, 2, 3])
+
+    def test_job_of_a_dead_worker_thread_is_retried(self):
+        def crash_once(payload, report_progress):
+            self.calls.append(payload)
+            if len(self.calls) == 1:
+                # Not an Exception, so it ends the worker thread
+                raise SystemExit
+            return {"ok": True}
+
+        queue = self.start(crash_once, num_workers=1)
+        # The crash is expected, don't report it
+        with mock.patch("threading.excepthook", lambda args: None):
+            job = queue.submit({"n": 1})
+            self.assertTrue(wait_for(self.finished(queue, job["id"])))
+
+        record = queue.get_result(job["id"])
+        self.assertEqual(record["result"], {"ok": True})
+        self.assertEqual(record["attempts"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
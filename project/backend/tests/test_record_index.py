@@ -0,0 +1,148 @@
+"""
+Tests of restoring the Logger's record index from snapshots, the segment log
+and legacy per-record files:
+
+    cd project/backend && python -m pytest tests
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from agents.logger import Logger
+
+
+class RecordIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix="record-index-test-")
+        self.loggers = []
+
+    def tearDown(self):
+        for logger in self.loggers:
+            logger.close()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def start(self, write_mode="sync"):
+        logger = Logger(self.data_dir, write_mode=write_mode, snapshot_interval=3600)
+        self.loggers.append(logger)
+        self.assertTrue(logger.record_index.wait_ready(10))
+        return logger
+
+    def stop(self, logger, snapshot=True):
+        """Shut a logger down cleanly, or as if the process died before its next snapshot"""
+        self.loggers.remove(logger)
+        if snapshot:
+            logger.close()
+        else:
+            logger.segment_log.close()
+
+    def store_errors(self, logger, count):
+        for index in range(count):
+            logger.store_error_data("alice", "squat", [{"type": "knees_over_ankles", "index": index}])
+        logger.flush()
+        return sorted(logger.record_index._records["error_data"])
+
+    def test_restart_restores_from_the_snapshot_without_replaying(self):
+        logger = self.start()
+        record_ids = self.store_errors(logger, 20)
+        self.stop(logger)
+
+        restarted = self.start()
+        status = restarted.restore_status()
+        self.assertIsNotNone(status["snapshot"])
+        self.assertEqual(status["bytes_replayed"], 0)
+        self.assertEqual(status["records"]["error_data"], 20)
+
+        for record_id in record_ids:
+            self.assertEqual(restarted.get_record("error_data", record_id)["id"], record_id)
+
+    def test_only_the_log_after_the_snapshot_is_replayed(self):
+        logger = self.start()
+        self.store_errors(logger, 10)
+        logger.record_index.snapshot()
+
+        segment = logger.segment_log.segments("error_data")[0]
+        size_at_snapshot = os.path.getsize(segment)
+        record_ids = self.store_errors(logger, 15)
+        self.stop(logger, snapshot=False)
+
+        restarted = self.start()
+        status = restarted.restore_status()
+        self.assertEqual(status["bytes_replayed"], os.path.getsize(segment) - size_at_snapshot)
+        self.assertEqual(status["records"]["error_data"], 25)
+        for record_id in record_ids:
+            self.assertIsNotNone(restarted.get_record("error_data", record_id))
+
+    def test_torn_last_line_is_skipped(self):
+        logger = self.start()
+        self.store_errors(logger, 3)
+        segment = logger.segment_log.segments("error_data")[0]
+        self.stop(logger, snapshot=False)
+
+        with open(segment, "ab") as f:
+            f.write(b'{"id": "torn", "errors": [')
+
+        restarted = self.start()
+        self.assertEqual(restarted.restore_status()["records"]["error_data"], 3)
+        self.assertIsNone(restarted.get_record("error_data", "torn"))
+
+    def test_exercises_in_the_log_are_restored_into_a_new_database(self):
+        logger = self.start()
+        exercise_id = logger.store_exercise_data("alice", "squat", "beginner", {"id": "ex-1", "score": 75})
+        self.stop(logger, snapshot=False)
+
+        for name in os.listdir(self.data_dir):
+            if name.startswith("exercises.db"):
+                os.remove(os.path.join(self.data_dir, name))
+
+        restarted = self.start()
+        self.assertEqual(restarted.get_exercise_data(exercise_id)["result"]["score"], 75)
+        self.assertEqual(restarted.get_progress("alice")["sessions"], 1)
+
+    def test_legacy_record_files_are_imported_once(self):
+        legacy = {
+            "error_data_old-1.json": {"id": "old-1", "user_id": "alice", "errors": []},
+            "exercise_data_old-2.json": {"id": "old-2", "user_id": "alice", "exercise_type": "squat",
+                                         "timestamp": "2025-01-01T10:00:00", "date": "2025-01-01",
+                                         "result": {"score": 60}}
+        }
+        for name, record in legacy.items():
+            with open(os.path.join(self.data_dir, name), "w") as f:
+                json.dump(record, f, indent=2)
+
+        logger = self.start()
+        self.assertEqual(logger.restore_status()["legacy_files_imported"], 2)
+        self.assertEqual(logger.get_record("error_data", "old-1")["id"], "old-1")
+        self.assertEqual(logger.get_exercise_data("old-2")["result"]["score"], 60)
+        self.stop(logger)
+
+        restarted = self.start()
+        self.assertEqual(restarted.restore_status()["legacy_files_imported"], 0)
+        self.assertEqual(restarted.get_record("error_data", "old-1")["id"], "old-1")
+
+    def test_records_written_by_another_process_are_found(self):
+        writer = self.start(write_mode="write_behind")
+        reader = self.start()
+
+        record_ids = self.store_errors(writer, 5)
+        for record_id in record_ids:
+            self.assertEqual(reader.get_record("error_data", record_id)["id"], record_id)
+        self.assertIsNone(reader.get_record("error_data", "unknown"))
+        # Catching up isn't restore progress
+        self.assertEqual(reader.restore_status()["bytes_replayed"], 0)
+
+    def test_pending_records_are_readable_before_they_are_written(self):
+        logger = Logger(self.data_dir, flush_interval=3600, snapshot_interval=3600)
+        self.loggers.append(logger)
+        logger.store_feedback_data("alice", "squat", "Keep your knees out", "Knees caving")
+
+        record_id, = logger.record_index._pending["feedback_data"]
+        self.assertEqual(logger.get_record("feedback_data", record_id)["feedback"], "Keep your knees out")
+
+        logger.flush()
+        self.assertEqual(logger.pending_writes(), 0)
+        self.assertEqual(logger.get_record("feedback_data", record_id)["feedback"], "Keep your knees out")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+Tests of rep segmentation on synthetic landmarks:
+
+    cd project/backend && python -m pytest tests
+"""
+import unittest
+
+import numpy as np
+
+from agents.landmarks import JOINT_PAIRS, Y
+from agents.rep_segmentation import RepSegmenter
+from synthetic import pose_frames, squat_frames, to_sequence
+
+FPS = 30
+
+
+class RepSegmenterTest(unittest.TestCase):
+    def setUp(self):
+        self.segmenter = RepSegmenter()
+
+    def test_counts_squats_and_flags_the_shallow_one(self):
+        sequence = to_sequence(squat_frames([0.2, 0.2, 0.2, 0.12], FPS), FPS)
+        reps = self.segmenter.segment(sequence, "squat")
+
+        self.assertEqual(reps["count"], 4)
+        self.assertEqual(reps["signal"], "height:hips")
+        self.assertEqual([rep["index"] for rep in reps["reps"]], [1, 2, 3, 4])
+        self.assertEqual([rep["partial"] for rep in reps["reps"]], [False, False, False, True])
+
+        for rep in reps["reps"]:
+            self.assertLess(rep["start_frame"], rep["turn_frame"])
+            self.assertLess(rep["turn_frame"], rep["end_frame"])
+            self.assertAlmostEqual(rep["duration"], rep["lowering"] + rep["raising"], delta=0.011)
+
+        # Consecutive reps share their boundary at the standing pause
+        for previous, rep in zip(reps["reps"], reps["reps"][1:]):
+            self.assertEqual(previous["end_frame"], rep["start_frame"])
+
+        self.assertAlmostEqual(reps["reps"][1]["range_of_motion"], 0.2, delta=0.01)
+        self.assertAlmostEqual(reps["reps"][1]["duration"], 2.5, delta=0.1)
+
+    def test_tempo_follows_the_phases(self):
+        frames = squat_frames([0.2] * 3, FPS, rep_seconds=2.0, pause_seconds=0.0, descent_fraction=0.75)
+        reps = self.segmenter.segment(to_sequence(frames, FPS), "squat")
+
+        self.assertEqual(reps["count"], 3)
+        self.assertAlmostEqual(reps["tempo"]["lowering"], 1.5, delta=0.15)
+        self.assertAlmostEqual(reps["tempo"]["raising"], 0.5, delta=0.15)
+
+    def test_missing_detections_dont_split_a_rep(self):
+        frames = squat_frames([0.2, 0.2, 0.2], FPS)
+        # A second without a pose in the middle of the second rep
+        missing = range(90, 120)
+        reps = self.segmenter.segment(to_sequence(frames, FPS, missing), "squat")
+        self.assertEqual(reps["count"], 3)
+
+    def test_noise_smaller_than_a_rep_is_not_a_rep(self):
+        rng = np.random.default_rng(0)
+        frames = pose_frames(10 * FPS)
+        frames[:, JOINT_PAIRS["hips"], Y] += rng.normal(0, 0.005, (len(frames), 1)).astype(np.float32)
+
+        reps = self.segmenter.segment(to_sequence(frames, FPS), "squat")
+        self.assertEqual(reps["count"], 0)
+        self.assertIsNone(reps["range_of_motion"])
+
+    def test_exercise_without_reps(self):
+        sequence = to_sequence(pose_frames(FPS), FPS)
+        self.assertFalse(self.segmenter.supports("plank"))
+        self.assertIsNone(self.segmenter.segment(sequence, "plank"))
+
+
+if __name__ == "__main__":
+    unittest.main()
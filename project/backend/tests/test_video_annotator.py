@@ -0,0 +1,125 @@
+"""
+Tests of annotated video rendering. They need ffmpeg and ffprobe on the PATH:
+
+    cd project/backend && python -m unittest discover -s tests
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from agents.landmarks import LandmarkSequence, NUM_CHANNELS, NUM_LANDMARKS, VISIBILITY
+from agents.video_annotator import VideoAnnotator
+
+FPS = 30
+SECONDS = 4
+
+
+def decode_frames(video_path):
+    capture = cv2.VideoCapture(video_path)
+    frames = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+def standing_pose(frame_count):
+    rng = np.random.default_rng(0)
+    frames = []
+    for frame_index in range(frame_count):
+        landmarks = rng.uniform(0.3, 0.7, (NUM_LANDMARKS, NUM_CHANNELS)).astype(np.float32)
+        landmarks[:, VISIBILITY] = 1.0
+        frames.append((frame_index, landmarks))
+    return LandmarkSequence.from_frames(frames, FPS)
+
+
+@unittest.skipUnless(shutil.which("ffmpeg") and shutil.which("ffprobe"), "needs ffmpeg and ffprobe")
+class SegmentJoinTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="annotator-test-")
+        self.annotator = VideoAnnotator(output_dir=self.work_dir)
+        self.output_path = os.path.join(self.work_dir, "annotated.mp4")
+        # One error, widened to the keyframes at 2 and 3 seconds, so the output
+        # is copied, re-encoded and copied again
+        self.errors = [{"type": "knee_valgus", "description": "Knees caving in",
+                        "start_time": 2.3, "end_time": 2.6}]
+
+    def tearDown(self):
+        self.annotator.shutdown()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def make_source(self, *codec_args):
+        path = os.path.join(self.work_dir, "source.mp4")
+        subprocess.run(
+            ["ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+             "-i", f"testsrc=size=320x240:rate={FPS}:duration={SECONDS}", *codec_args, path],
+            check=True
+        )
+        return path
+
+    def probe(self, video_path, entries):
+        return subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", entries,
+             "-of", "csv=p=0", video_path],
+            capture_output=True, check=True, text=True
+        ).stdout
+
+    def assert_decodes_cleanly(self, video_path):
+        result = subprocess.run(
+            ["ffmpeg", "-v", "error", "-xerror", "-i", video_path, "-map", "0:v:0", "-f", "null", "-"],
+            capture_output=True, text=True
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stderr.strip(), "")
+
+    def test_joined_segments_decode_frame_by_frame(self):
+        source_path = self.make_source("-c:v", "libx264", "-profile:v", "main", "-level", "3.0",
+                                       "-pix_fmt", "yuv420p", "-g", str(FPS), "-video_track_timescale", "15360")
+        self.annotator.annotate(source_path, self.errors, standing_pose(FPS * SECONDS), self.output_path)
+
+        self.assert_decodes_cleanly(self.output_path)
+
+        source_frames = decode_frames(source_path)
+        output_frames = decode_frames(self.output_path)
+        self.assertEqual(len(output_frames), len(source_frames))
+
+        for index, (source_frame, output_frame) in enumerate(zip(source_frames, output_frames)):
+            if index < 2 * FPS or index >= 3 * FPS:
+                # Stream-copied, so bit-identical after decoding
+                self.assertTrue(np.array_equal(source_frame, output_frame), f"frame {index} changed")
+            elif 2.05 * FPS <= index <= 2.85 * FPS:
+                # Within the error, padded by a quarter second
+                self.assertGreater(np.abs(source_frame.astype(int) - output_frame).mean(), 1.0,
+                                   f"frame {index} has no overlay")
+            else:
+                # Re-encoded without an overlay
+                self.assertLess(np.abs(source_frame.astype(int) - output_frame).mean(), 3.0,
+                                f"frame {index} doesn't match the source")
+
+        # Evenly spaced timestamps across both joins
+        times = sorted(float(line.split(",")[0]) for line in self.probe(self.output_path, "packet=pts_time").splitlines()
+                       if line.strip())
+        self.assertEqual(len(times), FPS * SECONDS)
+        np.testing.assert_allclose(np.diff(times), 1 / FPS, atol=1e-3)
+
+        self.assertEqual(self.annotator._probe(self.output_path)["time_base"], "1/15360")
+
+    def test_source_without_matching_encoder_is_reencoded_whole(self):
+        source_path = self.make_source("-c:v", "mpeg4", "-q:v", "2")
+        self.annotator.annotate(source_path, self.errors, standing_pose(FPS * SECONDS), self.output_path)
+
+        self.assert_decodes_cleanly(self.output_path)
+        self.assertEqual(self.annotator._probe(self.output_path)["codec_name"], "h264")
+        self.assertEqual(len(decode_frames(self.output_path)), FPS * SECONDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
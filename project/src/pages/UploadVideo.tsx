@@ -12,6 +12,7 @@ const UploadVideo = () => {
   const [file, setFile] = useState<File | null>(null);
   const [exerciseType, setExerciseType] = useState('squat');
   const [fitnessLevel, setFitnessLevel] = useState('beginner');
+  const [quality, setQuality] = useState('accurate');
   const [isUploading, setIsUploading] = useState(false);
   const [uploadProgress, setUploadProgress] = useState(0);
   const [error, setError] = useState<string | null>(null);
@@ -66,7 +67,7 @@ const UploadVideo = () => {
     
     try {
       // In a real app, you would send the file to your backend API
-      // await api.uploadExerciseVideo(file, exerciseType, fitnessLevel);
+      // await api.uploadExerciseVideo(file, exerciseType, fitnessLevel, quality);
       
       // Mock API call with timeout
       await new Promise((resolve) => setTimeout(resolve, 3000));
@@ -146,6 +147,20 @@ const UploadVideo = () => {
             </select>
           </div>
           
+          <div>
+            <label htmlFor="quality" className="form-label">Analysis Quality</label>
+            <select
+              id="quality"
+              className="form-input"
+              value={quality}
+              onChange={(e) => setQuality(e.target.value)}
+            >
+              <option value="fast">Fast</option>
+              <option value="balanced">Balanced</option>
+              <option value="accurate">Accurate</option>
+            </select>
+          </div>
+          
           <div>
             <span className="form-label">Upload Video</span>
             